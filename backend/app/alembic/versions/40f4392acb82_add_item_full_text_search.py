@@ -0,0 +1,71 @@
+"""Add item full-text search vector and indexes
+
+Revision ID: 40f4392acb82
+Revises: 90184a5c5b26
+Create Date: 2026-10-17 21:28:32.934613
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '40f4392acb82'
+down_revision = '90184a5c5b26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Adding a stored generated column rewrites the table
+    op.add_column(
+        'item',
+        sa.Column(
+            'search_vector',
+            postgresql.TSVECTOR(),
+            sa.Computed(
+                "setweight(to_tsvector('english', title), 'A') || "
+                "setweight(to_tsvector('english', coalesce(description, '')), 'B')",
+                persisted=True,
+            ),
+            nullable=True,
+        ),
+    )
+    # The trigram index of the titles, for prefix and fuzzy matches, needs the
+    # pg_trgm extension, skip it where it isn't available
+    has_trgm = op.get_bind().scalar(
+        sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    )
+    if has_trgm:
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # Build the indexes without locking writes on large item tables
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_item_search_vector',
+            'item',
+            ['search_vector'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_concurrently=True,
+        )
+        if has_trgm:
+            op.create_index(
+                'ix_item_title_trgm',
+                'item',
+                ['title'],
+                unique=False,
+                postgresql_using='gin',
+                postgresql_ops={'title': 'gin_trgm_ops'},
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_item_title_trgm')
+        op.drop_index(
+            'ix_item_search_vector', table_name='item', postgresql_concurrently=True
+        )
+    op.drop_column('item', 'search_vector')
@@ -0,0 +1,36 @@
+"""Add item owner_id, id index for keyset pagination
+
+Revision ID: f54bfaca96d4
+Revises: 1a31ce608336
+Create Date: 2026-10-17 09:12:41.318207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'f54bfaca96d4'
+down_revision = '1a31ce608336'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Build the index without locking writes on large item tables
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_item_owner_id_id',
+            'item',
+            ['owner_id', 'id'],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_item_owner_id_id', table_name='item', postgresql_concurrently=True
+        )
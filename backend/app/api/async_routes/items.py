@@ -0,0 +1,259 @@
+import uuid
+from typing import Any
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlmodel import select
+
+from app import async_crud
+from app.api.conditional import (
+    REVALIDATE,
+    IfMatchDep,
+    conditional,
+    etag_matches,
+    not_modified,
+    version_etag,
+)
+from app.api.deps import (
+    AsyncCurrentUserAuth,
+    AsyncReadEngineDep,
+    AsyncReadSessionDep,
+    AsyncSessionDep,
+)
+from app.api.export import ExportFormat, aiter_export, export_response
+from app.api.pagination import get_next_cursor, paginate
+from app.api.routes.items import (
+    ITEMS_CREATE_OPENAPI,
+    ITEMS_ORDER,
+    ItemIdsQuery,
+    ItemsCreateDep,
+    item_write_error,
+    items_batch,
+    items_etag,
+    owner_scope,
+)
+from app.api.routing import AppRoute
+from app.core.queries import query_budget
+from app.crud import CountMode, search_items_statement
+from app.models import (
+    Item,
+    ItemCreate,
+    ItemPublic,
+    ItemsBatchPublic,
+    ItemsPublic,
+    ItemUpdate,
+    Message,
+)
+
+router = APIRouter(prefix="/items", tags=["items"], route_class=AppRoute)
+
+
+@router.get("/", response_model=ItemsPublic)
+@query_budget(4)
+@conditional(REVALIDATE)
+async def read_items(
+    request: Request,
+    response: Response,
+    session: AsyncReadSessionDep,
+    current_user: AsyncCurrentUserAuth,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    q: str | None = None,
+    count_mode: CountMode = "exact",
+) -> Any:
+    """
+    Retrieve items.
+
+    Pass an empty `cursor` to page with the `next_cursor` of each page instead
+    of `skip`, which stays fast for deep pages.
+
+    `count_mode` "estimated" returns the planner's estimate of all the items to
+    superusers and "none" skips the count.
+
+    `q` searches the words of the title and description of the items, the best
+    matches first, paged with `skip`.
+
+    The lists of normal users are answered with 304 Not Modified while their
+    items are unchanged, without reading them.
+    """
+
+    owner_id = owner_scope(current_user)
+    if owner_id is not None:
+        # Read before the items, a concurrent write can only make the page
+        # newer than its ETag
+        version = await async_crud.get_items_version(session=session, owner_id=owner_id)
+        etag = items_etag(request, owner_id, version)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return not_modified({"ETag": etag})
+        response.headers["ETag"] = etag
+
+    if q:
+        if cursor is not None:
+            raise HTTPException(
+                status_code=400, detail="Searches can't be paged with a cursor"
+            )
+        count = await async_crud.count_search(
+            session=session, q=q, owner_id=owner_id, count_mode=count_mode
+        )
+        statement = search_items_statement(q, owner_id).offset(skip).limit(limit)
+        items = (await session.exec(statement)).all()
+        return ItemsPublic(data=items, count=count, next_cursor=None)
+
+    if current_user.is_superuser:
+        count = await async_crud.count(
+            session=session, model=Item, count_mode=count_mode
+        )
+        statement = select(Item)
+    else:
+        count = await async_crud.count(
+            session=session,
+            model=Item,
+            owner_id=current_user.id,
+            count_mode=count_mode,
+        )
+        statement = select(Item).where(Item.owner_id == current_user.id)
+    statement = paginate(
+        statement, order_by=ITEMS_ORDER, skip=skip, limit=limit, cursor=cursor
+    )
+    items = (await session.exec(statement)).all()
+    next_cursor = get_next_cursor(
+        items, order_by=ITEMS_ORDER, limit=limit, cursor=cursor
+    )
+
+    return ItemsPublic(data=items, count=count, next_cursor=next_cursor)
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_items(
+    engine: AsyncReadEngineDep,
+    current_user: AsyncCurrentUserAuth,
+    format: ExportFormat = "ndjson",
+) -> Any:
+    """
+    Stream all the items, as NDJSON or CSV.
+    """
+    statement = select(Item).order_by(*ITEMS_ORDER)
+    if not current_user.is_superuser:
+        statement = statement.where(Item.owner_id == current_user.id)
+    chunks = aiter_export(engine, statement, model=ItemPublic, format=format)
+    return export_response(chunks, filename="items", format=format)
+
+
+@router.get("/batch", response_model=ItemsBatchPublic)
+@query_budget(3)
+async def read_items_batch(
+    session: AsyncReadSessionDep, current_user: AsyncCurrentUserAuth, ids: ItemIdsQuery
+) -> Any:
+    """
+    Get items by ID, up to ITEMS_BATCH_MAX_SIZE, in one query. The entries are
+    in the order of `ids`, with an error for the items that can't be read.
+    """
+    items = await async_crud.get_items(
+        session=session, ids=ids, owner_id=owner_scope(current_user)
+    )
+    missing = [id for id in ids if id not in items]
+    existing: set[uuid.UUID] = set()
+    if missing:
+        existing = await async_crud.existing_item_ids(session=session, ids=missing)
+    return items_batch(ids, items, existing)
+
+
+@router.get("/{id}", response_model=ItemPublic)
+@query_budget(2)
+@conditional(REVALIDATE)
+async def read_item(
+    response: Response,
+    session: AsyncReadSessionDep,
+    current_user: AsyncCurrentUserAuth,
+    id: uuid.UUID,
+) -> Any:
+    """
+    Get item by ID.
+    """
+    item = await session.get(Item, id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
+    if not current_user.is_superuser and (item.owner_id != current_user.id):
+        raise HTTPException(status_code=400, detail="Not enough permissions")
+    response.headers["ETag"] = version_etag(item.version)
+    return item
+
+
+@router.post("/", response_model=ItemPublic)
+async def create_item(
+    *, session: AsyncSessionDep, current_user: AsyncCurrentUserAuth, item_in: ItemCreate
+) -> Any:
+    """
+    Create new item.
+    """
+    return await async_crud.create_item(
+        session=session, item_in=item_in, owner_id=current_user.id
+    )
+
+
+@router.post(
+    "/bulk", response_model=list[ItemPublic], openapi_extra=ITEMS_CREATE_OPENAPI
+)
+async def create_items(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentUserAuth,
+    items_in: ItemsCreateDep,
+) -> Any:
+    """
+    Create new items from a JSON array or NDJSON body, in one transaction.
+    """
+    return await async_crud.create_items(
+        session=session, items_in=items_in, owner_id=current_user.id
+    )
+
+
+@router.put("/{id}", response_model=ItemPublic)
+async def update_item(
+    *,
+    response: Response,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentUserAuth,
+    id: uuid.UUID,
+    item_in: ItemUpdate,
+    if_match: IfMatchDep,
+) -> Any:
+    """
+    Update an item.
+
+    With `If-Match`, only if the item still has the version of that ETag,
+    otherwise 412 Precondition Failed.
+    """
+    owner_id = owner_scope(current_user)
+    item = await async_crud.update_item(
+        session=session,
+        id=id,
+        owner_id=owner_id,
+        item_in=item_in,
+        versions=if_match,
+    )
+    if not item:
+        if if_match is not None and await async_crud.item_exists(
+            session=session, id=id, owner_id=owner_id
+        ):
+            raise HTTPException(
+                status_code=412, detail="Item version doesn't match If-Match"
+            )
+        raise item_write_error(await async_crud.item_exists(session=session, id=id))
+    response.headers["ETag"] = version_etag(item.version)
+    return item
+
+
+@router.delete("/{id}")
+async def delete_item(
+    session: AsyncSessionDep, current_user: AsyncCurrentUserAuth, id: uuid.UUID
+) -> Message:
+    """
+    Delete an item.
+    """
+    if not await async_crud.delete_item(
+        session=session, id=id, owner_id=owner_scope(current_user)
+    ):
+        raise item_write_error(await async_crud.item_exists(session=session, id=id))
+    return Message(message="Item deleted successfully")
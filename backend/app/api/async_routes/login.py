@@ -0,0 +1,130 @@
+from datetime import timedelta
+from typing import Annotated, Any
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import HTMLResponse
+from fastapi.security import OAuth2PasswordRequestForm
+
+from app import async_crud
+from app.api.deps import (
+    AsyncCurrentUser,
+    AsyncSessionDep,
+    get_current_active_superuser_async,
+)
+from app.api.routing import AppRoute
+from app.core import security
+from app.core.config import settings
+from app.core.security import get_password_hash_async
+from app.models import Message, NewPassword, Token, UserPublic
+from app.utils import (
+    generate_password_reset_token,
+    generate_reset_password_email,
+    verify_password_reset_token,
+)
+
+router = APIRouter(tags=["login"], route_class=AppRoute)
+
+
+@router.post("/login/access-token")
+async def login_access_token(
+    session: AsyncSessionDep,
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+) -> Token:
+    """
+    OAuth2 compatible token login, get an access token for future requests
+    """
+    user = await async_crud.authenticate(
+        session=session, email=form_data.username, password=form_data.password
+    )
+    if not user:
+        raise HTTPException(status_code=400, detail="Incorrect email or password")
+    elif not user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    return Token(
+        access_token=security.create_access_token(
+            user.id, expires_delta=access_token_expires
+        )
+    )
+
+
+@router.post("/login/test-token", response_model=UserPublic)
+async def test_token(current_user: AsyncCurrentUser) -> Any:
+    """
+    Test access token
+    """
+    return current_user
+
+
+@router.post("/password-recovery/{email}")
+async def recover_password(email: str, session: AsyncSessionDep) -> Message:
+    """
+    Password Recovery
+    """
+    user = await async_crud.get_user_by_email(session=session, email=email)
+
+    if not user:
+        raise HTTPException(
+            status_code=404,
+            detail="The user with this email does not exist in the system.",
+        )
+    if not settings.emails_enabled:
+        raise HTTPException(status_code=400, detail="Emails are not enabled")
+    async_crud.add_email(
+        session=session,
+        email_to=user.email,
+        template_name="reset_password",
+        context={"email": email},
+    )
+    await session.commit()
+    return Message(message="Password recovery email sent")
+
+
+@router.post("/reset-password/")
+async def reset_password(session: AsyncSessionDep, body: NewPassword) -> Message:
+    """
+    Reset password
+    """
+    email = verify_password_reset_token(token=body.token)
+    if not email:
+        raise HTTPException(status_code=400, detail="Invalid token")
+    user = await async_crud.get_user_by_email(session=session, email=email)
+    if not user:
+        raise HTTPException(
+            status_code=404,
+            detail="The user with this email does not exist in the system.",
+        )
+    elif not user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    await async_crud.release_connection(session)
+    hashed_password = await get_password_hash_async(body.new_password)
+    user.hashed_password = hashed_password
+    session.add(user)
+    await session.commit()
+    return Message(message="Password updated successfully")
+
+
+@router.post(
+    "/password-recovery-html-content/{email}",
+    dependencies=[Depends(get_current_active_superuser_async)],
+    response_class=HTMLResponse,
+)
+async def recover_password_html_content(email: str, session: AsyncSessionDep) -> Any:
+    """
+    HTML Content for Password Recovery
+    """
+    user = await async_crud.get_user_by_email(session=session, email=email)
+
+    if not user:
+        raise HTTPException(
+            status_code=404,
+            detail="The user with this username does not exist in the system.",
+        )
+    password_reset_token = generate_password_reset_token(email=email)
+    email_data = generate_reset_password_email(
+        email_to=user.email, email=email, token=password_reset_token
+    )
+
+    return HTMLResponse(
+        content=email_data.html_content, headers={"subject:": email_data.subject}
+    )
@@ -0,0 +1,290 @@
+import uuid
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from sqlmodel import select
+
+from app import async_crud
+from app.api.conditional import REVALIDATE, IfMatchDep, conditional, version_etag
+from app.api.deps import (
+    AsyncCurrentUser,
+    AsyncCurrentUserAuth,
+    AsyncReadCurrentUser,
+    AsyncReadEngineDep,
+    AsyncReadSessionDep,
+    AsyncSessionDep,
+    get_current_active_superuser_async,
+)
+from app.api.export import ExportFormat, aiter_export, export_response
+from app.api.pagination import get_next_cursor, paginate
+from app.api.routes.users import USERS_ORDER
+from app.api.routing import AppRoute
+from app.core.auth_cache import user_auth_cache
+from app.core.config import settings
+from app.core.queries import query_budget
+from app.core.security import get_password_hash_async, verify_password_async
+from app.crud import CountMode
+from app.models import (
+    Message,
+    UpdatePassword,
+    User,
+    UserCreate,
+    UserPublic,
+    UserRegister,
+    UsersPublic,
+    UserUpdate,
+    UserUpdateMe,
+)
+
+router = APIRouter(prefix="/users", tags=["users"], route_class=AppRoute)
+
+
+@router.get(
+    "/",
+    dependencies=[Depends(get_current_active_superuser_async)],
+    response_model=UsersPublic,
+)
+@query_budget(3)
+async def read_users(
+    session: AsyncReadSessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    count_mode: CountMode = "exact",
+) -> Any:
+    """
+    Retrieve users.
+
+    Pass an empty `cursor` to page with the `next_cursor` of each page instead
+    of `skip`, which stays fast for deep pages.
+
+    `count_mode` "estimated" returns the planner's estimate of the users and
+    "none" skips the count.
+    """
+
+    count = await async_crud.count(session=session, model=User, count_mode=count_mode)
+
+    statement = paginate(
+        select(User), order_by=USERS_ORDER, skip=skip, limit=limit, cursor=cursor
+    )
+    users = (await session.exec(statement)).all()
+    next_cursor = get_next_cursor(
+        users, order_by=USERS_ORDER, limit=limit, cursor=cursor
+    )
+
+    return UsersPublic(data=users, count=count, next_cursor=next_cursor)
+
+
+@router.get(
+    "/export",
+    dependencies=[Depends(get_current_active_superuser_async)],
+    response_class=StreamingResponse,
+)
+async def export_users(
+    engine: AsyncReadEngineDep, format: ExportFormat = "ndjson"
+) -> Any:
+    """
+    Stream all the users, as NDJSON or CSV.
+    """
+    statement = select(User).order_by(*USERS_ORDER)
+    chunks = aiter_export(engine, statement, model=UserPublic, format=format)
+    return export_response(chunks, filename="users", format=format)
+
+
+@router.post(
+    "/",
+    dependencies=[Depends(get_current_active_superuser_async)],
+    response_model=UserPublic,
+)
+async def create_user(*, session: AsyncSessionDep, user_in: UserCreate) -> Any:
+    """
+    Create new user.
+    """
+    user = await async_crud.get_user_by_email(session=session, email=user_in.email)
+    if user:
+        raise HTTPException(
+            status_code=400,
+            detail="The user with this email already exists in the system.",
+        )
+
+    user = await async_crud.create_user(
+        session=session, user_create=user_in, new_account_email=settings.emails_enabled
+    )
+    return user
+
+
+@router.patch("/me", response_model=UserPublic)
+async def update_user_me(
+    *, session: AsyncSessionDep, user_in: UserUpdateMe, current_user: AsyncCurrentUser
+) -> Any:
+    """
+    Update own user.
+    """
+
+    if user_in.email:
+        existing_user = await async_crud.get_user_by_email(
+            session=session, email=user_in.email
+        )
+        if existing_user and existing_user.id != current_user.id:
+            raise HTTPException(
+                status_code=409, detail="User with this email already exists"
+            )
+    user_data = user_in.model_dump(exclude_unset=True)
+    current_user.sqlmodel_update(user_data)
+    session.add(current_user)
+    user_auth_cache.invalidate(session, str(current_user.id))
+    await session.commit()
+    await async_crud.refresh_after_commit(session, current_user)
+    return current_user
+
+
+@router.patch("/me/password", response_model=Message)
+async def update_password_me(
+    *, session: AsyncSessionDep, body: UpdatePassword, current_user: AsyncCurrentUser
+) -> Any:
+    """
+    Update own password.
+    """
+    await async_crud.release_connection(session)
+    if not await verify_password_async(
+        body.current_password, current_user.hashed_password
+    ):
+        raise HTTPException(status_code=400, detail="Incorrect password")
+    if body.current_password == body.new_password:
+        raise HTTPException(
+            status_code=400, detail="New password cannot be the same as the current one"
+        )
+    hashed_password = await get_password_hash_async(body.new_password)
+    current_user.hashed_password = hashed_password
+    session.add(current_user)
+    user_auth_cache.invalidate(session, str(current_user.id))
+    await session.commit()
+    return Message(message="Password updated successfully")
+
+
+@router.get("/me", response_model=UserPublic)
+@conditional(REVALIDATE)
+async def read_user_me(current_user: AsyncReadCurrentUser, response: Response) -> Any:
+    """
+    Get current user.
+    """
+    response.headers["ETag"] = version_etag(current_user.version)
+    return current_user
+
+
+@router.delete("/me", response_model=Message)
+async def delete_user_me(
+    session: AsyncSessionDep, current_user: AsyncCurrentUser
+) -> Any:
+    """
+    Delete own user.
+    """
+    if current_user.is_superuser:
+        raise HTTPException(
+            status_code=403, detail="Super users are not allowed to delete themselves"
+        )
+    await async_crud.delete_user(session=session, db_user=current_user)
+    return Message(message="User deleted successfully")
+
+
+@router.post("/signup", response_model=UserPublic)
+async def register_user(session: AsyncSessionDep, user_in: UserRegister) -> Any:
+    """
+    Create new user without the need to be logged in.
+    """
+    user = await async_crud.get_user_by_email(session=session, email=user_in.email)
+    if user:
+        raise HTTPException(
+            status_code=400,
+            detail="The user with this email already exists in the system",
+        )
+    user_create = UserCreate.model_validate(user_in)
+    user = await async_crud.create_user(session=session, user_create=user_create)
+    return user
+
+
+@router.get("/{user_id}", response_model=UserPublic)
+@conditional(REVALIDATE)
+async def read_user_by_id(
+    user_id: uuid.UUID,
+    response: Response,
+    session: AsyncReadSessionDep,
+    current_user: AsyncCurrentUserAuth,
+) -> Any:
+    """
+    Get a specific user by id.
+    """
+    user = await session.get(User, user_id)
+    if (not user or user.id != current_user.id) and not current_user.is_superuser:
+        raise HTTPException(
+            status_code=403,
+            detail="The user doesn't have enough privileges",
+        )
+    if user:
+        response.headers["ETag"] = version_etag(user.version)
+    return user
+
+
+@router.patch(
+    "/{user_id}",
+    dependencies=[Depends(get_current_active_superuser_async)],
+    response_model=UserPublic,
+)
+async def update_user(
+    *,
+    response: Response,
+    session: AsyncSessionDep,
+    user_id: uuid.UUID,
+    user_in: UserUpdate,
+    if_match: IfMatchDep,
+) -> Any:
+    """
+    Update a user.
+
+    With `If-Match`, only if the user still has the version of that ETag,
+    otherwise 412 Precondition Failed.
+    """
+
+    db_user = await session.get(User, user_id)
+    if not db_user:
+        raise HTTPException(
+            status_code=404,
+            detail="The user with this id does not exist in the system",
+        )
+    if if_match is not None and db_user.version not in if_match:
+        raise HTTPException(
+            status_code=412, detail="User version doesn't match If-Match"
+        )
+    if user_in.email:
+        existing_user = await async_crud.get_user_by_email(
+            session=session, email=user_in.email
+        )
+        if existing_user and existing_user.id != user_id:
+            raise HTTPException(
+                status_code=409, detail="User with this email already exists"
+            )
+
+    db_user = await async_crud.update_user(
+        session=session, db_user=db_user, user_in=user_in
+    )
+    response.headers["ETag"] = version_etag(db_user.version)
+    return db_user
+
+
+@router.delete("/{user_id}", dependencies=[Depends(get_current_active_superuser_async)])
+async def delete_user(
+    session: AsyncSessionDep, current_user: AsyncCurrentUserAuth, user_id: uuid.UUID
+) -> Message:
+    """
+    Delete a user.
+    """
+    user = await session.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    if user.id == current_user.id:
+        raise HTTPException(
+            status_code=403, detail="Super users are not allowed to delete themselves"
+        )
+    await async_crud.delete_user(session=session, db_user=user)
+    return Message(message="User deleted successfully")
@@ -0,0 +1,109 @@
+import hashlib
+from collections.abc import Callable, Coroutine, Mapping
+from typing import Annotated, Any, TypeVar
+
+from fastapi import Depends, Header, Request, Response
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+Handler = Callable[[Request], Coroutine[Any, Any, Response]]
+
+# Clients may keep the responses, but revalidate them before each use
+REVALIDATE = "private, no-cache"
+
+# Headers of the 200 response that its 304 repeats
+NOT_MODIFIED_HEADERS = ("cache-control", "etag", "vary")
+
+
+def conditional(cache_control: str = REVALIDATE) -> Callable[[F], F]:
+    """
+    Answer the requests whose If-None-Match matches the ETag of the response
+    with 304 Not Modified, and send cache_control. The ETag is the hash of the
+    body unless the endpoint set one. Put it under the route decorator.
+    """
+
+    def decorator(func: F) -> F:
+        func.__cache_control__ = cache_control  # type: ignore[attr-defined]
+        return func
+
+    return decorator
+
+
+def get_cache_control(endpoint: Callable[..., Any]) -> str | None:
+    return getattr(endpoint, "__cache_control__", None)
+
+
+def make_etag(data: bytes | memoryview) -> str:
+    return f'"{hashlib.blake2b(data, digest_size=16).hexdigest()}"'
+
+
+def version_etag(version: int) -> str:
+    """
+    ETag of a row from its version, which If-Match takes back.
+    """
+    return f'"{version}"'
+
+
+def get_if_match(if_match: Annotated[str | None, Header()] = None) -> list[int] | None:
+    """
+    The versions If-Match accepts, None without precondition. Weak ETags are
+    taken too as the compression weakens them, the other ETags match nothing.
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+    versions = []
+    for tag in if_match.split(","):
+        opaque_tag = tag.strip().removeprefix("W/")
+        value = opaque_tag.removeprefix('"').removesuffix('"')
+        if len(value) == len(opaque_tag) - 2 and value.isdigit():
+            versions.append(int(value))
+    return versions
+
+
+IfMatchDep = Annotated[list[int] | None, Depends(get_if_match)]
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Weak comparison, as for If-None-Match, the compressed responses have the
+    weak ETag of their uncompressed body.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = etag.removeprefix("W/")
+    return any(
+        tag.strip().removeprefix("W/") == opaque_tag for tag in if_none_match.split(",")
+    )
+
+
+def not_modified(headers: Mapping[str, str]) -> Response:
+    return Response(
+        status_code=304,
+        headers={
+            name: value
+            for name, value in headers.items()
+            if name.lower() in NOT_MODIFIED_HEADERS
+        },
+    )
+
+
+def conditional_handler(handler: Handler, cache_control: str) -> Handler:
+    async def app(request: Request) -> Response:
+        response = await handler(request)
+        if response.status_code not in (200, 304):
+            return response
+        if "cache-control" not in response.headers:
+            response.headers["Cache-Control"] = cache_control
+        if response.status_code == 304:
+            return response
+        etag = response.headers.get("etag")
+        if etag is None:
+            etag = make_etag(response.body)
+            response.headers["ETag"] = etag
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return not_modified(response.headers)
+        return response
+
+    return app
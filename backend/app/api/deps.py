@@ -1,44 +1,175 @@
-from collections.abc import Generator
-from typing import Annotated
+import math
+import time
+from collections.abc import AsyncGenerator, Generator
+from typing import Annotated, Any, TypeVar
 
 import jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, Response, status
 from fastapi.security import OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
 from pydantic import ValidationError
+from sqlalchemy import Engine, event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import ORMExecuteState
+from sqlalchemy.orm.exc import StaleDataError
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.core import security
+from app.core.auth_cache import user_auth_cache
 from app.core.config import settings
-from app.core.db import engine
-from app.models import TokenPayload, User
+from app.core.db import async_engine, async_replica_engine, engine, replica_engine
+from app.core.timing import timed_call
+from app.models import TokenPayload, User, UserAuth
+
+UserT = TypeVar("UserT", User, UserAuth)
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login/access-token"
 )
 
+# Unix time of the last write of the client, it pins its reads to the primary for
+# READ_YOUR_WRITES_SECONDS so that it doesn't read stale data from a replica. It
+# is also returned in a header, for the clients without cookies to send it back
+LAST_WRITE_COOKIE = "last_write"
+LAST_WRITE_HEADER = "X-Last-Write"
+
+
+@event.listens_for(Session, "after_flush")
+def _record_flush(session: Session, _flush_context: Any) -> None:
+    session.info["has_written"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _record_dml(orm_execute_state: ORMExecuteState) -> None:
+    if (
+        orm_execute_state.is_insert
+        or orm_execute_state.is_update
+        or orm_execute_state.is_delete
+    ):
+        orm_execute_state.session.info["has_written"] = True
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_writes(session: Session) -> None:
+    session.info.pop("has_written", None)
+
+
+@event.listens_for(Session, "after_commit")
+def _pin_client_to_primary(session: Session) -> None:
+    response = session.info.get("response")
+    if session.info.pop("has_written", False) and response is not None:
+        last_write = str(time.time())
+        response.headers[LAST_WRITE_HEADER] = last_write
+        response.set_cookie(
+            LAST_WRITE_COOKIE,
+            last_write,
+            max_age=math.ceil(settings.READ_YOUR_WRITES_SECONDS),
+            httponly=True,
+            samesite="lax",
+        )
+
+
+def is_pinned_to_primary(request: Request) -> bool:
+    for value in (
+        request.headers.get(LAST_WRITE_HEADER),
+        request.cookies.get(LAST_WRITE_COOKIE),
+    ):
+        try:
+            last_write = float(value or "")
+        except ValueError:
+            continue
+        if time.time() - last_write < settings.READ_YOUR_WRITES_SECONDS:
+            return True
+    return False
+
+
+def write_conflict(request: Request) -> HTTPException:
+    """
+    Error of an update whose row was updated by another request since it was
+    read, the ORM checks its version.
+    """
+    if "if-match" in request.headers:
+        return HTTPException(
+            status_code=412, detail="Modified by another request, read it again"
+        )
+    return HTTPException(
+        status_code=409, detail="Modified by another request, try again"
+    )
+
+
+def get_db(request: Request, response: Response) -> Generator[Session, None, None]:
+    # With early release, committing keeps the objects loaded so that the
+    # connection goes back to the pool at the last commit, or release_connection
+    with Session(engine, expire_on_commit=not settings.DB_EARLY_RELEASE) as session:
+        if replica_engine is not None:
+            session.info["response"] = response
+        try:
+            yield session
+        except StaleDataError:
+            raise write_conflict(request)
+
+
+def get_read_engine(request: Request) -> Engine:
+    if replica_engine is not None and not is_pinned_to_primary(request):
+        return replica_engine
+    return engine
+
+
+def get_async_read_engine(request: Request) -> AsyncEngine:
+    if async_replica_engine is not None and not is_pinned_to_primary(request):
+        return async_replica_engine
+    return async_engine
+
+
+def get_read_db(request: Request) -> Generator[Session, None, None]:
+    with Session(get_read_engine(request)) as session:
+        yield session
+
+
+async def get_async_db(
+    request: Request, response: Response
+) -> AsyncGenerator[AsyncSession, None]:
+    # Attributes can't be lazily reloaded without awaiting, keep them loaded
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        if async_replica_engine is not None:
+            session.info["response"] = response
+        try:
+            yield session
+        except StaleDataError:
+            raise write_conflict(request)
+
 
-def get_db() -> Generator[Session, None, None]:
-    with Session(engine) as session:
+async def get_async_read_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSession(
+        get_async_read_engine(request), expire_on_commit=False
+    ) as session:
         yield session
 
 
 SessionDep = Annotated[Session, Depends(get_db)]
+ReadSessionDep = Annotated[Session, Depends(get_read_db)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_db)]
+AsyncReadSessionDep = Annotated[AsyncSession, Depends(get_async_read_db)]
+ReadEngineDep = Annotated[Engine, Depends(get_read_engine)]
+AsyncReadEngineDep = Annotated[AsyncEngine, Depends(get_async_read_engine)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
-def get_current_user(session: SessionDep, token: TokenDep) -> User:
+def get_token_payload(token: str) -> TokenPayload:
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
         )
-        token_data = TokenPayload(**payload)
+        return TokenPayload(**payload)
     except (InvalidTokenError, ValidationError):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user = session.get(User, token_data.sub)
+
+
+def check_user(user: UserT | None) -> UserT:
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if not user.is_active:
@@ -46,12 +177,87 @@ def get_current_user(session: SessionDep, token: TokenDep) -> User:
     return user
 
 
+@timed_call("auth")
+def get_current_user(session: SessionDep, token: TokenDep) -> User:
+    token_data = get_token_payload(token)
+    return check_user(session.get(User, token_data.sub))
+
+
+@timed_call("auth")
+def get_current_read_user(session: ReadSessionDep, token: TokenDep) -> User:
+    token_data = get_token_payload(token)
+    return check_user(session.get(User, token_data.sub))
+
+
+@timed_call("auth")
+def get_current_user_auth(session: SessionDep, token: TokenDep) -> UserAuth:
+    """
+    Authorization fields of the current user, from user_auth_cache. The session
+    only connects on a cache miss, to the primary so that a stale replica can't
+    refill the cache after an invalidation.
+    """
+    token_data = get_token_payload(token)
+    user_auth = user_auth_cache.get(str(token_data.sub))
+    if user_auth is None:
+        user = session.get(User, token_data.sub)
+        if user:
+            user_auth = UserAuth.model_validate(user)
+            user_auth_cache.set(str(user.id), user_auth)
+    return check_user(user_auth)
+
+
+@timed_call("auth")
+async def get_current_user_async(session: AsyncSessionDep, token: TokenDep) -> User:
+    token_data = get_token_payload(token)
+    return check_user(await session.get(User, token_data.sub))
+
+
+@timed_call("auth")
+async def get_current_read_user_async(
+    session: AsyncReadSessionDep, token: TokenDep
+) -> User:
+    token_data = get_token_payload(token)
+    return check_user(await session.get(User, token_data.sub))
+
+
+@timed_call("auth")
+async def get_current_user_auth_async(
+    session: AsyncSessionDep, token: TokenDep
+) -> UserAuth:
+    token_data = get_token_payload(token)
+    user_auth = user_auth_cache.get(str(token_data.sub))
+    if user_auth is None:
+        user = await session.get(User, token_data.sub)
+        if user:
+            user_auth = UserAuth.model_validate(user)
+            user_auth_cache.set(str(user.id), user_auth)
+    return check_user(user_auth)
+
+
+# The user of the read-only routes is loaded by their read session, so that it
+# can be compared with the other objects it loads. Routes that only authorize
+# the user take the cached CurrentUserAuth instead.
 CurrentUser = Annotated[User, Depends(get_current_user)]
+ReadCurrentUser = Annotated[User, Depends(get_current_read_user)]
+CurrentUserAuth = Annotated[UserAuth, Depends(get_current_user_auth)]
+AsyncCurrentUser = Annotated[User, Depends(get_current_user_async)]
+AsyncReadCurrentUser = Annotated[User, Depends(get_current_read_user_async)]
+AsyncCurrentUserAuth = Annotated[UserAuth, Depends(get_current_user_auth_async)]
 
 
-def get_current_active_superuser(current_user: CurrentUser) -> User:
-    if not current_user.is_superuser:
+def check_superuser(user: UserAuth) -> UserAuth:
+    if not user.is_superuser:
         raise HTTPException(
             status_code=403, detail="The user doesn't have enough privileges"
         )
-    return current_user
+    return user
+
+
+def get_current_active_superuser(current_user: CurrentUserAuth) -> UserAuth:
+    return check_superuser(current_user)
+
+
+async def get_current_active_superuser_async(
+    current_user: AsyncCurrentUserAuth,
+) -> UserAuth:
+    return check_superuser(current_user)
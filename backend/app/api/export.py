@@ -0,0 +1,109 @@
+import csv
+import io
+from collections.abc import AsyncGenerator, AsyncIterator, Generator, Sequence
+from typing import Any, Literal
+
+import anyio
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import Session, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import SelectOfScalar
+from starlette.concurrency import run_in_threadpool
+
+ExportFormat = Literal["ndjson", "csv"]
+
+MEDIA_TYPES: dict[ExportFormat, str] = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# Rows fetched from the server-side cursor, and written, at a time
+EXPORT_BATCH_SIZE = 1000
+
+
+def serialize(
+    rows: Sequence[Any],
+    *,
+    model: type[SQLModel],
+    format: ExportFormat,
+    header: bool = False,
+) -> str:
+    records = [model.model_validate(row) for row in rows]
+    if format == "ndjson":
+        return "".join(f"{record.model_dump_json()}\n" for record in records)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(model.model_fields))
+    if header:
+        writer.writeheader()
+    writer.writerows(record.model_dump(mode="json") for record in records)
+    return buffer.getvalue()
+
+
+def iter_export(
+    engine: Engine,
+    statement: SelectOfScalar[Any],
+    *,
+    model: type[SQLModel],
+    format: ExportFormat,
+) -> Generator[str, None, None]:
+    with Session(engine) as session:
+        result = session.exec(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        header = True
+        for rows in result.partitions():
+            yield serialize(rows, model=model, format=format, header=header)
+            header = False
+        if header and format == "csv":
+            yield serialize([], model=model, format=format, header=header)
+
+
+async def iter_in_threadpool(
+    chunks: Generator[str, None, None],
+) -> AsyncGenerator[str, None]:
+    """
+    Pull the chunks of a blocking generator in the threadpool, closing it, and
+    so its session, even when the client disconnects.
+    """
+    try:
+        while (chunk := await run_in_threadpool(next, chunks, None)) is not None:
+            yield chunk
+    finally:
+        with anyio.CancelScope(shield=True):
+            await run_in_threadpool(chunks.close)
+
+
+async def aiter_export(
+    engine: AsyncEngine,
+    statement: SelectOfScalar[Any],
+    *,
+    model: type[SQLModel],
+    format: ExportFormat,
+) -> AsyncGenerator[str, None]:
+    session = AsyncSession(engine)
+    try:
+        result = await session.stream_scalars(
+            statement.execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        header = True
+        async for rows in result.partitions():
+            yield serialize(rows, model=model, format=format, header=header)
+            header = False
+        if header and format == "csv":
+            yield serialize([], model=model, format=format, header=header)
+    finally:
+        with anyio.CancelScope(shield=True):
+            await session.close()
+
+
+def export_response(
+    chunks: AsyncIterator[str],
+    *,
+    filename: str,
+    format: ExportFormat,
+) -> StreamingResponse:
+    return StreamingResponse(
+        chunks,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{format}"'},
+    )
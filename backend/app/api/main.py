@@ -1,14 +1,49 @@
 from fastapi import APIRouter
+from fastapi.routing import APIRoute
 
+from app.api.async_routes import items as async_items
+from app.api.async_routes import login as async_login
+from app.api.async_routes import users as async_users
 from app.api.routes import items, login, private, users, utils
 from app.core.config import settings
 
-api_router = APIRouter()
-api_router.include_router(login.router)
-api_router.include_router(users.router)
-api_router.include_router(utils.router)
-api_router.include_router(items.router)
 
+def with_overrides(router: APIRouter, overrides: APIRouter) -> APIRouter:
+    """
+    Replace the routes of router by the routes of overrides with the same path
+    and methods. The order of router is kept, so that static paths declared
+    before path parameters still match first.
+    """
+    replacements = {
+        (route.path, frozenset(route.methods)): route
+        for route in overrides.routes
+        if isinstance(route, APIRoute)
+    }
+    merged = APIRouter()
+    for route in router.routes:
+        if isinstance(route, APIRoute):
+            route = replacements.pop((route.path, frozenset(route.methods)), route)
+        merged.routes.append(route)
+    merged.routes.extend(replacements.values())
+    return merged
 
-if settings.ENVIRONMENT == "local":
-    api_router.include_router(private.router)
+
+def create_api_router(database_stack: str) -> APIRouter:
+    login_router, users_router, items_router = login.router, users.router, items.router
+    if database_stack == "async":
+        login_router = with_overrides(login.router, async_login.router)
+        users_router = with_overrides(users.router, async_users.router)
+        items_router = with_overrides(items.router, async_items.router)
+
+    api_router = APIRouter()
+    api_router.include_router(login_router)
+    api_router.include_router(users_router)
+    api_router.include_router(utils.router)
+    api_router.include_router(items_router)
+
+    if settings.ENVIRONMENT == "local":
+        api_router.include_router(private.router)
+    return api_router
+
+
+api_router = create_api_router(settings.DATABASE_STACK)
@@ -0,0 +1,80 @@
+import base64
+import json
+from collections.abc import Sequence
+from typing import Any, TypeVar, cast
+
+from fastapi import HTTPException
+from sqlalchemy import TypeDecorator, tuple_
+from sqlalchemy.orm import InstrumentedAttribute, Mapped
+from sqlmodel.sql.expression import SelectOfScalar
+
+T = TypeVar("T")
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    payload = json.dumps([str(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def _python_type(column: InstrumentedAttribute[Any]) -> Any:
+    column_type = column.type
+    if isinstance(column_type, TypeDecorator):
+        column_type = column_type.impl_instance
+    return column_type.python_type
+
+
+def decode_cursor(cursor: str, columns: Sequence[Mapped[Any]]) -> list[Any]:
+    attributes = [cast(InstrumentedAttribute[Any], column) for column in columns]
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        # encode_cursor writes every value as a string
+        if (
+            not isinstance(values, list)
+            or len(values) != len(columns)
+            or not all(isinstance(value, str) for value in values)
+        ):
+            raise ValueError(cursor)
+        return [
+            _python_type(attribute)(value)
+            for attribute, value in zip(attributes, values, strict=True)
+        ]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def paginate(
+    statement: SelectOfScalar[T],
+    *,
+    order_by: Sequence[Mapped[Any]],
+    skip: int,
+    limit: int,
+    cursor: str | None,
+) -> SelectOfScalar[T]:
+    """
+    Order the statement by the unique order_by columns and select a page of it.
+
+    With a cursor, the page starts after the row the cursor was created from
+    (keyset pagination), an empty cursor selects the first page. Otherwise it
+    starts after skip rows.
+    """
+    statement = statement.order_by(*order_by)
+    if cursor is None:
+        return statement.offset(skip).limit(limit)
+    if cursor:
+        values = decode_cursor(cursor, order_by)
+        statement = statement.where(tuple_(*order_by) > tuple_(*values))
+    return statement.limit(limit)
+
+
+def get_next_cursor(
+    rows: Sequence[Any],
+    *,
+    order_by: Sequence[Mapped[Any]],
+    limit: int,
+    cursor: str | None,
+) -> str | None:
+    if cursor is None or not rows or len(rows) < limit:
+        return None
+    last = rows[-1]
+    attributes = [cast(InstrumentedAttribute[Any], column) for column in order_by]
+    return encode_cursor([getattr(last, attribute.key) for attribute in attributes])
@@ -0,0 +1,33 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any
+
+import orjson
+from fastapi.responses import ORJSONResponse
+from pydantic import TypeAdapter
+
+
+@dataclass(frozen=True)
+class RenderedJSON:
+    """
+    Response content already serialized to JSON.
+    """
+
+    body: bytes
+
+
+class FastJSONResponse(ORJSONResponse):
+    """
+    Renders the content with orjson, or as is when it was already serialized
+    by the route.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, RenderedJSON):
+            return content.body
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+@lru_cache
+def get_serializer(response_model: Any) -> TypeAdapter[Any]:
+    return TypeAdapter(response_model)
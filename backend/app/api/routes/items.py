@@ -1,48 +1,263 @@
 import uuid
-from typing import Any
+from typing import Annotated, Any
 
-from fastapi import APIRouter, HTTPException
-from sqlmodel import func, select
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter, ValidationError
+from sqlmodel import col, select
 
-from app.api.deps import CurrentUser, SessionDep
-from app.models import Item, ItemCreate, ItemPublic, ItemsPublic, ItemUpdate, Message
+from app import crud
+from app.api.conditional import (
+    REVALIDATE,
+    IfMatchDep,
+    conditional,
+    etag_matches,
+    make_etag,
+    not_modified,
+    version_etag,
+)
+from app.api.deps import (
+    CurrentUserAuth,
+    ReadEngineDep,
+    ReadSessionDep,
+    SessionDep,
+)
+from app.api.export import (
+    ExportFormat,
+    export_response,
+    iter_export,
+    iter_in_threadpool,
+)
+from app.api.pagination import get_next_cursor, paginate
+from app.api.routing import AppRoute
+from app.core.config import settings
+from app.core.queries import query_budget
+from app.models import (
+    Item,
+    ItemCreate,
+    ItemPublic,
+    ItemsBatchEntry,
+    ItemsBatchPublic,
+    ItemsPublic,
+    ItemUpdate,
+    Message,
+    UserAuth,
+)
 
-router = APIRouter(prefix="/items", tags=["items"])
+router = APIRouter(prefix="/items", tags=["items"], route_class=AppRoute)
+
+# Keyset of the items, matches the ix_item_owner_id_id index
+ITEMS_ORDER = (col(Item.owner_id), col(Item.id))
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+items_create_adapter = TypeAdapter(list[ItemCreate])
+
+ITEMS_CREATE_OPENAPI: dict[str, Any] = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            media_type: {
+                "schema": {
+                    "type": "array",
+                    "items": {"$ref": "#/components/schemas/ItemCreate"},
+                }
+            }
+            for media_type in ("application/json", NDJSON_MEDIA_TYPE)
+        },
+    }
+}
+
+
+async def get_items_in(request: Request) -> list[ItemCreate]:
+    """
+    Validate a JSON array or NDJSON body of items in one pass.
+    """
+    body = await request.body()
+    if request.headers.get("content-type", "").startswith(NDJSON_MEDIA_TYPE):
+        lines = [line for line in body.splitlines() if line.strip()]
+        body = b"[" + b",".join(lines) + b"]"
+    try:
+        items_in = items_create_adapter.validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+    if len(items_in) > settings.ITEMS_BULK_MAX_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many items, the limit is {settings.ITEMS_BULK_MAX_SIZE}",
+        )
+    return items_in
+
+
+ItemsCreateDep = Annotated[list[ItemCreate], Depends(get_items_in)]
+
+
+def owner_scope(user: UserAuth) -> uuid.UUID | None:
+    """
+    Owner of the items user can write, None for superusers who can write all.
+    """
+    return None if user.is_superuser else user.id
+
+
+def items_etag(request: Request, owner_id: uuid.UUID, version: int) -> str:
+    """
+    ETag of the item lists of owner_id, from their ItemChange version, so that
+    an unchanged list is answered without reading the items.
+    """
+    return make_etag(f"{owner_id}:{version}:{request.url.query}".encode())
+
+
+def item_write_error(exists: bool) -> HTTPException:
+    """
+    Error of a write that matched no item, whether it doesn't exist or belongs
+    to someone else.
+    """
+    if not exists:
+        return HTTPException(status_code=404, detail="Item not found")
+    return HTTPException(status_code=400, detail="Not enough permissions")
+
+
+ItemIdsQuery = Annotated[
+    list[uuid.UUID], Query(max_length=settings.ITEMS_BATCH_MAX_SIZE)
+]
+
+
+def items_batch(
+    ids: list[uuid.UUID], items: dict[uuid.UUID, Item], existing: set[uuid.UUID]
+) -> ItemsBatchPublic:
+    """
+    Entries in the order of ids, with the same errors as GET /items/{id} for
+    the ids not in items: not found, or not enough permissions if it exists.
+    """
+    entries = []
+    for id in ids:
+        if id in items:
+            entry = ItemsBatchEntry(id=id, item=ItemPublic.model_validate(items[id]))
+        elif id in existing:
+            entry = ItemsBatchEntry(id=id, error="Not enough permissions")
+        else:
+            entry = ItemsBatchEntry(id=id, error="Item not found")
+        entries.append(entry)
+    return ItemsBatchPublic(data=entries)
 
 
 @router.get("/", response_model=ItemsPublic)
+@query_budget(4)
+@conditional(REVALIDATE)
 def read_items(
-    session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+    request: Request,
+    response: Response,
+    session: ReadSessionDep,
+    current_user: CurrentUserAuth,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    q: str | None = None,
+    count_mode: crud.CountMode = "exact",
 ) -> Any:
     """
     Retrieve items.
+
+    Pass an empty `cursor` to page with the `next_cursor` of each page instead
+    of `skip`, which stays fast for deep pages.
+
+    `count_mode` "estimated" returns the planner's estimate of all the items to
+    superusers and "none" skips the count.
+
+    `q` searches the words of the title and description of the items, the best
+    matches first, paged with `skip`.
+
+    The lists of normal users are answered with 304 Not Modified while their
+    items are unchanged, without reading them.
     """
 
-    if current_user.is_superuser:
-        count_statement = select(func.count()).select_from(Item)
-        count = session.exec(count_statement).one()
-        statement = select(Item).offset(skip).limit(limit)
+    owner_id = owner_scope(current_user)
+    if owner_id is not None:
+        # Read before the items, a concurrent write can only make the page
+        # newer than its ETag
+        version = crud.get_items_version(session=session, owner_id=owner_id)
+        etag = items_etag(request, owner_id, version)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return not_modified({"ETag": etag})
+        response.headers["ETag"] = etag
+
+    if q:
+        if cursor is not None:
+            raise HTTPException(
+                status_code=400, detail="Searches can't be paged with a cursor"
+            )
+        count = crud.count_search(
+            session=session, q=q, owner_id=owner_id, count_mode=count_mode
+        )
+        statement = crud.search_items_statement(q, owner_id).offset(skip).limit(limit)
         items = session.exec(statement).all()
+        return ItemsPublic(data=items, count=count, next_cursor=None)
+
+    if current_user.is_superuser:
+        count = crud.count(session=session, model=Item, count_mode=count_mode)
+        statement = select(Item)
     else:
-        count_statement = (
-            select(func.count())
-            .select_from(Item)
-            .where(Item.owner_id == current_user.id)
-        )
-        count = session.exec(count_statement).one()
-        statement = (
-            select(Item)
-            .where(Item.owner_id == current_user.id)
-            .offset(skip)
-            .limit(limit)
+        count = crud.count(
+            session=session,
+            model=Item,
+            owner_id=current_user.id,
+            count_mode=count_mode,
         )
-        items = session.exec(statement).all()
+        statement = select(Item).where(Item.owner_id == current_user.id)
+    statement = paginate(
+        statement, order_by=ITEMS_ORDER, skip=skip, limit=limit, cursor=cursor
+    )
+    items = session.exec(statement).all()
+    next_cursor = get_next_cursor(
+        items, order_by=ITEMS_ORDER, limit=limit, cursor=cursor
+    )
 
-    return ItemsPublic(data=items, count=count)
+    return ItemsPublic(data=items, count=count, next_cursor=next_cursor)
+
+
+@router.get("/export", response_class=StreamingResponse)
+def export_items(
+    engine: ReadEngineDep,
+    current_user: CurrentUserAuth,
+    format: ExportFormat = "ndjson",
+) -> Any:
+    """
+    Stream all the items, as NDJSON or CSV.
+    """
+    statement = select(Item).order_by(*ITEMS_ORDER)
+    if not current_user.is_superuser:
+        statement = statement.where(Item.owner_id == current_user.id)
+    chunks = iter_export(engine, statement, model=ItemPublic, format=format)
+    return export_response(iter_in_threadpool(chunks), filename="items", format=format)
+
+
+@router.get("/batch", response_model=ItemsBatchPublic)
+@query_budget(3)
+def read_items_batch(
+    session: ReadSessionDep, current_user: CurrentUserAuth, ids: ItemIdsQuery
+) -> Any:
+    """
+    Get items by ID, up to ITEMS_BATCH_MAX_SIZE, in one query. The entries are
+    in the order of `ids`, with an error for the items that can't be read.
+    """
+    items = crud.get_items(session=session, ids=ids, owner_id=owner_scope(current_user))
+    missing = [id for id in ids if id not in items]
+    existing: set[uuid.UUID] = set()
+    if missing:
+        existing = crud.existing_item_ids(session=session, ids=missing)
+    return items_batch(ids, items, existing)
 
 
 @router.get("/{id}", response_model=ItemPublic)
-def read_item(session: SessionDep, current_user: CurrentUser, id: uuid.UUID) -> Any:
+@query_budget(2)
+@conditional(REVALIDATE)
+def read_item(
+    response: Response,
+    session: ReadSessionDep,
+    current_user: CurrentUserAuth,
+    id: uuid.UUID,
+) -> Any:
     """
     Get item by ID.
     """
@@ -51,59 +266,77 @@ def read_item(session: SessionDep, current_user: CurrentUser, id: uuid.UUID) ->
         raise HTTPException(status_code=404, detail="Item not found")
     if not current_user.is_superuser and (item.owner_id != current_user.id):
         raise HTTPException(status_code=400, detail="Not enough permissions")
+    response.headers["ETag"] = version_etag(item.version)
     return item
 
 
 @router.post("/", response_model=ItemPublic)
 def create_item(
-    *, session: SessionDep, current_user: CurrentUser, item_in: ItemCreate
+    *, session: SessionDep, current_user: CurrentUserAuth, item_in: ItemCreate
 ) -> Any:
     """
     Create new item.
     """
-    item = Item.model_validate(item_in, update={"owner_id": current_user.id})
-    session.add(item)
-    session.commit()
-    session.refresh(item)
-    return item
+    return crud.create_item(session=session, item_in=item_in, owner_id=current_user.id)
+
+
+@router.post(
+    "/bulk", response_model=list[ItemPublic], openapi_extra=ITEMS_CREATE_OPENAPI
+)
+def create_items(
+    *, session: SessionDep, current_user: CurrentUserAuth, items_in: ItemsCreateDep
+) -> Any:
+    """
+    Create new items from a JSON array or NDJSON body, in one transaction.
+    """
+    return crud.create_items(
+        session=session, items_in=items_in, owner_id=current_user.id
+    )
 
 
 @router.put("/{id}", response_model=ItemPublic)
 def update_item(
     *,
+    response: Response,
     session: SessionDep,
-    current_user: CurrentUser,
+    current_user: CurrentUserAuth,
     id: uuid.UUID,
     item_in: ItemUpdate,
+    if_match: IfMatchDep,
 ) -> Any:
     """
     Update an item.
+
+    With `If-Match`, only if the item still has the version of that ETag,
+    otherwise 412 Precondition Failed.
     """
-    item = session.get(Item, id)
+    owner_id = owner_scope(current_user)
+    item = crud.update_item(
+        session=session,
+        id=id,
+        owner_id=owner_id,
+        item_in=item_in,
+        versions=if_match,
+    )
     if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
-    if not current_user.is_superuser and (item.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
-    update_dict = item_in.model_dump(exclude_unset=True)
-    item.sqlmodel_update(update_dict)
-    session.add(item)
-    session.commit()
-    session.refresh(item)
+        if if_match is not None and crud.item_exists(
+            session=session, id=id, owner_id=owner_id
+        ):
+            raise HTTPException(
+                status_code=412, detail="Item version doesn't match If-Match"
+            )
+        raise item_write_error(crud.item_exists(session=session, id=id))
+    response.headers["ETag"] = version_etag(item.version)
     return item
 
 
 @router.delete("/{id}")
 def delete_item(
-    session: SessionDep, current_user: CurrentUser, id: uuid.UUID
+    session: SessionDep, current_user: CurrentUserAuth, id: uuid.UUID
 ) -> Message:
     """
     Delete an item.
     """
-    item = session.get(Item, id)
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
-    if not current_user.is_superuser and (item.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
-    session.delete(item)
-    session.commit()
+    if not crud.delete_item(session=session, id=id, owner_id=owner_scope(current_user)):
+        raise item_write_error(crud.item_exists(session=session, id=id))
     return Message(message="Item deleted successfully")
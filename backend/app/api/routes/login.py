@@ -7,6 +7,7 @@ from fastapi.security import OAuth2PasswordRequestForm
 
 from app import crud
 from app.api.deps import CurrentUser, SessionDep, get_current_active_superuser
+from app.api.routing import AppRoute
 from app.core import security
 from app.core.config import settings
 from app.core.security import get_password_hash
@@ -14,11 +15,10 @@ from app.models import Message, NewPassword, Token, UserPublic
 from app.utils import (
     generate_password_reset_token,
     generate_reset_password_email,
-    send_email,
     verify_password_reset_token,
 )
 
-router = APIRouter(tags=["login"])
+router = APIRouter(tags=["login"], route_class=AppRoute)
 
 
 @router.post("/login/access-token")
@@ -63,15 +63,15 @@ def recover_password(email: str, session: SessionDep) -> Message:
             status_code=404,
             detail="The user with this email does not exist in the system.",
         )
-    password_reset_token = generate_password_reset_token(email=email)
-    email_data = generate_reset_password_email(
-        email_to=user.email, email=email, token=password_reset_token
-    )
-    send_email(
+    if not settings.emails_enabled:
+        raise HTTPException(status_code=400, detail="Emails are not enabled")
+    crud.add_email(
+        session=session,
         email_to=user.email,
-        subject=email_data.subject,
-        html_content=email_data.html_content,
+        template_name="reset_password",
+        context={"email": email},
     )
+    session.commit()
     return Message(message="Password recovery email sent")
 
 
@@ -91,6 +91,7 @@ def reset_password(session: SessionDep, body: NewPassword) -> Message:
         )
     elif not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
+    crud.release_connection(session)
     hashed_password = get_password_hash(password=body.new_password)
     user.hashed_password = hashed_password
     session.add(user)
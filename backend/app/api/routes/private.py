@@ -4,13 +4,14 @@ from fastapi import APIRouter
 from pydantic import BaseModel
 
 from app.api.deps import SessionDep
+from app.api.routing import AppRoute
 from app.core.security import get_password_hash
 from app.models import (
     User,
     UserPublic,
 )
 
-router = APIRouter(tags=["private"], prefix="/private")
+router = APIRouter(tags=["private"], prefix="/private", route_class=AppRoute)
 
 
 class PrivateUserCreate(BaseModel):
@@ -1,19 +1,34 @@
 import uuid
 from typing import Any
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import col, delete, func, select
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from sqlmodel import col, select
 
 from app import crud
+from app.api.conditional import REVALIDATE, IfMatchDep, conditional, version_etag
 from app.api.deps import (
     CurrentUser,
+    CurrentUserAuth,
+    ReadCurrentUser,
+    ReadEngineDep,
+    ReadSessionDep,
     SessionDep,
     get_current_active_superuser,
 )
+from app.api.export import (
+    ExportFormat,
+    export_response,
+    iter_export,
+    iter_in_threadpool,
+)
+from app.api.pagination import get_next_cursor, paginate
+from app.api.routing import AppRoute
+from app.core.auth_cache import user_auth_cache
 from app.core.config import settings
+from app.core.queries import query_budget
 from app.core.security import get_password_hash, verify_password
 from app.models import (
-    Item,
     Message,
     UpdatePassword,
     User,
@@ -24,9 +39,11 @@ from app.models import (
     UserUpdate,
     UserUpdateMe,
 )
-from app.utils import generate_new_account_email, send_email
 
-router = APIRouter(prefix="/users", tags=["users"])
+router = APIRouter(prefix="/users", tags=["users"], route_class=AppRoute)
+
+# Keyset of the users, email is unique and indexed
+USERS_ORDER = (col(User.email), col(User.id))
 
 
 @router.get(
@@ -34,18 +51,49 @@ router = APIRouter(prefix="/users", tags=["users"])
     dependencies=[Depends(get_current_active_superuser)],
     response_model=UsersPublic,
 )
-def read_users(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+@query_budget(3)
+def read_users(
+    session: ReadSessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    count_mode: crud.CountMode = "exact",
+) -> Any:
     """
     Retrieve users.
+
+    Pass an empty `cursor` to page with the `next_cursor` of each page instead
+    of `skip`, which stays fast for deep pages.
+
+    `count_mode` "estimated" returns the planner's estimate of the users and
+    "none" skips the count.
     """
 
-    count_statement = select(func.count()).select_from(User)
-    count = session.exec(count_statement).one()
+    count = crud.count(session=session, model=User, count_mode=count_mode)
 
-    statement = select(User).offset(skip).limit(limit)
+    statement = paginate(
+        select(User), order_by=USERS_ORDER, skip=skip, limit=limit, cursor=cursor
+    )
     users = session.exec(statement).all()
+    next_cursor = get_next_cursor(
+        users, order_by=USERS_ORDER, limit=limit, cursor=cursor
+    )
+
+    return UsersPublic(data=users, count=count, next_cursor=next_cursor)
 
-    return UsersPublic(data=users, count=count)
+
+@router.get(
+    "/export",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_class=StreamingResponse,
+)
+def export_users(engine: ReadEngineDep, format: ExportFormat = "ndjson") -> Any:
+    """
+    Stream all the users, as NDJSON or CSV.
+    """
+    statement = select(User).order_by(*USERS_ORDER)
+    chunks = iter_export(engine, statement, model=UserPublic, format=format)
+    return export_response(iter_in_threadpool(chunks), filename="users", format=format)
 
 
 @router.post(
@@ -62,16 +110,9 @@ def create_user(*, session: SessionDep, user_in: UserCreate) -> Any:
             detail="The user with this email already exists in the system.",
         )
 
-    user = crud.create_user(session=session, user_create=user_in)
-    if settings.emails_enabled and user_in.email:
-        email_data = generate_new_account_email(
-            email_to=user_in.email, username=user_in.email, password=user_in.password
-        )
-        send_email(
-            email_to=user_in.email,
-            subject=email_data.subject,
-            html_content=email_data.html_content,
-        )
+    user = crud.create_user(
+        session=session, user_create=user_in, new_account_email=settings.emails_enabled
+    )
     return user
 
 
@@ -92,8 +133,9 @@ def update_user_me(
     user_data = user_in.model_dump(exclude_unset=True)
     current_user.sqlmodel_update(user_data)
     session.add(current_user)
+    user_auth_cache.invalidate(session, str(current_user.id))
     session.commit()
-    session.refresh(current_user)
+    crud.refresh_after_commit(session, current_user)
     return current_user
 
 
@@ -104,6 +146,7 @@ def update_password_me(
     """
     Update own password.
     """
+    crud.release_connection(session)
     if not verify_password(body.current_password, current_user.hashed_password):
         raise HTTPException(status_code=400, detail="Incorrect password")
     if body.current_password == body.new_password:
@@ -113,15 +156,18 @@ def update_password_me(
     hashed_password = get_password_hash(body.new_password)
     current_user.hashed_password = hashed_password
     session.add(current_user)
+    user_auth_cache.invalidate(session, str(current_user.id))
     session.commit()
     return Message(message="Password updated successfully")
 
 
 @router.get("/me", response_model=UserPublic)
-def read_user_me(current_user: CurrentUser) -> Any:
+@conditional(REVALIDATE)
+def read_user_me(current_user: ReadCurrentUser, response: Response) -> Any:
     """
     Get current user.
     """
+    response.headers["ETag"] = version_etag(current_user.version)
     return current_user
 
 
@@ -134,8 +180,7 @@ def delete_user_me(session: SessionDep, current_user: CurrentUser) -> Any:
         raise HTTPException(
             status_code=403, detail="Super users are not allowed to delete themselves"
         )
-    session.delete(current_user)
-    session.commit()
+    crud.delete_user(session=session, db_user=current_user)
     return Message(message="User deleted successfully")
 
 
@@ -156,20 +201,24 @@ def register_user(session: SessionDep, user_in: UserRegister) -> Any:
 
 
 @router.get("/{user_id}", response_model=UserPublic)
+@conditional(REVALIDATE)
 def read_user_by_id(
-    user_id: uuid.UUID, session: SessionDep, current_user: CurrentUser
+    user_id: uuid.UUID,
+    response: Response,
+    session: ReadSessionDep,
+    current_user: CurrentUserAuth,
 ) -> Any:
     """
     Get a specific user by id.
     """
     user = session.get(User, user_id)
-    if user == current_user:
-        return user
-    if not current_user.is_superuser:
+    if (not user or user.id != current_user.id) and not current_user.is_superuser:
         raise HTTPException(
             status_code=403,
             detail="The user doesn't have enough privileges",
         )
+    if user:
+        response.headers["ETag"] = version_etag(user.version)
     return user
 
 
@@ -180,12 +229,17 @@ def read_user_by_id(
 )
 def update_user(
     *,
+    response: Response,
     session: SessionDep,
     user_id: uuid.UUID,
     user_in: UserUpdate,
+    if_match: IfMatchDep,
 ) -> Any:
     """
     Update a user.
+
+    With `If-Match`, only if the user still has the version of that ETag,
+    otherwise 412 Precondition Failed.
     """
 
     db_user = session.get(User, user_id)
@@ -194,6 +248,10 @@ def update_user(
             status_code=404,
             detail="The user with this id does not exist in the system",
         )
+    if if_match is not None and db_user.version not in if_match:
+        raise HTTPException(
+            status_code=412, detail="User version doesn't match If-Match"
+        )
     if user_in.email:
         existing_user = crud.get_user_by_email(session=session, email=user_in.email)
         if existing_user and existing_user.id != user_id:
@@ -202,12 +260,13 @@ def update_user(
             )
 
     db_user = crud.update_user(session=session, db_user=db_user, user_in=user_in)
+    response.headers["ETag"] = version_etag(db_user.version)
     return db_user
 
 
 @router.delete("/{user_id}", dependencies=[Depends(get_current_active_superuser)])
 def delete_user(
-    session: SessionDep, current_user: CurrentUser, user_id: uuid.UUID
+    session: SessionDep, current_user: CurrentUserAuth, user_id: uuid.UUID
 ) -> Message:
     """
     Delete a user.
@@ -215,12 +274,9 @@ def delete_user(
     user = session.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    if user == current_user:
+    if user.id == current_user.id:
         raise HTTPException(
             status_code=403, detail="Super users are not allowed to delete themselves"
         )
-    statement = delete(Item).where(col(Item.owner_id) == user_id)
-    session.exec(statement)  # type: ignore
-    session.delete(user)
-    session.commit()
+    crud.delete_user(session=session, db_user=user)
     return Message(message="User deleted successfully")
@@ -1,11 +1,20 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic.networks import EmailStr
 
-from app.api.deps import get_current_active_superuser
-from app.models import Message
-from app.utils import generate_test_email, send_email
+from app import crud
+from app.api.deps import SessionDep, get_current_active_superuser
+from app.api.routing import AppRoute
+from app.core import db
+from app.core.config import settings
+from app.models import (
+    ConnectionCheckoutPublic,
+    ConnectionCheckoutsPublic,
+    Message,
+    SlowQueriesPublic,
+    SlowQueryPublic,
+)
 
-router = APIRouter(prefix="/utils", tags=["utils"])
+router = APIRouter(prefix="/utils", tags=["utils"], route_class=AppRoute)
 
 
 @router.post(
@@ -13,19 +22,73 @@ router = APIRouter(prefix="/utils", tags=["utils"])
     dependencies=[Depends(get_current_active_superuser)],
     status_code=201,
 )
-def test_email(email_to: EmailStr) -> Message:
+def test_email(session: SessionDep, email_to: EmailStr) -> Message:
     """
     Test emails.
     """
-    email_data = generate_test_email(email_to=email_to)
-    send_email(
-        email_to=email_to,
-        subject=email_data.subject,
-        html_content=email_data.html_content,
-    )
+    if not settings.emails_enabled:
+        raise HTTPException(status_code=400, detail="Emails are not enabled")
+    crud.add_email(session=session, email_to=email_to, template_name="test_email")
+    session.commit()
     return Message(message="Test email sent")
 
 
+@router.get(
+    "/db-leaks/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=ConnectionCheckoutsPublic,
+)
+def read_db_leaks() -> ConnectionCheckoutsPublic:
+    """
+    Database connections held longer than the leak threshold or after their
+    response finished, with the request and stack of their checkout.
+    """
+    if db.leak_detector is None:
+        raise HTTPException(status_code=404, detail="Leak detection is disabled")
+    data = [
+        ConnectionCheckoutPublic(
+            request_method=checkout.request_method,
+            request_path=checkout.request_path,
+            thread=checkout.thread,
+            checked_out_at=checkout.checked_out_at,
+            held_seconds=checkout.held_seconds,
+            checked_in=checkout.checked_in is not None,
+            leaked=checkout.leaked,
+            stack=checkout.stack,
+        )
+        for checkout in db.leak_detector.offenders()
+    ]
+    return ConnectionCheckoutsPublic(data=data, count=len(data))
+
+
+@router.get(
+    "/slow-queries/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=SlowQueriesPublic,
+)
+def read_slow_queries() -> SlowQueriesPublic:
+    """
+    Most recent statements slower than the slow query threshold, with their
+    request, caller and sampled plan.
+    """
+    if db.slow_query_log is None:
+        raise HTTPException(status_code=404, detail="Slow query log is disabled")
+    data = [
+        SlowQueryPublic(
+            statement=query.statement,
+            parameters=query.parameters,
+            duration_ms=query.duration_ms,
+            request_method=query.request_method,
+            request_path=query.request_path,
+            caller=query.caller,
+            logged_at=query.logged_at,
+            plan=query.plan,
+        )
+        for query in db.slow_query_log.queries()
+    ]
+    return SlowQueriesPublic(data=data, count=len(data))
+
+
 @router.get("/health-check/")
 async def health_check() -> bool:
     return True
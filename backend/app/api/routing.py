@@ -0,0 +1,107 @@
+from collections.abc import Callable, Coroutine
+from dataclasses import dataclass
+from typing import Any, cast
+
+from fastapi import Request, Response
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.routing import APIRoute
+from pydantic import TypeAdapter
+
+from app.api.conditional import conditional_handler, get_cache_control
+from app.api.responses import FastJSONResponse, RenderedJSON, get_serializer
+from app.core.config import settings
+from app.core.queries import (
+    QueryLog,
+    check_query_log,
+    current_query_log,
+    get_query_budget,
+)
+from app.core.timing import timed, timed_call
+
+
+@dataclass
+class ResponseField:
+    """
+    Response field timing the validation and serialization of the route's
+    field. With a serializer, the value is dumped straight to JSON bytes.
+    """
+
+    field: Any
+    serializer: TypeAdapter[Any] | None = None
+
+    def validate(self, *args: Any, **kwargs: Any) -> Any:
+        with timed("serialize"):
+            return self.field.validate(*args, **kwargs)
+
+    def serialize(self, value: Any, **kwargs: Any) -> Any:
+        with timed("serialize"):
+            if self.serializer is None:
+                return self.field.serialize(value, **kwargs)
+            return RenderedJSON(self.serializer.dump_json(value, by_alias=True))
+
+
+class AppRoute(APIRoute):
+    """
+    Route timing its endpoint and its serialization for the Server-Timing
+    header, and checking its queries against its budget unless
+    QUERY_BUDGET_MODE is off. Endpoints declared conditional answer 304 Not
+    Modified when the ETag of the response matches If-None-Match.
+
+    When its response class is FastJSONResponse, the response model is dumped
+    by pydantic-core to JSON bytes in a single pass, skipping the intermediate
+    dict, unless the route has include/exclude response options.
+    """
+
+    def _fast_json(self) -> bool:
+        response_class = self.response_class
+        if isinstance(response_class, DefaultPlaceholder):
+            response_class = response_class.value
+        return (
+            issubclass(response_class, FastJSONResponse)
+            and self.response_model_include is None
+            and self.response_model_exclude is None
+            and not self.response_model_exclude_unset
+            and not self.response_model_exclude_defaults
+            and not self.response_model_exclude_none
+        )
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        # functools.wraps keeps the signature of the endpoint, that FastAPI
+        # reads its parameters from, and the attributes set by its decorators
+        super().__init__(path, timed_call("handler")(endpoint), **kwargs)
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        field = self.secure_cloned_response_field
+        if field is not None and not isinstance(field, ResponseField):
+            serializer = None
+            if self._fast_json():
+                serializer = get_serializer(self.response_model)
+            self.secure_cloned_response_field = cast(
+                Any, ResponseField(field, serializer)
+            )
+        handler = super().get_route_handler()
+        cache_control = get_cache_control(self.endpoint)
+        if cache_control is not None:
+            handler = conditional_handler(handler, cache_control)
+        if settings.QUERY_BUDGET_MODE == "off":
+            return handler
+        budget = get_query_budget(self.endpoint) or settings.QUERY_BUDGET_DEFAULT
+        route = f"{', '.join(sorted(self.methods))} {self.path}"
+
+        async def app(request: Request) -> Response:
+            query_log = QueryLog()
+            token = current_query_log.set(query_log)
+            try:
+                response = await handler(request)
+            finally:
+                current_query_log.reset(token)
+            check_query_log(
+                query_log,
+                route=route,
+                budget=budget,
+                repeat_threshold=settings.QUERY_BUDGET_REPEAT_THRESHOLD,
+                raise_errors=settings.QUERY_BUDGET_MODE == "raise",
+            )
+            return response
+
+        return app
@@ -0,0 +1,302 @@
+import uuid
+from typing import Any, cast
+
+import psycopg
+from sqlalchemy import Executable, exists, insert, update
+from sqlmodel import col, delete, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.auth_cache import user_auth_cache
+from app.core.config import settings
+from app.core.security import get_password_hash_async, verify_password_async
+from app.crud import (
+    ESTIMATED_COUNT,
+    CountMode,
+    any_item_id,
+    count_cache,
+    count_statement,
+    invalidate_item_counts,
+    invalidate_user_counts,
+    item_columns,
+    item_copy_statement,
+    item_search,
+    item_table,
+    items_version_statement,
+    owned_item,
+    touch_items,
+)
+from app.models import (
+    Item,
+    ItemCreate,
+    ItemUpdate,
+    OutboxEmail,
+    User,
+    UserCreate,
+    UserUpdate,
+)
+
+# Async counterparts of app.crud, used by the routes of the async stack.
+# bcrypt is CPU bound, the event loop awaits it from the password hashing pool.
+
+
+async def release_connection(session: AsyncSession) -> None:
+    if (
+        session.sync_session.expire_on_commit
+        or session.new
+        or session.dirty
+        or session.deleted
+    ):
+        return
+    if session.in_transaction():
+        await session.commit()
+
+
+async def refresh_after_commit(session: AsyncSession, db_obj: Any) -> None:
+    if session.sync_session.expire_on_commit:
+        await session.refresh(db_obj)
+
+
+def add_email(
+    *,
+    session: AsyncSession,
+    email_to: str,
+    template_name: str,
+    context: dict[str, Any] | None = None,
+) -> OutboxEmail:
+    db_email = OutboxEmail(
+        email_to=email_to,
+        template_name=template_name,
+        context=context or {},
+    )
+    session.add(db_email)
+    return db_email
+
+
+async def create_user(
+    *,
+    session: AsyncSession,
+    user_create: UserCreate,
+    new_account_email: bool = False,
+) -> User:
+    await release_connection(session)
+    hashed_password = await get_password_hash_async(user_create.password)
+    db_obj = User.model_validate(
+        user_create, update={"hashed_password": hashed_password}
+    )
+    session.add(db_obj)
+    if new_account_email:
+        add_email(
+            session=session,
+            email_to=db_obj.email,
+            template_name="new_account",
+            context={"username": db_obj.email},
+        )
+    await session.commit()
+    await refresh_after_commit(session, db_obj)
+    invalidate_user_counts()
+    return db_obj
+
+
+async def update_user(
+    *, session: AsyncSession, db_user: User, user_in: UserUpdate
+) -> Any:
+    user_data = user_in.model_dump(exclude_unset=True)
+    extra_data = {}
+    if "password" in user_data:
+        await release_connection(session)
+        password = user_data["password"]
+        hashed_password = await get_password_hash_async(password)
+        extra_data["hashed_password"] = hashed_password
+    db_user.sqlmodel_update(user_data, update=extra_data)
+    session.add(db_user)
+    user_auth_cache.invalidate(session, str(db_user.id))
+    await session.commit()
+    await refresh_after_commit(session, db_user)
+    return db_user
+
+
+async def get_user_by_email(*, session: AsyncSession, email: str) -> User | None:
+    statement = select(User).where(User.email == email)
+    session_user = (await session.exec(statement)).first()
+    return session_user
+
+
+async def authenticate(
+    *, session: AsyncSession, email: str, password: str
+) -> User | None:
+    db_user = await get_user_by_email(session=session, email=email)
+    if not db_user:
+        return None
+    await release_connection(session)
+    if not await verify_password_async(password, db_user.hashed_password):
+        return None
+    return db_user
+
+
+async def create_item(
+    *, session: AsyncSession, item_in: ItemCreate, owner_id: uuid.UUID
+) -> Item:
+    db_item = Item.model_validate(item_in, update={"owner_id": owner_id})
+    statement = (
+        insert(item_table)
+        .values(db_item.model_dump())
+        .returning(*item_columns)
+        .add_cte(touch_items(owner_id).cte("touched"))
+    )
+    row = (await session.exec(statement)).mappings().one()  # type: ignore
+    await session.commit()
+    invalidate_item_counts(owner_id)
+    return Item.model_validate(dict(row))
+
+
+async def get_items_version(*, session: AsyncSession, owner_id: uuid.UUID) -> int:
+    return (await session.exec(items_version_statement(owner_id))).one()
+
+
+async def item_exists(
+    *, session: AsyncSession, id: uuid.UUID, owner_id: uuid.UUID | None = None
+) -> bool:
+    statement = select(exists().where(owned_item(id, owner_id)))
+    return bool(await session.scalar(statement))
+
+
+async def get_items(
+    *, session: AsyncSession, ids: list[uuid.UUID], owner_id: uuid.UUID | None
+) -> dict[uuid.UUID, Item]:
+    statement = select(Item).where(any_item_id(ids))
+    if owner_id is not None:
+        statement = statement.where(col(Item.owner_id) == owner_id)
+    return {item.id: item for item in await session.exec(statement)}
+
+
+async def existing_item_ids(
+    *, session: AsyncSession, ids: list[uuid.UUID]
+) -> set[uuid.UUID]:
+    return set(await session.exec(select(Item.id).where(any_item_id(ids))))
+
+
+async def update_item(
+    *,
+    session: AsyncSession,
+    id: uuid.UUID,
+    owner_id: uuid.UUID | None,
+    item_in: ItemUpdate,
+    versions: list[int] | None = None,
+) -> Item | None:
+    values = item_in.model_dump(exclude_unset=True)
+    condition = owned_item(id, owner_id)
+    if versions is not None:
+        condition &= item_table.c.version.in_(versions)
+    statement: Executable
+    if values:
+        statement = (
+            update(item_table)
+            .where(condition)
+            .values({**values, "version": item_table.c.version + 1})
+            .returning(*item_columns)
+            .add_cte(touch_items(condition).cte("touched"))
+        )
+    else:
+        statement = select(*item_columns).where(condition)
+    row = (await session.exec(statement)).mappings().first()  # type: ignore
+    await session.commit()
+    return Item.model_validate(dict(row)) if row else None
+
+
+async def create_items(
+    *, session: AsyncSession, items_in: list[ItemCreate], owner_id: uuid.UUID
+) -> list[Item]:
+    db_items = [
+        Item.model_validate(item_in, update={"owner_id": owner_id})
+        for item_in in items_in
+    ]
+    rows = [db_item.model_dump() for db_item in db_items]
+    connection = await session.connection()
+    if len(rows) >= settings.ITEMS_BULK_COPY_THRESHOLD:
+        raw_connection = await connection.get_raw_connection()
+        driver_connection = cast(
+            psycopg.AsyncConnection[Any], raw_connection.driver_connection
+        )
+        async with driver_connection.cursor() as cursor:
+            async with cursor.copy(item_copy_statement()) as copy:
+                for row in rows:
+                    await copy.write_row(list(row.values()))
+        await connection.execute(touch_items(owner_id))
+    elif rows:
+        statement = (
+            insert(item_table)
+            .values(rows)
+            .returning(*item_columns)
+            .add_cte(touch_items(owner_id).cte("touched"))
+        )
+        result = await connection.execute(statement)
+        db_items = [Item.model_validate(dict(row)) for row in result.mappings()]
+    # Written on the connection, out of sight of the ORM events that pin the
+    # client to the primary after its writes
+    session.info["has_written"] = True
+    await session.commit()
+    invalidate_item_counts(owner_id)
+    return db_items
+
+
+async def delete_item(
+    *, session: AsyncSession, id: uuid.UUID, owner_id: uuid.UUID | None
+) -> bool:
+    statement = (
+        delete(item_table)
+        .where(owned_item(id, owner_id))
+        .returning(item_table.c.owner_id)
+        .add_cte(touch_items(owned_item(id, owner_id)).cte("touched"))
+    )
+    deleted_owner_id = (await session.exec(statement)).scalar()  # type: ignore
+    await session.commit()
+    if deleted_owner_id is None:
+        return False
+    invalidate_item_counts(deleted_owner_id)
+    return True
+
+
+async def delete_user(*, session: AsyncSession, db_user: User) -> None:
+    statement = delete(Item).where(col(Item.owner_id) == db_user.id)
+    await session.exec(statement)  # type: ignore
+    await session.delete(db_user)
+    user_auth_cache.invalidate(session, str(db_user.id))
+    await session.commit()
+    invalidate_user_counts()
+    invalidate_item_counts(db_user.id)
+
+
+async def count(
+    *,
+    session: AsyncSession,
+    model: type[Item] | type[User],
+    owner_id: uuid.UUID | None = None,
+    count_mode: CountMode = "exact",
+) -> int | None:
+    if count_mode == "none":
+        return None
+    table_name = str(model.__tablename__)
+    if count_mode == "estimated" and owner_id is None:
+        estimate = await session.scalar(ESTIMATED_COUNT, {"table": f'"{table_name}"'})
+        if estimate is not None and estimate >= 0:
+            return int(estimate)
+    key = (table_name, owner_id)
+    cached = count_cache.get(key)
+    if cached is not None:
+        return cached
+    exact = (await session.exec(count_statement(model, owner_id))).one()
+    count_cache.set(key, exact)
+    return exact
+
+
+async def count_search(
+    *,
+    session: AsyncSession,
+    q: str,
+    owner_id: uuid.UUID | None,
+    count_mode: CountMode = "exact",
+) -> int | None:
+    if count_mode == "none":
+        return None
+    match, _ = item_search(q)
+    return (await session.exec(count_statement(Item, owner_id).where(match))).one()
@@ -0,0 +1,104 @@
+"""
+Compare the default and the fast JSON responses on a page of 100 items, run it
+with `python -m app.benchmark_serialization`.
+
+The items are built in memory and the app is called directly as an ASGI app, so
+that only the response handling is measured.
+"""
+
+import logging
+import time
+import uuid
+from typing import Any
+
+import anyio
+from fastapi import APIRouter, FastAPI
+from fastapi.responses import JSONResponse
+from starlette.types import Message
+
+from app.api.responses import FastJSONResponse
+from app.api.routing import AppRoute
+from app.models import Item, ItemsPublic
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 100
+REQUESTS = 2000
+
+
+def create_app(response_class: type[JSONResponse]) -> FastAPI:
+    owner_id = uuid.uuid4()
+    items = [
+        Item(
+            id=uuid.uuid4(),
+            title=f"Item {i}",
+            description="Lorem ipsum dolor sit amet, consectetur adipiscing elit",
+            owner_id=owner_id,
+        )
+        for i in range(PAGE_SIZE)
+    ]
+    router = APIRouter(route_class=AppRoute)
+
+    @router.get("/items/", response_model=ItemsPublic)
+    async def read_items() -> Any:
+        return ItemsPublic(data=items, count=PAGE_SIZE)
+
+    app = FastAPI(default_response_class=response_class)
+    app.include_router(router)
+    return app
+
+
+async def measure(app: FastAPI) -> tuple[float, bytes]:
+    """
+    Seconds per GET /items/ request and the body of the last response.
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/items/",
+        "raw_path": b"/items/",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [],
+        "server": ("testserver", 80),
+        "client": ("testclient", 50000),
+    }
+    body = b""
+
+    async def receive() -> Message:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: Message) -> None:
+        nonlocal body
+        if message["type"] == "http.response.body":
+            body = message["body"]
+
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(REQUESTS):
+            await app(scope, receive, send)
+        best = min(best, (time.perf_counter() - start) / REQUESTS)
+    return best, body
+
+
+def main() -> None:
+    results = {}
+    bodies = []
+    for name, response_class in [
+        ("default", JSONResponse),
+        ("fast", FastJSONResponse),
+    ]:
+        results[name], body = anyio.run(measure, create_app(response_class))
+        bodies.append(body)
+        logger.info("%s: %.0f µs per request", name, results[name] * 1e6)
+    logger.info("speedup: %.2fx", results["default"] / results["fast"])
+    assert len(bodies[0]) == len(bodies[1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+from sqlalchemy import make_url
+
+from app.core.cache import (
+    CoherentCache,
+    InvalidationChannel,
+    LocalInvalidationChannel,
+    PostgresInvalidationChannel,
+)
+from app.core.config import settings
+from app.models import UserAuth
+
+
+def get_invalidation_channel() -> InvalidationChannel:
+    if settings.AUTH_CACHE_INVALIDATION == "postgres":
+        url = make_url(str(settings.SQLALCHEMY_DATABASE_URI))
+        conninfo = url.set(drivername="postgresql").render_as_string(
+            hide_password=False
+        )
+        return PostgresInvalidationChannel(conninfo, "user_auth")
+    return LocalInvalidationChannel()
+
+
+# The authorization fields of the users, by id
+user_auth_cache: CoherentCache[UserAuth] = CoherentCache(
+    ttl=settings.AUTH_CACHE_TTL_SECONDS,
+    maxsize=settings.AUTH_CACHE_MAX_SIZE,
+    channel=get_invalidation_channel(),
+)
@@ -0,0 +1,206 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Generic, Protocol, TypeVar
+
+import psycopg
+from psycopg import sql
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """
+    Thread-safe in-process cache. Entries expire ttl seconds after they are set
+    and the least recently used ones are evicted beyond maxsize entries.
+    """
+
+    def __init__(self, *, ttl: float, maxsize: int) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: K, value: V) -> None:
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: K) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# Called with the invalidated key, or None when every key may be stale
+Subscriber = Callable[[str | None], None]
+
+
+def on_commit(session: Session | AsyncSession, callback: Callable[[], None]) -> None:
+    """
+    Call callback once the transaction of session is committed.
+    """
+    if isinstance(session, AsyncSession):
+        session = session.sync_session
+    event.listen(session, "after_commit", lambda _: callback(), once=True)
+
+
+class InvalidationChannel(Protocol):
+    def publish(self, session: Session | AsyncSession, key: str) -> None:
+        """
+        Publish the invalidation of key once the transaction of session is
+        committed.
+        """
+        ...
+
+    def subscribe(self, callback: Subscriber) -> None: ...
+
+
+class LocalInvalidationChannel:
+    """
+    Delivers the invalidations to the subscribers of this process only.
+    """
+
+    def __init__(self) -> None:
+        self._subscribers: list[Subscriber] = []
+
+    def publish(self, session: Session | AsyncSession, key: str) -> None:
+        on_commit(session, lambda: self._deliver(key))
+
+    def _deliver(self, key: str) -> None:
+        for callback in self._subscribers:
+            callback(key)
+
+    def subscribe(self, callback: Subscriber) -> None:
+        self._subscribers.append(callback)
+
+
+class PostgresInvalidationChannel:
+    """
+    Delivers the invalidations to the subscribers of every worker with NOTIFY.
+
+    The NOTIFY is sent in the transaction of the write, before it commits, so
+    that it needs no connection of its own and is only delivered on commit.
+    Each process LISTENs on a dedicated connection in a daemon thread, and
+    subscribers are told every key may be stale whenever it (re)connects, as
+    notifications sent meanwhile are lost.
+    """
+
+    def __init__(
+        self, conninfo: str, channel: str, *, reconnect_delay: float = 1.0
+    ) -> None:
+        self.conninfo = conninfo
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self._subscribers: list[Subscriber] = []
+        self._lock = threading.Lock()
+        self._listener: threading.Thread | None = None
+
+    def publish(self, session: Session | AsyncSession, key: str) -> None:
+        if isinstance(session, AsyncSession):
+            session = session.sync_session
+
+        # Before the commit, an async session runs its events where it can
+        # execute without awaiting
+        def notify(session: Session) -> None:
+            session.execute(
+                text("SELECT pg_notify(:channel, :key)"),
+                {"channel": self.channel, "key": key},
+            )
+
+        event.listen(session, "before_commit", notify, once=True)
+
+    def subscribe(self, callback: Subscriber) -> None:
+        with self._lock:
+            self._subscribers.append(callback)
+            if self._listener is None:
+                self._listener = threading.Thread(
+                    target=self._listen, name=f"listen-{self.channel}", daemon=True
+                )
+                self._listener.start()
+
+    def _deliver(self, key: str | None) -> None:
+        for callback in list(self._subscribers):
+            callback(key)
+
+    def _listen(self) -> None:
+        listen = sql.SQL("LISTEN {}").format(sql.Identifier(self.channel))
+        while True:
+            try:
+                with psycopg.connect(self.conninfo, autocommit=True) as connection:
+                    connection.execute(listen)
+                    self._deliver(None)
+                    for notify in connection.notifies():
+                        self._deliver(notify.payload)
+            except psycopg.Error:
+                logger.warning(
+                    "Lost the %s invalidation channel, reconnecting",
+                    self.channel,
+                    exc_info=True,
+                )
+            time.sleep(self.reconnect_delay)
+
+
+class CoherentCache(Generic[V]):
+    """
+    TTLCache whose invalidations are published on a channel, so that they also
+    evict the key from the caches of the other workers. Keys are invalidated
+    with the session of the write, before its commit, and evicted once it is
+    committed, so that no cache miss refills them with the old row meanwhile.
+    """
+
+    def __init__(
+        self, *, ttl: float, maxsize: int, channel: InvalidationChannel
+    ) -> None:
+        self._cache: TTLCache[str, V] = TTLCache(ttl=ttl, maxsize=maxsize)
+        self.channel = channel
+        channel.subscribe(self._evict)
+
+    def get(self, key: str) -> V | None:
+        return self._cache.get(key)
+
+    def set(self, key: str, value: V) -> None:
+        self._cache.set(key, value)
+
+    def invalidate(self, session: Session | AsyncSession, key: str) -> None:
+        self.channel.publish(session, key)
+        on_commit(session, lambda: self._cache.delete(key))
+
+    def clear(self) -> None:
+        """
+        Evict every key from the cache of this worker only.
+        """
+        self._cache.clear()
+
+    def _evict(self, key: str | None) -> None:
+        if key is None:
+            self._cache.clear()
+        else:
+            self._cache.delete(key)
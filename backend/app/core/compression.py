@@ -0,0 +1,240 @@
+import zlib
+from collections.abc import Callable, Sequence
+from typing import Any, Protocol
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli  # type: ignore[import-not-found]
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard  # type: ignore[import-not-found]
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+class Compressor(Protocol):
+    def compress(self, data: bytes) -> bytes: ...
+
+    def flush(self) -> bytes:
+        """
+        Output everything compressed so far, for the client to decode it.
+        """
+        ...
+
+    def finish(self) -> bytes: ...
+
+
+class GzipCompressor:
+    def __init__(self, level: int) -> None:
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor:
+    def __init__(self, level: int) -> None:
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return bytes(self._compressor.process(data))
+
+    def flush(self) -> bytes:
+        return bytes(self._compressor.flush())
+
+    def finish(self) -> bytes:
+        return bytes(self._compressor.finish())
+
+
+class ZstdCompressor:
+    def __init__(self, level: int) -> None:
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return bytes(self._compressor.compress(data))
+
+    def flush(self) -> bytes:
+        return bytes(self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK))
+
+    def finish(self) -> bytes:
+        return bytes(self._compressor.flush())
+
+
+COMPRESSORS: dict[str, Callable[[int], Compressor]] = {"gzip": GzipCompressor}
+if brotli is not None:
+    COMPRESSORS["br"] = BrotliCompressor
+if zstandard is not None:
+    COMPRESSORS["zstd"] = ZstdCompressor
+
+COMPRESSIBLE_TYPES = (
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return (
+        media_type.startswith("text/")
+        or media_type.endswith("json")
+        or media_type in COMPRESSIBLE_TYPES
+    )
+
+
+def negotiate_encoding(accept_encoding: str, encodings: Sequence[str]) -> str | None:
+    """
+    The first of encodings, in the server's order of preference, that the
+    Accept-Encoding header allows, if any.
+    """
+    weights: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, *params = [p.strip() for p in part.split(";")]
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.lower()] = weight
+    for encoding in encodings:
+        if weights.get(encoding, weights.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def disable_compression(request: Request) -> None:
+    """
+    Dependency sending the responses of a route uncompressed.
+    """
+    request.state.compress = False
+
+
+class CompressionMiddleware:
+    """
+    Compress the responses with the preferred encoding the client accepts.
+
+    Responses smaller than minimum_size are sent as is. Streaming responses are
+    compressed chunk by chunk, each chunk is flushed so that the client can
+    decode it right away.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        encodings: Sequence[str],
+        levels: dict[str, int],
+        minimum_size: int,
+    ) -> None:
+        self.app = app
+        self.encodings = [e for e in encodings if e in COMPRESSORS]
+        self.levels = levels
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        encoding = negotiate_encoding(
+            headers.get("accept-encoding", ""), self.encodings
+        )
+        responder = CompressionResponder(self, scope, send, encoding)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressionResponder:
+    def __init__(
+        self,
+        middleware: CompressionMiddleware,
+        scope: Scope,
+        send: Send,
+        encoding: str | None,
+    ) -> None:
+        self.middleware = middleware
+        self.scope = scope
+        self._send = send
+        self.encoding = encoding
+        self.start_message: Message | None = None
+        self.compressor: Compressor | None = None
+        # Passing the messages through unchanged
+        self.passthrough = False
+
+    def _should_compress(self, headers: MutableHeaders) -> bool:
+        state: dict[str, Any] = self.scope.get("state", {})
+        return (
+            state.get("compress", True)
+            and "content-encoding" not in headers
+            and is_compressible(headers.get("content-type", ""))
+        )
+
+    async def send(self, message: Message) -> None:
+        if self.passthrough:
+            await self._send(message)
+            return
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body" or self.start_message is None:
+            await self._send(message)
+            return
+
+        start_message = self.start_message
+        headers = MutableHeaders(raw=start_message["headers"])
+        body: bytes = message.get("body", b"")
+        more_body: bool = message.get("more_body", False)
+        if self.compressor is None:
+            compressible = self._should_compress(headers)
+            if compressible:
+                headers.add_vary_header("Accept-Encoding")
+            if (
+                not compressible
+                or self.encoding is None
+                or (
+                    not more_body
+                    and (not body or len(body) < self.middleware.minimum_size)
+                )
+            ):
+                self.passthrough = True
+                await self._send(start_message)
+                await self._send(message)
+                return
+            level = self.middleware.levels[self.encoding]
+            self.compressor = COMPRESSORS[self.encoding](level)
+            headers["Content-Encoding"] = self.encoding
+            # A strong ETag names the uncompressed bytes, the compressed body is
+            # only equivalent to them
+            etag = headers.get("etag")
+            if etag is not None and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+            if more_body:
+                del headers["Content-Length"]
+                body = self.compressor.compress(body) + self.compressor.flush()
+            else:
+                body = self.compressor.compress(body) + self.compressor.finish()
+                headers["Content-Length"] = str(len(body))
+            await self._send(start_message)
+            await self._send({**message, "body": body})
+            return
+
+        if more_body:
+            body = self.compressor.compress(body) + self.compressor.flush()
+        else:
+            body = self.compressor.compress(body) + self.compressor.finish()
+        await self._send({**message, "body": body})
@@ -68,6 +68,126 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         )
 
+    # Read replica used by the read-only routes, disabled when not set. It uses
+    # the same credentials and database name as the primary.
+    POSTGRES_REPLICA_SERVER: str | None = None
+    POSTGRES_REPLICA_PORT: int | None = None
+    # Clients are pinned to the primary for this long after they write
+    READ_YOUR_WRITES_SECONDS: float = 5.0
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def SQLALCHEMY_REPLICA_DATABASE_URI(self) -> PostgresDsn | None:
+        if not self.POSTGRES_REPLICA_SERVER:
+            return None
+        return PostgresDsn.build(
+            scheme="postgresql+psycopg",
+            username=self.POSTGRES_USER,
+            password=self.POSTGRES_PASSWORD,
+            host=self.POSTGRES_REPLICA_SERVER,
+            port=self.POSTGRES_REPLICA_PORT or self.POSTGRES_PORT,
+            path=self.POSTGRES_DB,
+        )
+
+    # Connection pool settings, applied to each worker process
+    POSTGRES_POOL_SIZE: int = 5
+    POSTGRES_POOL_MAX_OVERFLOW: int = 10
+    POSTGRES_POOL_TIMEOUT: float = 30.0
+    POSTGRES_POOL_RECYCLE: int = -1
+    POSTGRES_POOL_PRE_PING: bool = False
+    POSTGRES_POOL_USE_LIFO: bool = False
+    # Derive the per-worker pool size from the server's max_connections instead,
+    # split between every worker of every instance (pod) sharing the database
+    POSTGRES_POOL_AUTO_SIZE: bool = False
+    POSTGRES_MAX_CONNECTIONS: int | None = None
+    POSTGRES_RESERVED_CONNECTIONS: int = 10
+    POSTGRES_POOL_INSTANCES: int = 1
+    WEB_CONCURRENCY: int = 4
+    # "async" serves the items, users and login routes with async endpoints on
+    # an AsyncEngine instead of sync endpoints running in the threadpool
+    DATABASE_STACK: Literal["sync", "async"] = "sync"
+    # Render the responses with orjson, and dump the response models of the
+    # routes straight to JSON bytes instead of through a dict
+    FAST_JSON_RESPONSES: bool = False
+
+    # Responses are compressed with the first of these encodings the client
+    # accepts, br and zstd need the brotli and zstandard packages. Set it empty
+    # to disable compression.
+    COMPRESSION_ENCODINGS: Annotated[
+        list[Literal["zstd", "br", "gzip"]] | str, BeforeValidator(parse_cors)
+    ] = ["zstd", "br", "gzip"]
+    # Smaller responses are sent uncompressed, streamed ones are always
+    # compressed
+    COMPRESSION_MINIMUM_SIZE: int = 1000
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    COMPRESSION_ZSTD_LEVEL: int = 3
+
+    # Exact counts of the paginated lists are cached per owner in each worker,
+    # writes in the same worker invalidate them. 0 disables the cache.
+    COUNT_CACHE_TTL_SECONDS: float = 5.0
+    COUNT_CACHE_MAX_SIZE: int = 10_000
+
+    # bcrypt runs in PASSWORD_HASH_WORKERS processes (0 to run it inline), the
+    # calls beyond PASSWORD_HASH_MAX_PENDING running or queued get a 503
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 64
+
+    # id, is_active and is_superuser of the authenticated users are cached in
+    # each worker, user writes invalidate them in every worker with Postgres
+    # NOTIFY ("postgres"), or in this worker only ("local"), which is only
+    # coherent with a single worker. 0 disables the cache.
+    AUTH_CACHE_TTL_SECONDS: float = 30.0
+    AUTH_CACHE_MAX_SIZE: int = 10_000
+    AUTH_CACHE_INVALIDATION: Literal["local", "postgres"] = "postgres"
+
+    # POST /items/bulk accepts up to ITEMS_BULK_MAX_SIZE items and loads them
+    # with COPY from ITEMS_BULK_COPY_THRESHOLD items on
+    ITEMS_BULK_MAX_SIZE: int = 10_000
+    ITEMS_BULK_COPY_THRESHOLD: int = 1_000
+    # GET /items/batch returns up to ITEMS_BATCH_MAX_SIZE items by id
+    ITEMS_BATCH_MAX_SIZE: int = 200
+    # GET /items/?q= also matches the titles starting with q or resembling it,
+    # needs the pg_trgm extension and the trigram index of the titles
+    ITEMS_SEARCH_TRIGRAM: bool = False
+
+    # Record the request and stack of every pool checkout and report the
+    # connections held longer than the threshold or after the response finished
+    DB_LEAK_DETECTION: bool = False
+    DB_LEAK_THRESHOLD_SECONDS: float = 10.0
+    DB_LEAK_HISTORY_SIZE: int = 100
+
+    # Keep the objects of the request sessions loaded after a commit, so that
+    # their connection goes back to the pool at the last commit, and before
+    # password hashing, instead of when the session closes
+    DB_EARLY_RELEASE: bool = False
+
+    # Log the statements slower than the threshold, with their request and
+    # caller, and keep the last ones for /utils/slow-queries/. A sample of them
+    # is explained, at most SLOW_QUERY_EXPLAIN_PER_MINUTE times a minute.
+    SLOW_QUERY_THRESHOLD_MS: float | None = None
+    SLOW_QUERY_HISTORY_SIZE: int = 100
+    SLOW_QUERY_EXPLAIN_SAMPLE_RATE: float = 0.0
+    SLOW_QUERY_EXPLAIN_PER_MINUTE: int = 10
+
+    # Share of the requests whose phases (pool wait, queries, auth, bcrypt,
+    # handler, serialization) are timed, returned in a Server-Timing header
+    # and logged. 0 disables the timings.
+    SERVER_TIMING_SAMPLE_RATE: float = 0.0
+
+    # Serve Prometheus metrics on /metrics, set PROMETHEUS_MULTIPROC_DIR to
+    # aggregate the workers. Nothing is recorded when disabled. The email worker
+    # serves its own on EMAILS_WORKER_METRICS_PORT.
+    METRICS_ENABLED: bool = False
+
+    # Check the queries of each route against its query_budget, or this
+    # default, and for statements repeated with this many different parameters
+    # (N+1 queries). "log" warns, "raise" fails the request.
+    QUERY_BUDGET_MODE: Literal["off", "log", "raise"] = "off"
+    QUERY_BUDGET_DEFAULT: int = 10
+    QUERY_BUDGET_REPEAT_THRESHOLD: int = 3
+    EMAILS_WORKER_METRICS_PORT: int | None = None
+
     SMTP_TLS: bool = True
     SMTP_SSL: bool = False
     SMTP_PORT: int = 587
@@ -85,6 +205,16 @@ class Settings(BaseSettings):
 
     EMAIL_RESET_TOKEN_EXPIRE_HOURS: int = 48
 
+    # Emails are written to the email_outbox table and sent by app.email_worker,
+    # in batches over a reused connection. Failed ones are retried with an
+    # exponential backoff. A claimed batch must be sent within the lease, or its
+    # emails may be sent again by another worker.
+    EMAILS_OUTBOX_BATCH_SIZE: int = 50
+    EMAILS_OUTBOX_LEASE_SECONDS: float = 300.0
+    EMAILS_OUTBOX_MAX_ATTEMPTS: int = 5
+    EMAILS_OUTBOX_RETRY_BACKOFF_SECONDS: float = 1.0
+    EMAILS_OUTBOX_POLL_INTERVAL_SECONDS: float = 1.0
+
     @computed_field  # type: ignore[prop-decorator]
     @property
     def emails_enabled(self) -> bool:
@@ -0,0 +1,36 @@
+import uuid
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+@dataclass
+class RequestContext:
+    method: str
+    path: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+
+# Set for the whole request, including the dependencies and sync endpoints that
+# run in the threadpool (anyio copies the context into the worker thread)
+current_request: ContextVar[RequestContext | None] = ContextVar(
+    "current_request", default=None
+)
+
+
+class RequestContextMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = current_request.set(
+            RequestContext(method=scope["method"], path=scope["path"])
+        )
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_request.reset(token)
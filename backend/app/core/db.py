@@ -1,10 +1,167 @@
+import logging
+from typing import Any
+
+from sqlalchemy import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
 from sqlmodel import Session, create_engine, select
 
 from app import crud
+from app.core import metrics, queries, timing
 from app.core.config import settings
+from app.core.leaks import LeakDetector
+from app.core.slow_queries import SlowQueryLog
 from app.models import User, UserCreate
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+logger = logging.getLogger(__name__)
+
+
+def compute_pool_size(
+    *, max_connections: int, reserved_connections: int, workers: int, instances: int
+) -> int:
+    """
+    Split the connection budget of the server evenly between every worker
+    process of every instance, keeping some connections for admin/migrations.
+    """
+    budget = max_connections - reserved_connections
+    pool_size = budget // (workers * instances)
+    if pool_size < 1:
+        raise ValueError(
+            f"max_connections={max_connections} leaves no connections for "
+            f"{workers * instances} workers after reserving {reserved_connections}"
+        )
+    return pool_size
+
+
+def get_server_max_connections(url: str) -> int:
+    probe = create_engine(url, poolclass=NullPool)
+    try:
+        with probe.connect() as connection:
+            return int(connection.exec_driver_sql("SHOW max_connections").scalar_one())
+    finally:
+        probe.dispose()
+
+
+def get_pool_options() -> dict[str, Any]:
+    options: dict[str, Any] = {
+        "pool_size": settings.POSTGRES_POOL_SIZE,
+        "max_overflow": settings.POSTGRES_POOL_MAX_OVERFLOW,
+        "pool_timeout": settings.POSTGRES_POOL_TIMEOUT,
+        "pool_recycle": settings.POSTGRES_POOL_RECYCLE,
+        "pool_pre_ping": settings.POSTGRES_POOL_PRE_PING,
+        "pool_use_lifo": settings.POSTGRES_POOL_USE_LIFO,
+    }
+    if not settings.POSTGRES_POOL_AUTO_SIZE:
+        return options
+    max_connections = settings.POSTGRES_MAX_CONNECTIONS
+    if max_connections is None:
+        try:
+            max_connections = get_server_max_connections(
+                str(settings.SQLALCHEMY_DATABASE_URI)
+            )
+        except Exception as e:
+            logger.warning(
+                f"Could not read max_connections, using the configured pool size: {e}"
+            )
+            return options
+    options["pool_size"] = compute_pool_size(
+        max_connections=max_connections,
+        reserved_connections=settings.POSTGRES_RESERVED_CONNECTIONS,
+        workers=settings.WEB_CONCURRENCY,
+        instances=settings.POSTGRES_POOL_INSTANCES,
+    )
+    # The budget is a hard limit, overflow connections would exceed it
+    options["max_overflow"] = 0
+    return options
+
+
+def split_pool_options(
+    options: dict[str, Any], *, database_stack: str
+) -> tuple[dict[str, Any], dict[str, Any]]:
+    """
+    Pool options of the sync and async engines, so that together they stay
+    within the pool of the worker. The pools only connect when used, the async
+    engine isn't by the sync stack. The async stack still uses the sync engine
+    for the utils and private routes and the superuser checks of their
+    dependencies, it gets a quarter of the pool without overflow.
+    """
+    if database_stack == "sync":
+        return options, options
+    sync_pool_size = max(1, options["pool_size"] // 4)
+    sync_options = {**options, "pool_size": sync_pool_size, "max_overflow": 0}
+    async_options = {
+        **options,
+        "pool_size": max(1, options["pool_size"] - sync_pool_size),
+    }
+    return sync_options, async_options
+
+
+pool_options, async_pool_options = split_pool_options(
+    get_pool_options(), database_stack=settings.DATABASE_STACK
+)
+engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI), **pool_options)
+# psycopg provides both drivers, the async engine picks its async one. It doesn't
+# connect until it is used, by the routes of the async stack.
+async_engine = create_async_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI), **async_pool_options
+)
+
+replica_engine: Engine | None = None
+async_replica_engine: AsyncEngine | None = None
+if settings.SQLALCHEMY_REPLICA_DATABASE_URI:
+    replica_engine = create_engine(
+        str(settings.SQLALCHEMY_REPLICA_DATABASE_URI), **pool_options
+    )
+    async_replica_engine = create_async_engine(
+        str(settings.SQLALCHEMY_REPLICA_DATABASE_URI), **async_pool_options
+    )
+
+leak_detector: LeakDetector | None = None
+if settings.DB_LEAK_DETECTION:
+    leak_detector = LeakDetector(
+        threshold_seconds=settings.DB_LEAK_THRESHOLD_SECONDS,
+        history_size=settings.DB_LEAK_HISTORY_SIZE,
+    )
+    leak_detector.install(engine)
+    leak_detector.install(async_engine.sync_engine)
+    if replica_engine and async_replica_engine:
+        leak_detector.install(replica_engine)
+        leak_detector.install(async_replica_engine.sync_engine)
+
+slow_query_log: SlowQueryLog | None = None
+if settings.SLOW_QUERY_THRESHOLD_MS is not None:
+    slow_query_log = SlowQueryLog(
+        threshold_ms=settings.SLOW_QUERY_THRESHOLD_MS,
+        history_size=settings.SLOW_QUERY_HISTORY_SIZE,
+        explain_sample_rate=settings.SLOW_QUERY_EXPLAIN_SAMPLE_RATE,
+        explain_per_minute=settings.SLOW_QUERY_EXPLAIN_PER_MINUTE,
+    )
+    slow_query_log.install(engine)
+    slow_query_log.install(async_engine.sync_engine)
+    if replica_engine and async_replica_engine:
+        slow_query_log.install(replica_engine)
+        slow_query_log.install(async_replica_engine.sync_engine)
+
+if settings.SERVER_TIMING_SAMPLE_RATE > 0:
+    timing.install(engine)
+    timing.install(async_engine.sync_engine)
+    if replica_engine and async_replica_engine:
+        timing.install(replica_engine)
+        timing.install(async_replica_engine.sync_engine)
+
+if settings.QUERY_BUDGET_MODE != "off":
+    queries.install(engine)
+    queries.install(async_engine.sync_engine)
+    if replica_engine and async_replica_engine:
+        queries.install(replica_engine)
+        queries.install(async_replica_engine.sync_engine)
+
+if settings.METRICS_ENABLED:
+    metrics.install(engine, "primary")
+    metrics.install(async_engine.sync_engine, "primary-async")
+    if replica_engine and async_replica_engine:
+        metrics.install(replica_engine, "replica")
+        metrics.install(async_replica_engine.sync_engine, "replica-async")
 
 
 # make sure all SQLModel models are imported (app.models) before initializing DB
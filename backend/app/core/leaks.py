@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any
+
+from sqlalchemy import Engine, event
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.context import current_request
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ConnectionCheckout:
+    request_id: str | None
+    request_method: str | None
+    request_path: str | None
+    thread: str
+    stack: list[str]
+    checked_out_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    started: float = field(default_factory=time.monotonic)
+    checked_in: float | None = None
+    # Still checked out when the response of its request had finished
+    leaked: bool = False
+
+    @property
+    def held_seconds(self) -> float:
+        end = self.checked_in if self.checked_in is not None else time.monotonic()
+        return end - self.started
+
+
+def _checkout_stack() -> list[str]:
+    # Skip the SQLAlchemy internals and this module, keep the caller frames
+    frames = [
+        frame
+        for frame in traceback.extract_stack()
+        if "/sqlalchemy/" not in frame.filename and frame.filename != __file__
+    ]
+    return traceback.format_list(frames)
+
+
+class LeakDetector:
+    def __init__(self, *, threshold_seconds: float, history_size: int) -> None:
+        self.threshold_seconds = threshold_seconds
+        self._lock = threading.Lock()
+        self._checkouts: dict[int, ConnectionCheckout] = {}
+        self._offenders: deque[ConnectionCheckout] = deque(maxlen=history_size)
+
+    def install(self, engine: Engine) -> None:
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+
+    def _on_checkout(
+        self, _dbapi_connection: Any, connection_record: Any, _proxy: Any
+    ) -> None:
+        request = current_request.get()
+        checkout = ConnectionCheckout(
+            request_id=request.id if request else None,
+            request_method=request.method if request else None,
+            request_path=request.path if request else None,
+            thread=threading.current_thread().name,
+            stack=_checkout_stack(),
+        )
+        with self._lock:
+            self._checkouts[id(connection_record)] = checkout
+
+    def _on_checkin(self, _dbapi_connection: Any, connection_record: Any) -> None:
+        with self._lock:
+            checkout = self._checkouts.pop(id(connection_record), None)
+        if checkout is None:
+            return
+        checkout.checked_in = time.monotonic()
+        if not checkout.leaked and checkout.held_seconds > self.threshold_seconds:
+            self._report(checkout, "held longer than the threshold")
+
+    def request_finished(self, request_id: str) -> None:
+        with self._lock:
+            leaked = [
+                checkout
+                for checkout in self._checkouts.values()
+                if checkout.request_id == request_id and not checkout.leaked
+            ]
+            for checkout in leaked:
+                checkout.leaked = True
+        for checkout in leaked:
+            self._report(checkout, "still checked out after the response finished")
+
+    def _report(self, checkout: ConnectionCheckout, reason: str) -> None:
+        with self._lock:
+            self._offenders.append(checkout)
+        logger.warning(
+            f"Database connection {reason}: {checkout.request_method} "
+            f"{checkout.request_path} held for {checkout.held_seconds:.3f}s, "
+            f"checked out at:\n{''.join(checkout.stack)}"
+        )
+
+    def offenders(self) -> list[ConnectionCheckout]:
+        """
+        Connections currently held longer than the threshold, followed by the
+        most recent reported offenders.
+        """
+        with self._lock:
+            held = [
+                checkout
+                for checkout in self._checkouts.values()
+                if not checkout.leaked
+                and checkout.held_seconds > self.threshold_seconds
+            ]
+            return held + list(reversed(self._offenders))
+
+
+class LeakDetectionMiddleware:
+    def __init__(self, app: ASGIApp, detector: LeakDetector) -> None:
+        self.app = app
+        self.detector = detector
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request = current_request.get()
+            if request is not None:
+                self.detector.request_finished(request.id)
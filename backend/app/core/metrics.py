@@ -0,0 +1,182 @@
+"""
+Prometheus metrics of the app, served on /metrics.
+
+With PROMETHEUS_MULTIPROC_DIR set, each worker process writes its samples to
+that directory and /metrics aggregates the files of every worker. The directory
+must be emptied before the workers start, it is created if missing for the other
+processes of the image, like prestart or the email worker. Every metric has
+labels, so that processes which never record it, like the password hashing
+pool, write nothing.
+"""
+
+import atexit
+import os
+import time
+from typing import Any
+
+import anyio.to_thread
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import Engine, event
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+MULTIPROCESS_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+MULTIPROCESS = MULTIPROCESS_DIR is not None
+if MULTIPROCESS_DIR:
+    # The samples are written there from the first recorded metric on
+    os.makedirs(MULTIPROCESS_DIR, exist_ok=True)
+
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds",
+    "Latency of the HTTP requests, by route",
+    ["method", "route", "status_code"],
+)
+http_requests_in_progress = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests being served",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+threadpool_threads = Gauge(
+    "threadpool_threads",
+    "Threads of the threadpool running sync endpoints and dependencies, busy "
+    "or in total",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+db_pool_checked_out = Gauge(
+    "db_pool_checked_out_connections",
+    "Connections checked out of the pool",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+db_pool_overflow = Gauge(
+    "db_pool_overflow_connections",
+    "Connections opened beyond the pool size",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+db_pool_waiters = Gauge(
+    "db_pool_waiters",
+    "Callers waiting for a connection of the pool",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+db_pool_checkout_wait_seconds = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time waited for a connection of the pool",
+    ["engine"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0),
+)
+password_hash_seconds = Histogram(
+    "password_hash_seconds",
+    "Time to hash or verify a password, including the wait for the pool",
+    ["operation"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+emails_sent_total = Counter(
+    "emails_sent_total",
+    "Emails of the outbox by outcome: sent, retried or given_up",
+    ["outcome"],
+)
+
+
+def _instrument_pool(engine: Engine, name: str) -> None:
+    # The pool has no event before a checkout, count the waiters and time the
+    # wait around its connect method
+    pool = engine.pool
+    connect = pool.connect
+    waiters = db_pool_waiters.labels(name)
+    wait_seconds = db_pool_checkout_wait_seconds.labels(name)
+
+    def instrumented_connect() -> Any:
+        waiters.inc()
+        start = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            waiters.dec()
+            wait_seconds.observe(time.perf_counter() - start)
+
+    pool.connect = instrumented_connect  # type: ignore[method-assign]
+
+
+def install(engine: Engine, name: str) -> None:
+    """
+    Record the pool metrics of engine under the engine label name.
+    """
+    checked_out = db_pool_checked_out.labels(name)
+    overflow = db_pool_overflow.labels(name)
+
+    def on_checkout(*_: Any) -> None:
+        checked_out.inc()
+        overflow.set(max(getattr(engine.pool, "overflow", lambda: 0)(), 0))
+
+    def on_checkin(*_: Any) -> None:
+        checked_out.dec()
+        overflow.set(max(getattr(engine.pool, "overflow", lambda: 0)(), 0))
+
+    event.listen(engine, "checkout", on_checkout)
+    event.listen(engine, "checkin", on_checkin)
+    _instrument_pool(engine, name)
+    # dispose() replaces the pool
+    event.listen(engine, "engine_disposed", lambda e: _instrument_pool(e, name))
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        in_progress = http_requests_in_progress.labels(method)
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_progress.dec()
+            # The path template, so that the label has few values
+            route = scope.get("route")
+            http_request_duration_seconds.labels(
+                method,
+                getattr(route, "path", "unmatched"),
+                str(status_code),
+            ).observe(time.perf_counter() - start)
+            limiter = anyio.to_thread.current_default_thread_limiter()
+            threadpool_threads.labels("busy").set(limiter.borrowed_tokens)
+            threadpool_threads.labels("total").set(limiter.total_tokens)
+
+
+def metrics(_request: Request) -> Response:
+    registry = REGISTRY
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)  # type: ignore[no-untyped-call]
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+if MULTIPROCESS:
+    # Drop the live gauges of this worker when it exits
+    atexit.register(multiprocess.mark_process_dead, os.getpid())
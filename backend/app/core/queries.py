@@ -0,0 +1,141 @@
+import logging
+from collections import defaultdict
+from collections.abc import Callable, Generator, Sequence
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, TypeVar
+
+from sqlalchemy import Engine, event
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+@dataclass
+class QueryLog:
+    statements: list[str] = field(default_factory=list)
+    # Distinct parameters each statement ran with
+    parameters: defaultdict[str, set[str]] = field(
+        default_factory=lambda: defaultdict(set)
+    )
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def record(self, statement: str, parameters: Any) -> None:
+        self.statements.append(statement)
+        self.parameters[statement].add(repr(parameters))
+
+    def repeated(self, threshold: int) -> list[str]:
+        """
+        Statements run with at least threshold different parameters, like the
+        lazy loads of a relationship for each row of a list.
+        """
+        return [
+            statement
+            for statement, parameters in self.parameters.items()
+            if len(parameters) >= threshold
+        ]
+
+
+# Set while a route with a query budget runs, sync endpoints and dependencies
+# record into the same QueryLog from the threadpool
+current_query_log: ContextVar[QueryLog | None] = ContextVar(
+    "current_query_log", default=None
+)
+
+
+def query_budget(budget: int) -> Callable[[F], F]:
+    """
+    Declare the most queries an endpoint may run, including its dependencies,
+    instead of QUERY_BUDGET_DEFAULT. Put it under the route decorator.
+    """
+
+    def decorator(func: F) -> F:
+        func.__query_budget__ = budget  # type: ignore[attr-defined]
+        return func
+
+    return decorator
+
+
+def get_query_budget(endpoint: Callable[..., Any]) -> int | None:
+    return getattr(endpoint, "__query_budget__", None)
+
+
+def _after_cursor_execute(
+    _conn: Any,
+    _cursor: Any,
+    statement: str,
+    parameters: Any,
+    _context: Any,
+    _executemany: bool,
+) -> None:
+    query_log = current_query_log.get()
+    if query_log is not None:
+        query_log.record(statement, parameters)
+
+
+def install(engine: Engine) -> None:
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def check_query_log(
+    query_log: QueryLog,
+    *,
+    route: str,
+    budget: int,
+    repeat_threshold: int,
+    raise_errors: bool,
+) -> None:
+    """
+    Log, or raise QueryBudgetExceeded, when a route ran more queries than its
+    budget or repeated a statement with different parameters.
+    """
+    problems = []
+    if query_log.count > budget:
+        problems.append(f"ran {query_log.count} queries, its budget is {budget}")
+    for statement in query_log.repeated(repeat_threshold):
+        runs = len(query_log.parameters[statement])
+        problems.append(
+            f"ran the same statement with {runs} different parameters, "
+            f"load them at once instead: {statement}"
+        )
+    if not problems:
+        return
+    message = f"{route} " + "; ".join(problems)
+    if raise_errors:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+@contextmanager
+def record_queries(engines: Sequence[Engine]) -> Generator[QueryLog, None, None]:
+    """
+    Record every query of engines, from any thread, while the block runs.
+    """
+    query_log = QueryLog()
+
+    def on_execute(
+        _conn: Any,
+        _cursor: Any,
+        statement: str,
+        parameters: Any,
+        _context: Any,
+        _executemany: bool,
+    ) -> None:
+        query_log.record(statement, parameters)
+
+    for engine in engines:
+        event.listen(engine, "after_cursor_execute", on_execute)
+    try:
+        yield query_log
+    finally:
+        for engine in engines:
+            event.remove(engine, "after_cursor_execute", on_execute)
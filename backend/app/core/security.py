@@ -1,16 +1,127 @@
+import asyncio
+import multiprocessing
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import AbstractContextManager, nullcontext
 from datetime import datetime, timedelta, timezone
-from typing import Any
+from typing import Any, TypeVar
 
 import jwt
+from fastapi import HTTPException
 from passlib.context import CryptContext
 
 from app.core.config import settings
+from app.core.metrics import password_hash_seconds
+from app.core.timing import timed_call
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 ALGORITHM = "HS256"
 
+T = TypeVar("T")
+
+
+class PasswordHashingBusy(HTTPException):
+    def __init__(self) -> None:
+        super().__init__(
+            status_code=503,
+            detail="Too many password hashing requests, try again later",
+            headers={"Retry-After": "1"},
+        )
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a pool of worker processes, so that it doesn't hold the GIL
+    of the API workers, or inline with 0 workers. At most max_pending calls are
+    running or queued, the next ones raise PasswordHashingBusy. A pool broken by
+    the death of a worker process is replaced.
+    """
+
+    def __init__(self, *, workers: int, max_pending: int) -> None:
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor: ProcessPoolExecutor | None = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Forking the threads of the API workers isn't safe
+                self._executor = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _discard_executor(self, executor: ProcessPoolExecutor | None) -> None:
+        # Calls that failed together on a broken pool discard it once
+        with self._lock:
+            if executor is None or self._executor is not executor:
+                return
+            self._executor = None
+        executor.shutdown(wait=False)
+
+    def _current_executor(self) -> ProcessPoolExecutor | None:
+        # The pool a call is submitted to, to discard if it breaks
+        return self._get_executor() if self.workers else None
+
+    def submit(self, fn: Callable[..., T], *args: Any) -> "Future[T]":
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHashingBusy()
+        future: Future[T]
+        try:
+            if self.workers:
+                executor = self._get_executor()
+                try:
+                    future = executor.submit(fn, *args)
+                except BrokenProcessPool:
+                    self._discard_executor(executor)
+                    raise
+            else:
+                future = Future()
+                try:
+                    future.set_result(fn(*args))
+                except Exception as e:
+                    future.set_exception(e)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn: Callable[..., T], *args: Any) -> T:
+        executor = self._current_executor()
+        try:
+            return self.submit(fn, *args).result()
+        except BrokenProcessPool:
+            # A worker process died, killed for memory or crashed, retry once in
+            # a new pool
+            self._discard_executor(executor)
+            return self.submit(fn, *args).result()
+
+    async def run_async(self, fn: Callable[..., T], *args: Any) -> T:
+        executor = self._current_executor()
+        try:
+            return await asyncio.wrap_future(self.submit(fn, *args))
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+)
+
 
 def create_access_token(subject: str | Any, expires_delta: timedelta) -> str:
     expire = datetime.now(timezone.utc) + expires_delta
@@ -19,9 +130,41 @@ def create_access_token(subject: str | Any, expires_delta: timedelta) -> str:
     return encoded_jwt
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+def _hash_timer(operation: str) -> AbstractContextManager[Any]:
+    if settings.METRICS_ENABLED:
+        return password_hash_seconds.labels(operation).time()
+    return nullcontext()
+
+
+def _verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
-def get_password_hash(password: str) -> str:
+def _get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
+
+
+@timed_call("bcrypt")
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    with _hash_timer("verify"):
+        return password_hasher.run(_verify_password, plain_password, hashed_password)
+
+
+@timed_call("bcrypt")
+def get_password_hash(password: str) -> str:
+    with _hash_timer("hash"):
+        return password_hasher.run(_get_password_hash, password)
+
+
+@timed_call("bcrypt")
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    with _hash_timer("verify"):
+        return await password_hasher.run_async(
+            _verify_password, plain_password, hashed_password
+        )
+
+
+@timed_call("bcrypt")
+async def get_password_hash_async(password: str) -> str:
+    with _hash_timer("hash"):
+        return await password_hasher.run_async(_get_password_hash, password)
@@ -0,0 +1,195 @@
+import logging
+import random
+import re
+import threading
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import Connection, Engine, event
+
+from app.core.context import current_request
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = Path(__file__).parents[1]
+
+# Statements that EXPLAIN accepts, without running them
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+_string_literal = re.compile(r"'(?:[^']|'')*'")
+_number_literal = re.compile(r"(?<![\w.$])\d+(?:\.\d+)?\b")
+_whitespace = re.compile(r"\s+")
+
+
+@dataclass
+class SlowQuery:
+    statement: str
+    # The type of each parameter, never its value
+    parameters: Any
+    duration_ms: float
+    request_method: str | None
+    request_path: str | None
+    caller: str | None
+    logged_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    plan: Any = None
+
+
+def normalize_statement(statement: str) -> str:
+    """
+    Statement on a single line, with its inlined literals replaced by ?, so
+    that the runs of a statement read the same.
+    """
+    return _whitespace.sub(" ", _redact_literals(statement)).strip()
+
+
+def redact_parameters(parameters: Any) -> Any:
+    if isinstance(parameters, dict):
+        return {key: redact_parameters(value) for key, value in parameters.items()}
+    if isinstance(parameters, list | tuple):
+        return [redact_parameters(value) for value in parameters]
+    return type(parameters).__name__
+
+
+def redact_plan(plan: Any) -> Any:
+    """
+    Plan with the literals of its conditions replaced by ?, Postgres inlines
+    the parameters in them.
+    """
+    if isinstance(plan, dict):
+        return {
+            key: _redact_literals(value)
+            if isinstance(value, str) and key.endswith(("Cond", "Filter"))
+            else redact_plan(value)
+            for key, value in plan.items()
+        }
+    if isinstance(plan, list):
+        return [redact_plan(value) for value in plan]
+    return plan
+
+
+def _redact_literals(expression: str) -> str:
+    return _number_literal.sub("?", _string_literal.sub("?", expression))
+
+
+def _caller() -> str | None:
+    # The innermost frame of the app, outside of this module
+    for frame in reversed(traceback.extract_stack()):
+        path = Path(frame.filename)
+        if path.is_relative_to(APP_DIR) and frame.filename != __file__:
+            module = path.relative_to(APP_DIR.parent)
+            return f"{module}:{frame.lineno} in {frame.name}"
+    return None
+
+
+class SlowQueryLog:
+    def __init__(
+        self,
+        *,
+        threshold_ms: float,
+        history_size: int,
+        explain_sample_rate: float,
+        explain_per_minute: int,
+    ) -> None:
+        self.threshold_ms = threshold_ms
+        self.explain_sample_rate = explain_sample_rate
+        self.explain_per_minute = explain_per_minute
+        self._lock = threading.Lock()
+        self._queries: deque[SlowQuery] = deque(maxlen=history_size)
+        self._explained_at: deque[float] = deque()
+
+    def install(self, engine: Engine) -> None:
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(
+        self,
+        _conn: Connection,
+        _cursor: Any,
+        _statement: str,
+        _parameters: Any,
+        context: Any,
+        _executemany: bool,
+    ) -> None:
+        context._slow_query_started = time.perf_counter()
+
+    def _after_cursor_execute(
+        self,
+        conn: Connection,
+        _cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: Any,
+        executemany: bool,
+    ) -> None:
+        started = getattr(context, "_slow_query_started", None)
+        if started is None:
+            return
+        duration_ms = (time.perf_counter() - started) * 1000
+        if duration_ms < self.threshold_ms:
+            return
+        request = current_request.get()
+        query = SlowQuery(
+            statement=normalize_statement(statement),
+            parameters=redact_parameters(parameters),
+            duration_ms=duration_ms,
+            request_method=request.method if request else None,
+            request_path=request.path if request else None,
+            caller=_caller(),
+        )
+        if not executemany and self._should_explain(statement):
+            query.plan = self._explain(conn, statement, parameters)
+        with self._lock:
+            self._queries.append(query)
+        logger.warning(
+            f"Slow query, {query.duration_ms:.1f}ms in {query.request_method} "
+            f"{query.request_path} from {query.caller}: {query.statement} "
+            f"{query.parameters}"
+        )
+
+    def _should_explain(self, statement: str) -> bool:
+        if not statement.lstrip().upper().startswith(EXPLAINABLE):
+            return False
+        if random.random() >= self.explain_sample_rate:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            while self._explained_at and now - self._explained_at[0] > 60:
+                self._explained_at.popleft()
+            if len(self._explained_at) >= self.explain_per_minute:
+                return False
+            self._explained_at.append(now)
+        return True
+
+    def _explain(self, conn: Connection, statement: str, parameters: Any) -> Any:
+        # On the DBAPI connection, so that it doesn't go through the events. The
+        # savepoint keeps the transaction usable when EXPLAIN fails.
+        dbapi_connection = conn.connection.dbapi_connection
+        assert dbapi_connection is not None
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("SAVEPOINT slow_query_explain")
+            try:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+                row = cursor.fetchone()
+                assert row is not None
+                return redact_plan(row[0])
+            finally:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        except Exception as e:
+            logger.warning(f"Could not explain the slow query: {e}")
+            return None
+        finally:
+            cursor.close()
+
+    def queries(self) -> list[SlowQuery]:
+        """
+        The slow queries, most recent first.
+        """
+        with self._lock:
+            return list(reversed(self._queries))
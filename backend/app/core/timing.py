@@ -0,0 +1,191 @@
+import functools
+import inspect
+import json
+import logging
+import random
+import time
+from collections.abc import Callable, Generator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, TypeVar, cast
+
+from sqlalchemy import Engine, event
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+@dataclass
+class RequestTimings:
+    # Seconds spent in each phase of the request
+    phases: dict[str, float] = field(default_factory=dict)
+    queries: int = 0
+    started: float = field(default_factory=time.perf_counter)
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        """
+        Value of the Server-Timing header, durations are in milliseconds.
+        """
+        metrics = []
+        for phase, seconds in self.phases.items():
+            metric = f"{phase};dur={seconds * 1000:.1f}"
+            if phase == "db":
+                metric += f';desc="{self.queries} queries"'
+            metrics.append(metric)
+        total = time.perf_counter() - self.started
+        metrics.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(metrics)
+
+
+# Set for the sampled requests. Sync endpoints and dependencies get a copy of
+# the context in the threadpool, they add to the same RequestTimings.
+current_timings: ContextVar[RequestTimings | None] = ContextVar(
+    "current_timings", default=None
+)
+
+
+@contextmanager
+def timed(phase: str) -> Generator[None, None, None]:
+    timings = current_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(phase, time.perf_counter() - start)
+
+
+def timed_call(phase: str) -> Callable[[F], F]:
+    """
+    Decorator adding the time spent in a sync or async function to phase.
+    """
+
+    def decorator(func: F) -> F:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with timed(phase):
+                    return await func(*args, **kwargs)
+
+            return cast(F, async_wrapper)
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with timed(phase):
+                return func(*args, **kwargs)
+
+        return cast(F, wrapper)
+
+    return decorator
+
+
+def _before_cursor_execute(
+    _conn: Any,
+    _cursor: Any,
+    _statement: str,
+    _parameters: Any,
+    context: Any,
+    _executemany: bool,
+) -> None:
+    if current_timings.get() is not None:
+        context._timing_started = time.perf_counter()
+
+
+def _after_cursor_execute(
+    _conn: Any,
+    _cursor: Any,
+    _statement: str,
+    _parameters: Any,
+    context: Any,
+    _executemany: bool,
+) -> None:
+    timings = current_timings.get()
+    started = getattr(context, "_timing_started", None)
+    if timings is not None and started is not None:
+        timings.queries += 1
+        timings.add("db", time.perf_counter() - started)
+
+
+def _time_pool(engine: Engine) -> None:
+    # The pool has no event before a checkout, time the wait for a connection
+    # around its connect method instead
+    pool = engine.pool
+    connect = pool.connect
+
+    def timed_connect() -> Any:
+        with timed("pool"):
+            return connect()
+
+    pool.connect = timed_connect  # type: ignore[method-assign]
+
+
+def install(engine: Engine) -> None:
+    """
+    Add the queries of engine, and the waits for its pool, to the timings of
+    the request running them.
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    _time_pool(engine)
+    # dispose() replaces the pool
+    event.listen(engine, "engine_disposed", _time_pool)
+
+
+class TimingMiddleware:
+    """
+    Time the phases of a sample of the requests, and return them in a
+    Server-Timing header and a JSON log line.
+    """
+
+    def __init__(self, app: ASGIApp, *, sample_rate: float) -> None:
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or random.random() >= self.sample_rate:
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings()
+        status_code = None
+
+        async def send_with_timings(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", timings.server_timing())
+            await send(message)
+
+        token = current_timings.set(timings)
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            current_timings.reset(token)
+            logger.info(
+                json.dumps(
+                    {
+                        "event": "request_timings",
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "status_code": status_code,
+                        "queries": timings.queries,
+                        "phases_ms": {
+                            phase: round(seconds * 1000, 3)
+                            for phase, seconds in timings.phases.items()
+                        },
+                        "total_ms": round(
+                            (time.perf_counter() - timings.started) * 1000, 3
+                        ),
+                    }
+                )
+            )
@@ -1,19 +1,119 @@
 import uuid
-from typing import Any
+from typing import Any, Literal, cast
 
-from sqlmodel import Session, select
+import psycopg
+from psycopg import sql
+from sqlalchemy import (
+    ColumnElement,
+    Executable,
+    Table,
+    Uuid,
+    any_,
+    exists,
+    insert,
+    literal,
+    or_,
+    text,
+    update,
+)
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlmodel import Session, col, delete, func, select
+from sqlmodel.sql.expression import SelectOfScalar
 
+from app.core.auth_cache import user_auth_cache
+from app.core.cache import TTLCache
+from app.core.config import settings
 from app.core.security import get_password_hash, verify_password
-from app.models import Item, ItemCreate, User, UserCreate, UserUpdate
+from app.models import (
+    ITEM_SEARCH_CONFIG,
+    Item,
+    ItemChange,
+    ItemCreate,
+    ItemUpdate,
+    OutboxEmail,
+    User,
+    UserCreate,
+    UserUpdate,
+    item_search_vector,
+)
 
+CountMode = Literal["exact", "estimated", "none"]
 
-def create_user(*, session: Session, user_create: UserCreate) -> User:
+# Exact counts by (table name, owner id), None counting the whole table
+count_cache: TTLCache[tuple[str, uuid.UUID | None], int] = TTLCache(
+    ttl=settings.COUNT_CACHE_TTL_SECONDS, maxsize=settings.COUNT_CACHE_MAX_SIZE
+)
+
+item_table: Table = Item.__table__  # type: ignore[attr-defined]
+# The columns of the model, without the generated search vector
+item_columns = [item_table.c[name] for name in Item.model_fields]
+
+# Row estimate of the planner, -1 if the table was never analyzed
+ESTIMATED_COUNT = text(
+    "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"
+)
+
+
+def release_connection(session: Session) -> None:
+    """
+    Return the connection of session to the pool before slow work that doesn't
+    need the database, like password hashing, by ending its read-only
+    transaction. The next query checks a connection out again. Does nothing
+    when the session has changes to flush, or expires its objects on commit as
+    reloading them would check a connection out right away.
+    """
+    if session.expire_on_commit or session.new or session.dirty or session.deleted:
+        return
+    if session.in_transaction():
+        session.commit()
+
+
+def refresh_after_commit(session: Session, db_obj: Any) -> None:
+    # Without expire_on_commit the object is still loaded, refreshing it would
+    # check out a connection again and hold it until the session closes
+    if session.expire_on_commit:
+        session.refresh(db_obj)
+
+
+def add_email(
+    *,
+    session: Session,
+    email_to: str,
+    template_name: str,
+    context: dict[str, Any] | None = None,
+) -> OutboxEmail:
+    """
+    Add an email to the outbox, app.email_worker sends it once the session is
+    committed.
+    """
+    db_email = OutboxEmail(
+        email_to=email_to,
+        template_name=template_name,
+        context=context or {},
+    )
+    session.add(db_email)
+    return db_email
+
+
+def create_user(
+    *, session: Session, user_create: UserCreate, new_account_email: bool = False
+) -> User:
+    release_connection(session)
     db_obj = User.model_validate(
         user_create, update={"hashed_password": get_password_hash(user_create.password)}
     )
     session.add(db_obj)
+    if new_account_email:
+        add_email(
+            session=session,
+            email_to=db_obj.email,
+            template_name="new_account",
+            context={"username": db_obj.email},
+        )
     session.commit()
-    session.refresh(db_obj)
+    refresh_after_commit(session, db_obj)
+    invalidate_user_counts()
     return db_obj
 
 
@@ -21,13 +121,15 @@ def update_user(*, session: Session, db_user: User, user_in: UserUpdate) -> Any:
     user_data = user_in.model_dump(exclude_unset=True)
     extra_data = {}
     if "password" in user_data:
+        release_connection(session)
         password = user_data["password"]
         hashed_password = get_password_hash(password)
         extra_data["hashed_password"] = hashed_password
     db_user.sqlmodel_update(user_data, update=extra_data)
     session.add(db_user)
+    user_auth_cache.invalidate(session, str(db_user.id))
     session.commit()
-    session.refresh(db_user)
+    refresh_after_commit(session, db_user)
     return db_user
 
 
@@ -41,6 +143,7 @@ def authenticate(*, session: Session, email: str, password: str) -> User | None:
     db_user = get_user_by_email(session=session, email=email)
     if not db_user:
         return None
+    release_connection(session)
     if not verify_password(password, db_user.hashed_password):
         return None
     return db_user
@@ -48,7 +151,292 @@ def authenticate(*, session: Session, email: str, password: str) -> User | None:
 
 def create_item(*, session: Session, item_in: ItemCreate, owner_id: uuid.UUID) -> Item:
     db_item = Item.model_validate(item_in, update={"owner_id": owner_id})
-    session.add(db_item)
+    statement = (
+        insert(item_table)
+        .values(db_item.model_dump())
+        .returning(*item_columns)
+        .add_cte(touch_items(owner_id).cte("touched"))
+    )
+    row = session.exec(statement).mappings().one()  # type: ignore
     session.commit()
-    session.refresh(db_item)
-    return db_item
+    invalidate_item_counts(owner_id)
+    return Item.model_validate(dict(row))
+
+
+# Counters of the ItemChange version of each owner. A write bumps the one of
+# its connection, so that the concurrent writes of an owner, which hold the row
+# they bumped locked until they commit, rarely wait for each other.
+ITEM_CHANGE_SLOTS = 16
+
+
+def touch_items(owners: uuid.UUID | ColumnElement[bool]) -> postgresql.Insert:
+    """
+    Bump the ItemChange version of owners, an owner id or the condition of the
+    items whose owners to bump. Added as a CTE to the statement writing the
+    items, it sees them as they were before the write.
+    """
+    slot = func.pg_backend_pid() % ITEM_CHANGE_SLOTS
+    statement = postgresql.insert(ItemChange)
+    if isinstance(owners, uuid.UUID):
+        statement = statement.values(owner_id=owners, slot=slot, version=1)
+    else:
+        rows = select(item_table.c.owner_id, slot, literal(1)).where(owners).distinct()
+        statement = statement.from_select(["owner_id", "slot", "version"], rows)
+    return statement.on_conflict_do_update(
+        index_elements=["owner_id", "slot"],
+        set_={"version": col(ItemChange.version) + 1},
+    )
+
+
+def items_version_statement(owner_id: uuid.UUID) -> SelectOfScalar[int]:
+    return select(func.coalesce(func.sum(ItemChange.version), 0)).where(
+        ItemChange.owner_id == owner_id
+    )
+
+
+def get_items_version(*, session: Session, owner_id: uuid.UUID) -> int:
+    """
+    The ItemChange version of the items of owner_id, 0 until their first write.
+    """
+    return session.exec(items_version_statement(owner_id)).one()
+
+
+def owned_item(id: uuid.UUID, owner_id: uuid.UUID | None) -> ColumnElement[bool]:
+    """
+    Condition matching the item id if it belongs to owner_id, or whoever it
+    belongs to when owner_id is None, for superusers.
+    """
+    condition = item_table.c.id == id
+    if owner_id is not None:
+        condition &= item_table.c.owner_id == owner_id
+    return condition
+
+
+def item_exists(
+    *, session: Session, id: uuid.UUID, owner_id: uuid.UUID | None = None
+) -> bool:
+    return bool(session.scalar(select(exists().where(owned_item(id, owner_id)))))
+
+
+def any_item_id(ids: list[uuid.UUID]) -> ColumnElement[bool]:
+    # A single array parameter, the statement is the same whatever the count
+    return col(Item.id) == any_(literal(ids, ARRAY(Uuid)))
+
+
+def get_items(
+    *, session: Session, ids: list[uuid.UUID], owner_id: uuid.UUID | None
+) -> dict[uuid.UUID, Item]:
+    """
+    The items among ids that belong to owner_id, or to anyone when it is None,
+    by id.
+    """
+    statement = select(Item).where(any_item_id(ids))
+    if owner_id is not None:
+        statement = statement.where(col(Item.owner_id) == owner_id)
+    return {item.id: item for item in session.exec(statement)}
+
+
+def existing_item_ids(*, session: Session, ids: list[uuid.UUID]) -> set[uuid.UUID]:
+    return set(session.exec(select(Item.id).where(any_item_id(ids))))
+
+
+def update_item(
+    *,
+    session: Session,
+    id: uuid.UUID,
+    owner_id: uuid.UUID | None,
+    item_in: ItemUpdate,
+    versions: list[int] | None = None,
+) -> Item | None:
+    """
+    Update the item in one UPDATE ... RETURNING, checking its owner, and its
+    version when versions is given, in the same statement and bumping its
+    version. None if no item matched, see item_exists for why.
+    """
+    values = item_in.model_dump(exclude_unset=True)
+    condition = owned_item(id, owner_id)
+    if versions is not None:
+        condition &= item_table.c.version.in_(versions)
+    statement: Executable
+    if values:
+        statement = (
+            update(item_table)
+            .where(condition)
+            .values({**values, "version": item_table.c.version + 1})
+            .returning(*item_columns)
+            .add_cte(touch_items(condition).cte("touched"))
+        )
+    else:
+        statement = select(*item_columns).where(condition)
+    row = session.exec(statement).mappings().first()  # type: ignore
+    session.commit()
+    return Item.model_validate(dict(row)) if row else None
+
+
+def item_copy_statement() -> sql.Composed:
+    return sql.SQL("COPY {} ({}) FROM STDIN").format(
+        sql.Identifier(item_table.name),
+        sql.SQL(", ").join(sql.Identifier(name) for name in Item.model_fields),
+    )
+
+
+def create_items(
+    *, session: Session, items_in: list[ItemCreate], owner_id: uuid.UUID
+) -> list[Item]:
+    """
+    Insert the items in one transaction, with a multi-row INSERT ... RETURNING
+    or, from ITEMS_BULK_COPY_THRESHOLD items on, with COPY.
+    """
+    db_items = [
+        Item.model_validate(item_in, update={"owner_id": owner_id})
+        for item_in in items_in
+    ]
+    rows = [db_item.model_dump() for db_item in db_items]
+    connection = session.connection()
+    if len(rows) >= settings.ITEMS_BULK_COPY_THRESHOLD:
+        driver_connection = cast(
+            psycopg.Connection[Any], connection.connection.driver_connection
+        )
+        with driver_connection.cursor() as cursor:
+            with cursor.copy(item_copy_statement()) as copy:
+                for row in rows:
+                    copy.write_row(list(row.values()))
+        connection.execute(touch_items(owner_id))
+    elif rows:
+        statement = (
+            insert(item_table)
+            .values(rows)
+            .returning(*item_columns)
+            .add_cte(touch_items(owner_id).cte("touched"))
+        )
+        result = connection.execute(statement)
+        db_items = [Item.model_validate(dict(row)) for row in result.mappings()]
+    # Written on the connection, out of sight of the ORM events that pin the
+    # client to the primary after its writes
+    session.info["has_written"] = True
+    session.commit()
+    invalidate_item_counts(owner_id)
+    return db_items
+
+
+def delete_item(*, session: Session, id: uuid.UUID, owner_id: uuid.UUID | None) -> bool:
+    """
+    Delete the item in one DELETE ... RETURNING, checking its owner in the same
+    statement. False if no item matched.
+    """
+    statement = (
+        delete(item_table)
+        .where(owned_item(id, owner_id))
+        .returning(item_table.c.owner_id)
+        .add_cte(touch_items(owned_item(id, owner_id)).cte("touched"))
+    )
+    deleted_owner_id = session.exec(statement).scalar()  # type: ignore
+    session.commit()
+    if deleted_owner_id is None:
+        return False
+    invalidate_item_counts(deleted_owner_id)
+    return True
+
+
+def delete_user(*, session: Session, db_user: User) -> None:
+    statement = delete(Item).where(col(Item.owner_id) == db_user.id)
+    session.exec(statement)  # type: ignore
+    session.delete(db_user)
+    user_auth_cache.invalidate(session, str(db_user.id))
+    session.commit()
+    invalidate_user_counts()
+    invalidate_item_counts(db_user.id)
+
+
+def invalidate_item_counts(owner_id: uuid.UUID) -> None:
+    count_cache.delete(("item", owner_id))
+    count_cache.delete(("item", None))
+
+
+def invalidate_user_counts() -> None:
+    count_cache.delete(("user", None))
+
+
+def count_statement(
+    model: type[Item] | type[User], owner_id: uuid.UUID | None = None
+) -> SelectOfScalar[int]:
+    statement = select(func.count()).select_from(model)
+    if owner_id is not None:
+        statement = statement.where(col(Item.owner_id) == owner_id)
+    return statement
+
+
+def count(
+    *,
+    session: Session,
+    model: type[Item] | type[User],
+    owner_id: uuid.UUID | None = None,
+    count_mode: CountMode = "exact",
+) -> int | None:
+    """
+    Count the rows of model, only those of owner_id if given.
+
+    "estimated" reads the planner statistics instead when counting a whole
+    table and "none" skips the count. Exact counts are cached for
+    COUNT_CACHE_TTL_SECONDS.
+    """
+    if count_mode == "none":
+        return None
+    table_name = str(model.__tablename__)
+    if count_mode == "estimated" and owner_id is None:
+        estimate = session.scalar(ESTIMATED_COUNT, {"table": f'"{table_name}"'})
+        if estimate is not None and estimate >= 0:
+            return int(estimate)
+    key = (table_name, owner_id)
+    cached = count_cache.get(key)
+    if cached is not None:
+        return cached
+    exact = session.exec(count_statement(model, owner_id)).one()
+    count_cache.set(key, exact)
+    return exact
+
+
+def item_search(q: str) -> tuple[ColumnElement[bool], ColumnElement[Any]]:
+    """
+    Condition matching the items for the web search syntax q, on their title
+    and description, and their rank. With ITEMS_SEARCH_TRIGRAM, titles
+    starting with q or resembling it match too.
+    """
+    query = func.websearch_to_tsquery(ITEM_SEARCH_CONFIG, q)
+    match: ColumnElement[bool] = item_search_vector.op("@@")(query)
+    rank: ColumnElement[Any] = func.ts_rank_cd(item_search_vector, query)
+    if settings.ITEMS_SEARCH_TRIGRAM:
+        title = col(Item.title)
+        prefix = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        match = or_(
+            match,
+            title.ilike(f"{prefix}%", escape="\\"),
+            title.op("%")(q),
+        )
+        rank = rank + func.similarity(title, q)
+    return match, rank
+
+
+def search_items_statement(q: str, owner_id: uuid.UUID | None) -> SelectOfScalar[Item]:
+    """
+    The items matching q, of owner_id if given, best ranked first.
+    """
+    match, rank = item_search(q)
+    statement = select(Item).where(match)
+    if owner_id is not None:
+        statement = statement.where(col(Item.owner_id) == owner_id)
+    return statement.order_by(rank.desc(), col(Item.id))
+
+
+def count_search(
+    *,
+    session: Session,
+    q: str,
+    owner_id: uuid.UUID | None,
+    count_mode: CountMode = "exact",
+) -> int | None:
+    # Never cached nor estimated, every q counts different rows
+    if count_mode == "none":
+        return None
+    match, _ = item_search(q)
+    return session.exec(count_statement(Item, owner_id).where(match)).one()
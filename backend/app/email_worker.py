@@ -0,0 +1,180 @@
+"""
+Sends the emails of the email_outbox table, run it with `python -m app.email_worker`.
+
+Each batch is claimed with SELECT ... FOR UPDATE SKIP LOCKED, which leases its
+emails for EMAILS_OUTBOX_LEASE_SECONDS by moving their next_attempt_at, so any
+number of workers can run without sending an email twice. Each email is then
+deleted or rescheduled in its own transaction once sent, so that no lock or
+connection is held while sending. Only the email being sent when its worker
+dies is sent again, once its lease expires.
+
+The emails given up on after EMAILS_OUTBOX_MAX_ATTEMPTS are kept, with
+next_attempt_at NULL, for their last_error to be checked. They hold no password
+or token, delete them once checked.
+"""
+
+import logging
+import signal
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from emails.backend import SMTPBackend  # type: ignore
+from prometheus_client import start_http_server
+from sqlalchemy import func
+from sqlmodel import Session, col, delete, select, update
+
+from app.core.config import settings
+from app.core.db import engine
+from app.core.metrics import emails_sent_total
+from app.models import OutboxEmail
+from app.utils import get_smtp_options, render_outbox_email, send_email
+
+logger = logging.getLogger(__name__)
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """
+    Exponential backoff before the next attempt of an email that failed
+    attempts times.
+    """
+    return timedelta(
+        seconds=settings.EMAILS_OUTBOX_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1)
+    )
+
+
+class SMTPSender:
+    """
+    Sends the emails over one SMTP connection, opened on the first email and
+    reused until closed. A dropped connection is reopened on the next email.
+    """
+
+    def __init__(self) -> None:
+        self._backend: SMTPBackend | None = None
+
+    def send(self, email: OutboxEmail) -> Any:
+        if self._backend is None:
+            self._backend = SMTPBackend(**get_smtp_options())
+        email_data = render_outbox_email(
+            template_name=email.template_name,
+            email_to=email.email_to,
+            context=email.context,
+        )
+        response = send_email(
+            email_to=email.email_to,
+            subject=email_data.subject,
+            html_content=email_data.html_content,
+            smtp=self._backend,
+        )
+        if not response.success:
+            # Start over from a new connection after an error
+            self.close()
+        return response
+
+    def close(self) -> None:
+        if self._backend is not None:
+            self._backend.close()
+            self._backend = None
+
+
+def send_batch(session: Session, sender: SMTPSender) -> int:
+    """
+    Send the emails that are due, up to EMAILS_OUTBOX_BATCH_SIZE, and return
+    how many were claimed.
+    """
+    statement = (
+        select(OutboxEmail)
+        .where(col(OutboxEmail.next_attempt_at) <= func.now())
+        .order_by(col(OutboxEmail.next_attempt_at))
+        .limit(settings.EMAILS_OUTBOX_BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+    )
+    emails = session.exec(statement).all()
+    lease_expires = datetime.now(timezone.utc) + timedelta(
+        seconds=settings.EMAILS_OUTBOX_LEASE_SECONDS
+    )
+    for email in emails:
+        email.attempts += 1
+        email.next_attempt_at = lease_expires
+        session.add(email)
+    session.flush()
+    # Keep them loaded after the commit, they are only read from now on
+    session.expunge_all()
+    session.commit()
+
+    for email in emails:
+        try:
+            response = sender.send(email)
+            error = None if response.success else repr(response.error)
+        except Exception as e:
+            logger.exception("Failed to send an email to %s", email.email_to)
+            sender.close()
+            error = repr(e)
+        where = col(OutboxEmail.id) == email.id
+        if error is None:
+            outcome = "sent"
+            session.exec(delete(OutboxEmail).where(where))  # type: ignore
+        elif email.attempts >= settings.EMAILS_OUTBOX_MAX_ATTEMPTS:
+            outcome = "given_up"
+            logger.error(
+                "Giving up on an email to %s after %s attempts",
+                email.email_to,
+                email.attempts,
+            )
+            session.exec(
+                update(OutboxEmail)  # type: ignore
+                .where(where)
+                .values(last_error=error, next_attempt_at=None)
+            )
+        else:
+            outcome = "retried"
+            session.exec(
+                update(OutboxEmail)  # type: ignore
+                .where(where)
+                .values(
+                    last_error=error,
+                    next_attempt_at=datetime.now(timezone.utc)
+                    + retry_delay(email.attempts),
+                )
+            )
+        session.commit()
+        if settings.METRICS_ENABLED:
+            emails_sent_total.labels(outcome).inc()
+    return len(emails)
+
+
+def run(stop: threading.Event) -> None:
+    sender = SMTPSender()
+    try:
+        while not stop.is_set():
+            with Session(engine) as session:
+                claimed = send_batch(session, sender)
+            if not claimed:
+                # Don't keep the SMTP connection open while idle
+                sender.close()
+                stop.wait(settings.EMAILS_OUTBOX_POLL_INTERVAL_SECONDS)
+    finally:
+        sender.close()
+
+
+def main() -> None:
+    stop = threading.Event()
+    # Finish the batch being sent before exiting
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    if not settings.emails_enabled:
+        # Wait to be stopped rather than exit, which a restart policy would loop
+        logger.warning(
+            "Emails are not configured, set SMTP_HOST and EMAILS_FROM_EMAIL to "
+            "send them"
+        )
+        stop.wait()
+        return
+    if settings.METRICS_ENABLED and settings.EMAILS_WORKER_METRICS_PORT:
+        start_http_server(settings.EMAILS_WORKER_METRICS_PORT)
+    logger.info("Sending the emails of the outbox")
+    run(stop)
+
+
+if __name__ == "__main__":
+    main()
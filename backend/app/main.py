@@ -1,10 +1,19 @@
 import sentry_sdk
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.routing import APIRoute
 from starlette.middleware.cors import CORSMiddleware
 
+from app.api.deps import LAST_WRITE_HEADER
 from app.api.main import api_router
+from app.api.responses import FastJSONResponse
+from app.core.compression import CompressionMiddleware
 from app.core.config import settings
+from app.core.context import RequestContextMiddleware
+from app.core.db import leak_detector
+from app.core.leaks import LeakDetectionMiddleware
+from app.core.metrics import MetricsMiddleware, metrics
+from app.core.timing import TimingMiddleware
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
@@ -18,6 +27,9 @@ app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
+    default_response_class=(
+        FastJSONResponse if settings.FAST_JSON_RESPONSES else JSONResponse
+    ),
 )
 
 # Set all CORS enabled origins
@@ -28,6 +40,32 @@ if settings.all_cors_origins:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=[LAST_WRITE_HEADER],
     )
 
+if settings.COMPRESSION_ENCODINGS:
+    app.add_middleware(
+        CompressionMiddleware,
+        encodings=settings.COMPRESSION_ENCODINGS,
+        levels={
+            "gzip": settings.COMPRESSION_GZIP_LEVEL,
+            "br": settings.COMPRESSION_BROTLI_QUALITY,
+            "zstd": settings.COMPRESSION_ZSTD_LEVEL,
+        },
+        minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    )
+
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    app.add_route("/metrics", metrics, include_in_schema=False)
+
+if settings.SERVER_TIMING_SAMPLE_RATE > 0:
+    app.add_middleware(TimingMiddleware, sample_rate=settings.SERVER_TIMING_SAMPLE_RATE)
+
+if leak_detector is not None:
+    app.add_middleware(LeakDetectionMiddleware, detector=leak_detector)
+
+# Added last so it wraps the other middlewares and they can read the request
+app.add_middleware(RequestContextMiddleware)
+
 app.include_router(api_router, prefix=settings.API_V1_STR)
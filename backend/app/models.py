@@ -1,7 +1,11 @@
 import uuid
+from datetime import datetime, timezone
+from typing import Any
 
 from pydantic import EmailStr
-from sqlmodel import Field, Relationship, SQLModel
+from sqlalchemy import Column, Computed, DateTime, Integer, Text
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlmodel import Field, Index, Relationship, SQLModel
 
 
 # Shared properties
@@ -39,21 +43,38 @@ class UpdatePassword(SQLModel):
     new_password: str = Field(min_length=8, max_length=40)
 
 
+# Row version of the users, bumped by every update of the ORM, which checks it in
+# the WHERE clause of the update. It is the ETag of the user and If-Match takes it.
+user_version = Column("version", Integer, nullable=False, default=1, server_default="1")
+
+
 # Database model, database table inferred from class name
 class User(UserBase, table=True):
+    __mapper_args__ = {"version_id_col": user_version}
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     hashed_password: str
+    version: int = Field(default=1, sa_column=user_version)
     items: list["Item"] = Relationship(back_populates="owner", cascade_delete=True)
 
 
 # Properties to return via API, id is always required
 class UserPublic(UserBase):
     id: uuid.UUID
+    version: int
+
+
+# Properties the authorization checks need, cached between requests
+class UserAuth(SQLModel):
+    id: uuid.UUID
+    is_active: bool
+    is_superuser: bool
 
 
 class UsersPublic(SQLModel):
     data: list[UserPublic]
-    count: int
+    count: int | None
+    next_cursor: str | None = None
 
 
 # Shared properties
@@ -72,24 +93,103 @@ class ItemUpdate(ItemBase):
     title: str | None = Field(default=None, min_length=1, max_length=255)  # type: ignore
 
 
+# Row version of the items, as for the users. crud.update_item bumps it itself.
+item_version = Column("version", Integer, nullable=False, default=1, server_default="1")
+
+
 # Database model, database table inferred from class name
 class Item(ItemBase, table=True):
+    # Serves the keyset pagination of the items, per owner and for all owners
+    __table_args__ = (Index("ix_item_owner_id_id", "owner_id", "id"),)
+    __mapper_args__ = {"version_id_col": item_version}
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     owner_id: uuid.UUID = Field(
         foreign_key="user.id", nullable=False, ondelete="CASCADE"
     )
+    version: int = Field(default=1, sa_column=item_version)
     owner: User | None = Relationship(back_populates="items")
 
 
+# Text search configuration of the search vector, and of the search queries
+ITEM_SEARCH_CONFIG = "english"
+
+# Weighted words of the title and description, generated by Postgres for the
+# full-text search of the items. A column of the table but not a field of the
+# model, so that the model, its inserts and COPY leave it out.
+item_search_vector = Column(
+    "search_vector",
+    TSVECTOR,
+    Computed(
+        f"setweight(to_tsvector('{ITEM_SEARCH_CONFIG}', title), 'A') || "
+        f"setweight(to_tsvector('{ITEM_SEARCH_CONFIG}', "
+        "coalesce(description, '')), 'B')",
+        persisted=True,
+    ),
+)
+Item.__table__.append_column(item_search_vector)  # type: ignore[attr-defined]
+Index("ix_item_search_vector", item_search_vector, postgresql_using="gin")
+
+
+# Bumped by every write to the items of the owner, in the same statement, so
+# that the ETag of their item lists can be checked without reading the items
+class ItemChange(SQLModel, table=True):
+    __tablename__ = "item_change"
+
+    owner_id: uuid.UUID = Field(
+        foreign_key="user.id", primary_key=True, ondelete="CASCADE"
+    )
+    # Each owner has a counter per slot, the version of its items is their sum
+    slot: int = Field(default=0, primary_key=True)
+    version: int = 0
+
+
 # Properties to return via API, id is always required
 class ItemPublic(ItemBase):
     id: uuid.UUID
     owner_id: uuid.UUID
+    version: int
 
 
 class ItemsPublic(SQLModel):
     data: list[ItemPublic]
-    count: int
+    count: int | None
+    next_cursor: str | None = None
+
+
+# Entry of a batch get, with the item or why it couldn't be returned
+class ItemsBatchEntry(SQLModel):
+    id: uuid.UUID
+    item: ItemPublic | None = None
+    error: str | None = None
+
+
+class ItemsBatchPublic(SQLModel):
+    data: list[ItemsBatchEntry]
+
+
+# Email waiting to be sent by app.email_worker, written in the transaction of the
+# change it is about. next_attempt_at is null once the worker gave up on it.
+class OutboxEmail(SQLModel, table=True):
+    __tablename__ = "email_outbox"
+
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    email_to: str = Field(max_length=255)
+    # Rendered when sent by app.utils.render_outbox_email, so that the secrets
+    # of the email, like reset tokens, are never stored
+    template_name: str = Field(max_length=255)
+    context: dict[str, Any] = Field(default_factory=dict, sa_type=JSONB)
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_type=DateTime(timezone=True),  # type: ignore[call-overload]
+    )
+    attempts: int = 0
+    next_attempt_at: datetime | None = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_type=DateTime(timezone=True),  # type: ignore[call-overload]
+        index=True,
+    )
+    last_error: str | None = Field(default=None, sa_type=Text)
 
 
 # Generic message
@@ -97,6 +197,39 @@ class Message(SQLModel):
     message: str
 
 
+# Database connection reported by the leak detector
+class ConnectionCheckoutPublic(SQLModel):
+    request_method: str | None
+    request_path: str | None
+    thread: str
+    checked_out_at: datetime
+    held_seconds: float
+    checked_in: bool
+    leaked: bool
+    stack: list[str]
+
+
+class ConnectionCheckoutsPublic(SQLModel):
+    data: list[ConnectionCheckoutPublic]
+    count: int
+
+
+class SlowQueryPublic(SQLModel):
+    statement: str
+    parameters: Any
+    duration_ms: float
+    request_method: str | None
+    request_path: str | None
+    caller: str | None
+    logged_at: datetime
+    plan: Any | None
+
+
+class SlowQueriesPublic(SQLModel):
+    data: list[SlowQueryPublic]
+    count: int
+
+
 # JSON payload containing access token
 class Token(SQLModel):
     access_token: str
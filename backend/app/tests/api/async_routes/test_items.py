@@ -0,0 +1,401 @@
+import json
+import uuid
+from collections.abc import Callable
+from contextlib import AbstractContextManager
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app import crud
+from app.core.auth_cache import user_auth_cache
+from app.core.config import settings
+from app.core.queries import QueryLog
+from app.crud import count_cache
+from app.models import ItemCreate
+from app.tests.utils.item import create_random_item
+from app.tests.utils.user import create_random_user
+from app.tests.utils.utils import random_lower_string
+
+
+def test_create_item(
+    async_client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    data = {"title": "Foo", "description": "Fighters"}
+    response = async_client.post(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        json=data,
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["title"] == data["title"]
+    assert content["description"] == data["description"]
+    assert "id" in content
+    assert "owner_id" in content
+
+
+def test_read_item(
+    async_client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    response = async_client.get(
+        f"{settings.API_V1_STR}/items/{item.id}",
+        headers=superuser_token_headers,
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["title"] == item.title
+    assert content["id"] == str(item.id)
+    assert content["owner_id"] == str(item.owner_id)
+
+
+def test_read_item_not_found(
+    async_client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    response = async_client.get(
+        f"{settings.API_V1_STR}/items/{uuid.uuid4()}",
+        headers=superuser_token_headers,
+    )
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Item not found"
+
+
+def test_read_item_not_enough_permissions(
+    async_client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    response = async_client.get(
+        f"{settings.API_V1_STR}/items/{item.id}",
+        headers=normal_user_token_headers,
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Not enough permissions"
+
+
+def test_read_items(
+    async_client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    create_random_item(db)
+    create_random_item(db)
+    response = async_client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert len(content["data"]) >= 2
+    assert content["count"] >= 2
+
+
+def test_read_items_num_queries(
+    async_client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    assert_num_queries: Callable[[int], AbstractContextManager[QueryLog]],
+) -> None:
+    user_auth_cache.clear()
+    count_cache.clear()
+    # The current user, the version of their items, the count and the page
+    with assert_num_queries(4):
+        response = async_client.get(
+            f"{settings.API_V1_STR}/items/", headers=normal_user_token_headers
+        )
+    assert response.status_code == 200
+    # Both cached
+    with assert_num_queries(2):
+        async_client.get(
+            f"{settings.API_V1_STR}/items/", headers=normal_user_token_headers
+        )
+    # Unchanged, only the version
+    with assert_num_queries(1):
+        response = async_client.get(
+            f"{settings.API_V1_STR}/items/",
+            headers={
+                **normal_user_token_headers,
+                "If-None-Match": response.headers["ETag"],
+            },
+        )
+    assert response.status_code == 304
+
+
+def test_read_item_num_queries(
+    async_client: TestClient,
+    superuser_token_headers: dict[str, str],
+    db: Session,
+    assert_num_queries: Callable[[int], AbstractContextManager[QueryLog]],
+) -> None:
+    item = create_random_item(db)
+    user_auth_cache.clear()
+    with assert_num_queries(2):
+        response = async_client.get(
+            f"{settings.API_V1_STR}/items/{item.id}",
+            headers=superuser_token_headers,
+        )
+    assert response.status_code == 200
+
+
+def test_read_items_not_modified_until_written(
+    async_client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    url = f"{settings.API_V1_STR}/items/"
+    etag = async_client.get(url, headers=normal_user_token_headers).headers["etag"]
+    headers = {**normal_user_token_headers, "If-None-Match": etag}
+    assert async_client.get(url, headers=headers).status_code == 304
+
+    async_client.post(url, headers=normal_user_token_headers, json={"title": "Foo"})
+    assert async_client.get(url, headers=headers).status_code == 200
+
+
+def test_read_items_batch(
+    async_client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+    assert_num_queries: Callable[[int], AbstractContextManager[QueryLog]],
+) -> None:
+    own = [
+        async_client.post(
+            f"{settings.API_V1_STR}/items/",
+            headers=normal_user_token_headers,
+            json={"title": f"Item {i}"},
+        ).json()
+        for i in range(2)
+    ]
+    other = create_random_item(db)
+    missing = uuid.uuid4()
+    ids = [own[1]["id"], str(missing), own[0]["id"], str(other.id), own[1]["id"]]
+    # The items, then whether the others exist
+    with assert_num_queries(2):
+        response = async_client.get(
+            f"{settings.API_V1_STR}/items/batch",
+            headers=normal_user_token_headers,
+            params={"ids": ids},
+        )
+    assert response.status_code == 200
+    assert response.json()["data"] == [
+        {"id": own[1]["id"], "item": own[1], "error": None},
+        {"id": str(missing), "item": None, "error": "Item not found"},
+        {"id": own[0]["id"], "item": own[0], "error": None},
+        {"id": str(other.id), "item": None, "error": "Not enough permissions"},
+        {"id": own[1]["id"], "item": own[1], "error": None},
+    ]
+
+
+def test_read_items_batch_superuser(
+    async_client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    response = async_client.get(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=superuser_token_headers,
+        params={"ids": [str(item.id)]},
+    )
+    assert response.status_code == 200
+    [entry] = response.json()["data"]
+    assert entry["item"]["title"] == item.title
+
+
+def test_read_items_batch_too_many(
+    async_client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    ids = [str(uuid.uuid4()) for _ in range(settings.ITEMS_BATCH_MAX_SIZE + 1)]
+    response = async_client.get(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=superuser_token_headers,
+        params={"ids": ids},
+    )
+    assert response.status_code == 422
+
+
+def test_read_items_cursor(
+    async_client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    create_random_item(db)
+    create_random_item(db)
+    response = async_client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"cursor": "", "limit": 1},
+    )
+    assert response.status_code == 200
+    first_page = response.json()
+    assert len(first_page["data"]) == 1
+    response = async_client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"cursor": first_page["next_cursor"], "limit": 1},
+    )
+    assert response.status_code == 200
+    second_page = response.json()
+    assert len(second_page["data"]) == 1
+    assert second_page["data"][0]["id"] != first_page["data"][0]["id"]
+
+
+def test_read_items_search(
+    async_client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    word = random_lower_string()
+    in_description = async_client.post(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        json={"title": "Lamp", "description": f"A lamp, or a {word}"},
+    ).json()
+    in_title = async_client.post(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        json={"title": f"Blue {word}"},
+    ).json()
+    crud.create_item(
+        session=db,
+        item_in=ItemCreate(title=word),
+        owner_id=create_random_user(db).id,
+    )
+    response = async_client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        params={"q": word},
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["data"] == [in_title, in_description]
+    assert content["count"] == 2
+
+    response = async_client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        params={"q": word, "cursor": ""},
+    )
+    assert response.status_code == 400
+
+
+def test_create_items_bulk(
+    async_client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    data = [{"title": f"Bulk {i}"} for i in range(3)]
+    response = async_client.post(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=normal_user_token_headers,
+        json=data,
+    )
+    assert response.status_code == 200
+    assert [item["title"] for item in response.json()] == [
+        item["title"] for item in data
+    ]
+
+
+def test_create_items_bulk_copy(
+    async_client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "ITEMS_BULK_COPY_THRESHOLD", 2)
+    data = [{"title": f"Copy {i}"} for i in range(3)]
+    response = async_client.post(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=normal_user_token_headers,
+        json=data,
+    )
+    assert response.status_code == 200
+    for item in response.json():
+        r = async_client.get(
+            f"{settings.API_V1_STR}/items/{item['id']}",
+            headers=normal_user_token_headers,
+        )
+        assert r.status_code == 200
+
+
+def test_export_items(
+    async_client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    async_client.post(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=normal_user_token_headers,
+        json=[{"title": f"Export {i}"} for i in range(3)],
+    )
+    response = async_client.get(
+        f"{settings.API_V1_STR}/items/", headers=normal_user_token_headers
+    )
+    own_items = response.json()["data"]
+    response = async_client.get(
+        f"{settings.API_V1_STR}/items/export", headers=normal_user_token_headers
+    )
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert rows == own_items
+
+
+def test_update_item(
+    async_client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    data = {"title": "Updated title", "description": "Updated description"}
+    response = async_client.put(
+        f"{settings.API_V1_STR}/items/{item.id}",
+        headers=superuser_token_headers,
+        json=data,
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["title"] == data["title"]
+    assert content["description"] == data["description"]
+
+
+def test_update_item_if_match(
+    async_client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    item = async_client.post(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        json={"title": "Foo"},
+    ).json()
+    url = f"{settings.API_V1_STR}/items/{item['id']}"
+    headers = {**normal_user_token_headers, "If-Match": '"1"'}
+    response = async_client.put(url, headers=headers, json={"title": "Bar"})
+    assert response.status_code == 200
+    assert response.headers["etag"] == '"2"'
+    response = async_client.put(url, headers=headers, json={"title": "Baz"})
+    assert response.status_code == 412
+
+
+def test_delete_item(
+    async_client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    response = async_client.delete(
+        f"{settings.API_V1_STR}/items/{item.id}",
+        headers=superuser_token_headers,
+    )
+    assert response.status_code == 200
+    assert response.json()["message"] == "Item deleted successfully"
+    response = async_client.get(
+        f"{settings.API_V1_STR}/items/{item.id}",
+        headers=superuser_token_headers,
+    )
+    assert response.status_code == 404
+
+
+def test_update_and_delete_item_num_queries(
+    async_client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    assert_num_queries: Callable[[int], AbstractContextManager[QueryLog]],
+) -> None:
+    response = async_client.post(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        json={"title": "Foo"},
+    )
+    item = response.json()
+    # The owner is checked by the UPDATE and DELETE themselves
+    with assert_num_queries(1):
+        response = async_client.put(
+            f"{settings.API_V1_STR}/items/{item['id']}",
+            headers=normal_user_token_headers,
+            json={"title": "Updated title"},
+        )
+    assert response.status_code == 200
+    assert response.json() == {**item, "title": "Updated title", "version": 2}
+    with assert_num_queries(1):
+        response = async_client.delete(
+            f"{settings.API_V1_STR}/items/{item['id']}",
+            headers=normal_user_token_headers,
+        )
+    assert response.status_code == 200
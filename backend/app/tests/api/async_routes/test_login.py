@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app import async_crud, crud
+from app.core.config import settings
+from app.core.security import verify_password, verify_password_async
+from app.models import UserCreate
+from app.tests.utils.utils import random_email, random_lower_string
+from app.utils import generate_password_reset_token
+
+
+def test_get_access_token(async_client: TestClient) -> None:
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    r = async_client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    tokens = r.json()
+    assert r.status_code == 200
+    assert "access_token" in tokens
+    assert tokens["access_token"]
+
+
+async def slow_verify_password(plain_password: str, hashed_password: str) -> bool:
+    await asyncio.sleep(0.3)
+    return await verify_password_async(plain_password, hashed_password)
+
+
+def test_get_access_token_connection_released_before_hashing(
+    async_client: TestClient,
+    checkout_durations: list[float],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(async_crud, "verify_password_async", slow_verify_password)
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    r = async_client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    assert r.status_code == 200
+    assert checkout_durations
+    assert max(checkout_durations) < 0.3
+
+
+def test_get_access_token_incorrect_password(async_client: TestClient) -> None:
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": "incorrect",
+    }
+    r = async_client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    assert r.status_code == 400
+
+
+def test_use_access_token(
+    async_client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = async_client.post(
+        f"{settings.API_V1_STR}/login/test-token",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    assert "email" in r.json()
+
+
+def test_reset_password(async_client: TestClient, db: Session) -> None:
+    email = random_email()
+    user = crud.create_user(
+        session=db,
+        user_create=UserCreate(email=email, password=random_lower_string()),
+    )
+    new_password = random_lower_string()
+    token = generate_password_reset_token(email=email)
+    r = async_client.post(
+        f"{settings.API_V1_STR}/reset-password/",
+        json={"new_password": new_password, "token": token},
+    )
+    assert r.status_code == 200
+    assert r.json() == {"message": "Password updated successfully"}
+    db.refresh(user)
+    assert verify_password(new_password, user.hashed_password)
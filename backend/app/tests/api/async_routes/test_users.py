@@ -0,0 +1,168 @@
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from app import crud
+from app.core.config import settings
+from app.core.security import verify_password
+from app.models import User, UserCreate
+from app.tests.utils.utils import random_email, random_lower_string
+
+
+def test_get_users_superuser_me(
+    async_client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = async_client.get(
+        f"{settings.API_V1_STR}/users/me", headers=superuser_token_headers
+    )
+    current_user = r.json()
+    assert current_user
+    assert current_user["is_active"] is True
+    assert current_user["is_superuser"]
+    assert current_user["email"] == settings.FIRST_SUPERUSER
+
+
+def test_read_users(
+    async_client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    crud.create_user(
+        session=db,
+        user_create=UserCreate(email=random_email(), password=random_lower_string()),
+    )
+    r = async_client.get(
+        f"{settings.API_V1_STR}/users/", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    assert len(r.json()["data"]) > 1
+
+
+def test_read_users_normal_user(
+    async_client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = async_client.get(
+        f"{settings.API_V1_STR}/users/", headers=normal_user_token_headers
+    )
+    assert r.status_code == 403
+
+
+def test_create_user(
+    async_client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    username = random_email()
+    data = {"email": username, "password": random_lower_string()}
+    r = async_client.post(
+        f"{settings.API_V1_STR}/users/", headers=superuser_token_headers, json=data
+    )
+    assert r.status_code == 200
+    user = crud.get_user_by_email(session=db, email=username)
+    assert user
+    assert user.email == r.json()["email"]
+
+
+def test_register_and_update_password_me(async_client: TestClient) -> None:
+    username = random_email()
+    password = random_lower_string()
+    r = async_client.post(
+        f"{settings.API_V1_STR}/users/signup",
+        json={"email": username, "password": password},
+    )
+    assert r.status_code == 200
+    r = async_client.post(
+        f"{settings.API_V1_STR}/login/access-token",
+        data={"username": username, "password": password},
+    )
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    new_password = random_lower_string()
+    r = async_client.patch(
+        f"{settings.API_V1_STR}/users/me/password",
+        headers=headers,
+        json={"current_password": password, "new_password": new_password},
+    )
+    assert r.status_code == 200
+    assert r.json()["message"] == "Password updated successfully"
+
+
+def test_update_user_me(
+    async_client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    full_name = "Updated Name"
+    r = async_client.patch(
+        f"{settings.API_V1_STR}/users/me",
+        headers=normal_user_token_headers,
+        json={"full_name": full_name},
+    )
+    assert r.status_code == 200
+    assert r.json()["full_name"] == full_name
+    user_db = db.exec(select(User).where(User.email == settings.EMAIL_TEST_USER)).one()
+    db.refresh(user_db)
+    assert user_db.full_name == full_name
+
+
+def test_update_user(
+    async_client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user = crud.create_user(
+        session=db,
+        user_create=UserCreate(email=random_email(), password=random_lower_string()),
+    )
+    new_password = random_lower_string()
+    r = async_client.patch(
+        f"{settings.API_V1_STR}/users/{user.id}",
+        headers=superuser_token_headers,
+        json={"full_name": "Updated_full_name", "password": new_password},
+    )
+    assert r.status_code == 200
+    assert r.json()["full_name"] == "Updated_full_name"
+    db.refresh(user)
+    assert verify_password(new_password, user.hashed_password)
+
+
+def test_update_user_if_match(
+    async_client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user = crud.create_user(
+        session=db,
+        user_create=UserCreate(email=random_email(), password=random_lower_string()),
+    )
+    url = f"{settings.API_V1_STR}/users/{user.id}"
+    headers = {**superuser_token_headers, "If-Match": '"1"'}
+    r = async_client.patch(url, headers=headers, json={"full_name": "First"})
+    assert r.status_code == 200
+    assert r.headers["etag"] == '"2"'
+    r = async_client.patch(url, headers=headers, json={"full_name": "Second"})
+    assert r.status_code == 412
+
+
+def test_delete_user_super_user(
+    async_client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user = crud.create_user(
+        session=db,
+        user_create=UserCreate(email=random_email(), password=random_lower_string()),
+    )
+    user_id = user.id
+    r = async_client.delete(
+        f"{settings.API_V1_STR}/users/{user_id}", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    assert r.json()["message"] == "User deleted successfully"
+    db.expire_all()
+    assert db.get(User, user_id) is None
+
+
+def test_delete_user_me(async_client: TestClient, db: Session) -> None:
+    username = random_email()
+    password = random_lower_string()
+    user = crud.create_user(
+        session=db, user_create=UserCreate(email=username, password=password)
+    )
+    user_id = user.id
+    r = async_client.post(
+        f"{settings.API_V1_STR}/login/access-token",
+        data={"username": username, "password": password},
+    )
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    r = async_client.delete(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 200
+    db.expire_all()
+    assert db.get(User, user_id) is None
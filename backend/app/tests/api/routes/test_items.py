@@ -1,10 +1,28 @@
+import base64
+import csv
+import io
+import json
 import uuid
+from collections.abc import Callable
+from contextlib import AbstractContextManager
 
+import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import Engine, event
 from sqlmodel import Session
 
+from app import crud
+from app.api.deps import LAST_WRITE_COOKIE, LAST_WRITE_HEADER
+from app.api.pagination import encode_cursor
+from app.core.auth_cache import user_auth_cache
 from app.core.config import settings
+from app.core.db import engine
+from app.core.queries import QueryLog
+from app.crud import count_cache
+from app.models import Item, ItemCreate, UserCreate
 from app.tests.utils.item import create_random_item
+from app.tests.utils.user import create_random_user, user_authentication_headers
+from app.tests.utils.utils import random_email, random_lower_string
 
 
 def test_create_item(
@@ -79,6 +97,452 @@ def test_read_items(
     assert len(content["data"]) >= 2
 
 
+def test_read_items_num_queries(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    assert_num_queries: Callable[[int], AbstractContextManager[QueryLog]],
+) -> None:
+    user_auth_cache.clear()
+    count_cache.clear()
+    # The current user, the version of their items, the count and the page
+    with assert_num_queries(4):
+        response = client.get(
+            f"{settings.API_V1_STR}/items/", headers=normal_user_token_headers
+        )
+    assert response.status_code == 200
+    # Both cached
+    with assert_num_queries(2):
+        client.get(f"{settings.API_V1_STR}/items/", headers=normal_user_token_headers)
+    # Unchanged, only the version
+    with assert_num_queries(1):
+        response = client.get(
+            f"{settings.API_V1_STR}/items/",
+            headers={
+                **normal_user_token_headers,
+                "If-None-Match": response.headers["ETag"],
+            },
+        )
+    assert response.status_code == 304
+
+
+def test_read_item_num_queries(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    db: Session,
+    assert_num_queries: Callable[[int], AbstractContextManager[QueryLog]],
+) -> None:
+    item = create_random_item(db)
+    user_auth_cache.clear()
+    with assert_num_queries(2):
+        response = client.get(
+            f"{settings.API_V1_STR}/items/{item.id}",
+            headers=superuser_token_headers,
+        )
+    assert response.status_code == 200
+
+
+def test_read_item_not_modified(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    url = f"{settings.API_V1_STR}/items/{item.id}"
+    r = client.get(url, headers=superuser_token_headers)
+    etag = r.headers["etag"]
+    headers = {**superuser_token_headers, "If-None-Match": etag}
+    assert client.get(url, headers=headers).status_code == 304
+
+    client.put(url, headers=superuser_token_headers, json={"title": "Updated"})
+    r = client.get(url, headers=headers)
+    assert r.status_code == 200
+    assert r.json()["title"] == "Updated"
+
+
+def test_read_items_not_modified_until_written(client: TestClient, db: Session) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user = crud.create_user(
+        session=db, user_create=UserCreate(email=email, password=password)
+    )
+    item = crud.create_item(
+        session=db, item_in=ItemCreate(title="Foo"), owner_id=user.id
+    )
+    headers = user_authentication_headers(client=client, email=email, password=password)
+    url = f"{settings.API_V1_STR}/items/"
+    r = client.get(url, headers=headers)
+    assert r.headers["cache-control"] == "private, no-cache"
+    etag = r.headers["etag"]
+    assert (
+        client.get(url, headers={**headers, "If-None-Match": etag}).status_code == 304
+    )
+    # Another page
+    r = client.get(url, headers={**headers, "If-None-Match": etag}, params={"limit": 1})
+    assert r.status_code == 200
+    # Another owner's write
+    create_random_item(db)
+    assert (
+        client.get(url, headers={**headers, "If-None-Match": etag}).status_code == 304
+    )
+
+    client.delete(f"{url}{item.id}", headers=headers)
+    r = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.json()["data"] == []
+
+
+def test_read_items_batch(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+    assert_num_queries: Callable[[int], AbstractContextManager[QueryLog]],
+) -> None:
+    own = [
+        client.post(
+            f"{settings.API_V1_STR}/items/",
+            headers=normal_user_token_headers,
+            json={"title": f"Item {i}"},
+        ).json()
+        for i in range(2)
+    ]
+    other = create_random_item(db)
+    missing = uuid.uuid4()
+    ids = [own[1]["id"], str(missing), own[0]["id"], str(other.id), own[1]["id"]]
+    # The items, then whether the others exist
+    with assert_num_queries(2):
+        response = client.get(
+            f"{settings.API_V1_STR}/items/batch",
+            headers=normal_user_token_headers,
+            params={"ids": ids},
+        )
+    assert response.status_code == 200
+    assert response.json()["data"] == [
+        {"id": own[1]["id"], "item": own[1], "error": None},
+        {"id": str(missing), "item": None, "error": "Item not found"},
+        {"id": own[0]["id"], "item": own[0], "error": None},
+        {"id": str(other.id), "item": None, "error": "Not enough permissions"},
+        {"id": own[1]["id"], "item": own[1], "error": None},
+    ]
+
+
+def test_read_items_batch_superuser(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=superuser_token_headers,
+        params={"ids": [str(item.id)]},
+    )
+    assert response.status_code == 200
+    [entry] = response.json()["data"]
+    assert entry["item"]["title"] == item.title
+
+
+def test_read_items_batch_too_many(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    ids = [str(uuid.uuid4()) for _ in range(settings.ITEMS_BATCH_MAX_SIZE + 1)]
+    response = client.get(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=superuser_token_headers,
+        params={"ids": ids},
+    )
+    assert response.status_code == 422
+
+
+def test_read_items_cursor(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    for i in range(5):
+        client.post(
+            f"{settings.API_V1_STR}/items/",
+            headers=normal_user_token_headers,
+            json={"title": f"Item {i}"},
+        )
+    ids: list[str] = []
+    cursor = ""
+    while True:
+        response = client.get(
+            f"{settings.API_V1_STR}/items/",
+            headers=normal_user_token_headers,
+            params={"cursor": cursor, "limit": 2},
+        )
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page["data"]) <= 2
+        ids += [item["id"] for item in page["data"]]
+        if not page["next_cursor"]:
+            break
+        cursor = page["next_cursor"]
+
+    assert len(ids) == page["count"]
+    assert ids == sorted(ids)
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not-a-cursor",
+        encode_cursor(["a"]),
+        base64.urlsafe_b64encode(b"[1, 2]").decode(),
+        base64.urlsafe_b64encode(b'{"a": 1}').decode(),
+    ],
+)
+def test_read_items_invalid_cursor(
+    client: TestClient, normal_user_token_headers: dict[str, str], cursor: str
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        params={"cursor": cursor},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_read_items_cursor_empty_page(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        params={"cursor": "", "limit": 0},
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["data"] == []
+    assert content["next_cursor"] is None
+
+
+def test_read_items_search(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    word = random_lower_string()
+    in_description = client.post(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        json={"title": "Lamp", "description": f"A lamp, or a {word}"},
+    ).json()
+    in_title = client.post(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        json={"title": f"Blue {word}"},
+    ).json()
+    # Matches, but belongs to another user
+    crud.create_item(
+        session=db,
+        item_in=ItemCreate(title=word),
+        owner_id=create_random_user(db).id,
+    )
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        params={"q": f"{word} -unicorn"},
+    )
+    assert response.status_code == 200
+    content = response.json()
+    # The title weighs more than the description
+    assert content["data"] == [in_title, in_description]
+    assert content["count"] == 2
+    assert content["next_cursor"] is None
+
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        params={"q": word, "skip": 1, "limit": 1, "count_mode": "none"},
+    )
+    content = response.json()
+    assert content["data"] == [in_description]
+    assert content["count"] is None
+
+
+def test_read_items_search_cursor(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        params={"q": "lamp", "cursor": ""},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Searches can't be paged with a cursor"
+
+
+def test_search_items_statement_trigram(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "ITEMS_SEARCH_TRIGRAM", True)
+    compiled = crud.search_items_statement("50%_off", None).compile(engine)
+    assert "item.title ILIKE" in str(compiled)
+    assert "similarity(item.title" in str(compiled)
+    assert r"50\%\_off%" in compiled.params.values()
+
+
+def test_read_items_count_mode(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    create_random_item(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"count_mode": "none"},
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["count"] is None
+    assert len(content["data"]) >= 1
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"count_mode": "estimated"},
+    )
+    assert response.status_code == 200
+    assert response.json()["count"] >= 0
+
+
+def test_read_items_count_after_create(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/items/", headers=normal_user_token_headers
+    )
+    count = response.json()["count"]
+    client.post(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        json={"title": "Foo"},
+    )
+    response = client.get(
+        f"{settings.API_V1_STR}/items/", headers=normal_user_token_headers
+    )
+    assert response.json()["count"] == count + 1
+
+
+def test_create_items_bulk(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    data = [{"title": f"Bulk {i}", "description": "Fighters"} for i in range(3)]
+    response = client.post(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=normal_user_token_headers,
+        json=data,
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert [item["title"] for item in content] == [item["title"] for item in data]
+    assert len({item["id"] for item in content}) == 3
+    assert len({item["owner_id"] for item in content}) == 1
+
+
+def test_create_items_bulk_ndjson(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    lines = [json.dumps({"title": f"Bulk {i}"}) for i in range(3)]
+    response = client.post(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers={**normal_user_token_headers, "Content-Type": "application/x-ndjson"},
+        content="\n".join(lines) + "\n",
+    )
+    assert response.status_code == 200
+    assert [item["title"] for item in response.json()] == [
+        "Bulk 0",
+        "Bulk 1",
+        "Bulk 2",
+    ]
+
+
+def test_create_items_bulk_copy(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "ITEMS_BULK_COPY_THRESHOLD", 2)
+    data = [{"title": f"Copy {i}"} for i in range(3)]
+    response = client.post(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=normal_user_token_headers,
+        json=data,
+    )
+    assert response.status_code == 200
+    for item in response.json():
+        r = client.get(
+            f"{settings.API_V1_STR}/items/{item['id']}",
+            headers=normal_user_token_headers,
+        )
+        assert r.status_code == 200
+        assert r.json()["title"] == item["title"]
+
+
+def test_create_items_bulk_invalid(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=normal_user_token_headers,
+        json=[{"title": "Foo"}, {"description": "No title"}],
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == [1, "title"]
+
+
+def test_create_items_bulk_too_many(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "ITEMS_BULK_MAX_SIZE", 2)
+    response = client.post(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=normal_user_token_headers,
+        json=[{"title": f"Bulk {i}"} for i in range(3)],
+    )
+    assert response.status_code == 413
+    assert response.json()["detail"] == "Too many items, the limit is 2"
+
+
+def test_export_items(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    create_random_item(db)
+    client.post(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=normal_user_token_headers,
+        json=[{"title": f"Export {i}"} for i in range(3)],
+    )
+    response = client.get(
+        f"{settings.API_V1_STR}/items/", headers=normal_user_token_headers
+    )
+    own_items = response.json()["data"]
+    response = client.get(
+        f"{settings.API_V1_STR}/items/export", headers=normal_user_token_headers
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert rows == own_items
+
+
+def test_export_items_csv(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    client.post(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        json={"title": "Foo, Bar", "description": "Fighters"},
+    )
+    response = client.get(
+        f"{settings.API_V1_STR}/items/export",
+        headers=normal_user_token_headers,
+        params={"format": "csv"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert 'filename="items.csv"' in response.headers["content-disposition"]
+    reader = csv.DictReader(io.StringIO(response.text))
+    assert reader.fieldnames == ["title", "description", "id", "owner_id", "version"]
+    assert any(
+        row["title"] == "Foo, Bar" and row["description"] == "Fighters"
+        for row in reader
+    )
+
+
 def test_update_item(
     client: TestClient, superuser_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -97,6 +561,63 @@ def test_update_item(
     assert content["owner_id"] == str(item.owner_id)
 
 
+def test_update_item_if_match(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    item = client.post(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        json={"title": "Foo"},
+    ).json()
+    url = f"{settings.API_V1_STR}/items/{item['id']}"
+    etag = client.get(url, headers=normal_user_token_headers).headers["etag"]
+    assert etag == '"1"'
+
+    response = client.put(
+        url,
+        headers={**normal_user_token_headers, "If-Match": etag},
+        json={"title": "Bar"},
+    )
+    assert response.status_code == 200
+    assert response.json()["version"] == 2
+    assert response.headers["etag"] == '"2"'
+    # A concurrent update with the same version loses
+    response = client.put(
+        url,
+        headers={**normal_user_token_headers, "If-Match": etag},
+        json={"title": "Baz"},
+    )
+    assert response.status_code == 412
+    assert response.json()["detail"] == "Item version doesn't match If-Match"
+    for if_match in ['W/"2"', '"7", "3"', "*"]:
+        response = client.put(
+            url,
+            headers={**normal_user_token_headers, "If-Match": if_match},
+            json={"title": "Baz"},
+        )
+        assert response.status_code == 200
+    response = client.put(
+        url,
+        headers={**normal_user_token_headers, "If-Match": '"abc"'},
+        json={"title": "Qux"},
+    )
+    assert response.status_code == 412
+    assert client.get(url, headers=normal_user_token_headers).json()["title"] == "Baz"
+
+
+def test_update_item_if_match_not_found(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    for id, status_code in [(item.id, 400), (uuid.uuid4(), 404)]:
+        response = client.put(
+            f"{settings.API_V1_STR}/items/{id}",
+            headers={**normal_user_token_headers, "If-Match": '"1"'},
+            json={"title": "Foo"},
+        )
+        assert response.status_code == status_code
+
+
 def test_update_item_not_found(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
@@ -124,6 +645,9 @@ def test_update_item_not_enough_permissions(
     assert response.status_code == 400
     content = response.json()
     assert content["detail"] == "Not enough permissions"
+    db_item = db.get(Item, item.id)
+    assert db_item
+    assert db_item.title == item.title
 
 
 def test_delete_item(
@@ -139,6 +663,34 @@ def test_delete_item(
     assert content["message"] == "Item deleted successfully"
 
 
+def test_update_and_delete_item_num_queries(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    assert_num_queries: Callable[[int], AbstractContextManager[QueryLog]],
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        json={"title": "Foo"},
+    )
+    item = response.json()
+    # The owner is checked by the UPDATE and DELETE themselves
+    with assert_num_queries(1):
+        response = client.put(
+            f"{settings.API_V1_STR}/items/{item['id']}",
+            headers=normal_user_token_headers,
+            json={"title": "Updated title"},
+        )
+    assert response.status_code == 200
+    assert response.json() == {**item, "title": "Updated title", "version": 2}
+    with assert_num_queries(1):
+        response = client.delete(
+            f"{settings.API_V1_STR}/items/{item['id']}",
+            headers=normal_user_token_headers,
+        )
+    assert response.status_code == 200
+
+
 def test_delete_item_not_found(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
@@ -162,3 +714,100 @@ def test_delete_item_not_enough_permissions(
     assert response.status_code == 400
     content = response.json()
     assert content["detail"] == "Not enough permissions"
+
+
+def test_read_items_uses_replica(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    replica_engine: Engine,
+) -> None:
+    checkouts = []
+    event.listen(replica_engine, "checkout", lambda *args: checkouts.append(args))
+    client.cookies.clear()
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+    )
+    assert response.status_code == 200
+    assert checkouts
+
+
+def test_read_items_after_write_uses_primary(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    replica_engine: Engine,
+) -> None:
+    checkouts = []
+    event.listen(replica_engine, "checkout", lambda *args: checkouts.append(args))
+    client.cookies.clear()
+    response = client.post(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        json={"title": "Foo", "description": "Fighters"},
+    )
+    assert response.status_code == 200
+    assert LAST_WRITE_COOKIE in response.cookies
+    item_id = response.json()["id"]
+
+    response = client.get(
+        f"{settings.API_V1_STR}/items/{item_id}",
+        headers=normal_user_token_headers,
+    )
+    assert response.status_code == 200
+    assert not checkouts
+    client.cookies.clear()
+
+
+def test_read_items_after_write_header_uses_primary(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    replica_engine: Engine,
+) -> None:
+    checkouts = []
+    event.listen(replica_engine, "checkout", lambda *args: checkouts.append(args))
+    client.cookies.clear()
+    response = client.post(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        json={"title": "Foo", "description": "Fighters"},
+    )
+    assert response.status_code == 200
+    last_write = response.headers[LAST_WRITE_HEADER]
+    item_id = response.json()["id"]
+
+    # Without cookies, as the clients calling the API from another origin
+    client.cookies.clear()
+    response = client.get(
+        f"{settings.API_V1_STR}/items/{item_id}",
+        headers={**normal_user_token_headers, LAST_WRITE_HEADER: last_write},
+    )
+    assert response.status_code == 200
+    assert not checkouts
+
+    response = client.get(
+        f"{settings.API_V1_STR}/items/{item_id}",
+        headers={**normal_user_token_headers, LAST_WRITE_HEADER: "invalid"},
+    )
+    assert response.status_code == 200
+    assert checkouts
+
+
+@pytest.mark.usefixtures("replica_engine")
+@pytest.mark.parametrize("copy_threshold", [1000, 1])
+def test_read_items_after_bulk_write_uses_primary(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+    copy_threshold: int,
+) -> None:
+    monkeypatch.setattr(settings, "ITEMS_BULK_COPY_THRESHOLD", copy_threshold)
+    client.cookies.clear()
+    response = client.post(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=normal_user_token_headers,
+        json=[{"title": "Foo"}, {"title": "Bar"}],
+    )
+    assert response.status_code == 200
+    assert LAST_WRITE_HEADER in response.headers
+    assert LAST_WRITE_COOKIE in response.cookies
+    client.cookies.clear()
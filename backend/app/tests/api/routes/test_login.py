@@ -1,12 +1,15 @@
+import time
 from unittest.mock import patch
 
+import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session
+from sqlmodel import Session, select
 
+from app import crud
 from app.core.config import settings
 from app.core.security import verify_password
 from app.crud import create_user
-from app.models import UserCreate
+from app.models import OutboxEmail, UserCreate
 from app.tests.utils.user import user_authentication_headers
 from app.tests.utils.utils import random_email, random_lower_string
 from app.utils import generate_password_reset_token
@@ -33,6 +36,30 @@ def test_get_access_token_incorrect_password(client: TestClient) -> None:
     assert r.status_code == 400
 
 
+def slow_verify_password(plain_password: str, hashed_password: str) -> bool:
+    time.sleep(0.3)
+    return verify_password(plain_password, hashed_password)
+
+
+@pytest.mark.parametrize("early_release", [True, False])
+def test_get_access_token_connection_released_before_hashing(
+    client: TestClient,
+    checkout_durations: list[float],
+    monkeypatch: pytest.MonkeyPatch,
+    early_release: bool,
+) -> None:
+    monkeypatch.setattr(settings, "DB_EARLY_RELEASE", early_release)
+    monkeypatch.setattr(crud, "verify_password", slow_verify_password)
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    assert r.status_code == 200
+    assert checkout_durations
+    assert (max(checkout_durations) < 0.3) is early_release
+
+
 def test_use_access_token(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
@@ -46,7 +73,7 @@ def test_use_access_token(
 
 
 def test_recovery_password(
-    client: TestClient, normal_user_token_headers: dict[str, str]
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
 ) -> None:
     with (
         patch("app.core.config.settings.SMTP_HOST", "smtp.example.com"),
@@ -59,6 +86,23 @@ def test_recovery_password(
         )
         assert r.status_code == 200
         assert r.json() == {"message": "Password recovery email sent"}
+        emails = db.exec(select(OutboxEmail).where(OutboxEmail.email_to == email))
+        assert any(
+            e.template_name == "reset_password" and e.context == {"email": email}
+            for e in emails
+        )
+
+
+def test_recovery_password_emails_disabled(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    with patch("app.core.config.settings.SMTP_HOST", None):
+        r = client.post(
+            f"{settings.API_V1_STR}/password-recovery/{settings.FIRST_SUPERUSER}",
+            headers=normal_user_token_headers,
+        )
+    assert r.status_code == 400
+    assert r.json() == {"detail": "Emails are not enabled"}
 
 
 def test_recovery_password_user_not_exits(
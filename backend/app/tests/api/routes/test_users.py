@@ -1,13 +1,16 @@
+import json
 import uuid
 from unittest.mock import patch
 
 from fastapi.testclient import TestClient
+from sqlalchemy.orm.exc import StaleDataError
 from sqlmodel import Session, select
 
 from app import crud
 from app.core.config import settings
 from app.core.security import verify_password
-from app.models import User, UserCreate
+from app.models import OutboxEmail, User, UserCreate
+from app.tests.utils.user import create_random_user, user_authentication_headers
 from app.tests.utils.utils import random_email, random_lower_string
 
 
@@ -33,11 +36,38 @@ def test_get_users_normal_user_me(
     assert current_user["email"] == settings.EMAIL_TEST_USER
 
 
+def test_get_users_me_not_modified(client: TestClient, db: Session) -> None:
+    username = random_email()
+    password = random_lower_string()
+    crud.create_user(
+        session=db, user_create=UserCreate(email=username, password=password)
+    )
+    headers = user_authentication_headers(
+        client=client, email=username, password=password
+    )
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.headers["cache-control"] == "private, no-cache"
+    etag = r.headers["etag"]
+    r = client.get(
+        f"{settings.API_V1_STR}/users/me", headers={**headers, "If-None-Match": etag}
+    )
+    assert r.status_code == 304
+
+    client.patch(
+        f"{settings.API_V1_STR}/users/me", headers=headers, json={"full_name": "New"}
+    )
+    r = client.get(
+        f"{settings.API_V1_STR}/users/me", headers={**headers, "If-None-Match": etag}
+    )
+    assert r.status_code == 200
+    assert r.json()["full_name"] == "New"
+    assert r.headers["etag"] != etag
+
+
 def test_create_user_new_email(
     client: TestClient, superuser_token_headers: dict[str, str], db: Session
 ) -> None:
     with (
-        patch("app.utils.send_email", return_value=None),
         patch("app.core.config.settings.SMTP_HOST", "smtp.example.com"),
         patch("app.core.config.settings.SMTP_USER", "admin@example.com"),
     ):
@@ -54,6 +84,12 @@ def test_create_user_new_email(
         user = crud.get_user_by_email(session=db, email=username)
         assert user
         assert user.email == created_user["email"]
+        email = db.exec(
+            select(OutboxEmail).where(OutboxEmail.email_to == username)
+        ).one()
+        assert email.attempts == 0
+        assert email.template_name == "new_account"
+        assert password not in str(email.context)
 
 
 def test_get_existing_user(
@@ -168,6 +204,68 @@ def test_retrieve_users(
         assert "email" in item
 
 
+def test_retrieve_users_count_mode_none(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"count_mode": "none"},
+    )
+    assert r.status_code == 200
+    all_users = r.json()
+    assert all_users["count"] is None
+    assert len(all_users["data"]) >= 1
+
+
+def test_export_users(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user = create_random_user(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/users/export", headers=superuser_token_headers
+    )
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert user.email in [row["email"] for row in rows]
+    assert all("hashed_password" not in row for row in rows)
+
+
+def test_export_users_normal_user(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/users/export", headers=normal_user_token_headers
+    )
+    assert response.status_code == 403
+
+
+def test_retrieve_users_cursor(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    for _ in range(3):
+        user_in = UserCreate(email=random_email(), password=random_lower_string())
+        crud.create_user(session=db, user_create=user_in)
+
+    emails: list[str] = []
+    cursor = ""
+    while True:
+        r = client.get(
+            f"{settings.API_V1_STR}/users/",
+            headers=superuser_token_headers,
+            params={"cursor": cursor, "limit": 2},
+        )
+        assert r.status_code == 200
+        page = r.json()
+        emails += [user["email"] for user in page["data"]]
+        if not page["next_cursor"]:
+            break
+        cursor = page["next_cursor"]
+
+    assert len(emails) == page["count"]
+    assert emails == sorted(emails)
+
+
 def test_update_user_me(
     client: TestClient, normal_user_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -346,6 +444,69 @@ def test_update_user(
     assert user_db.full_name == "Updated_full_name"
 
 
+def test_update_user_if_match(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user = create_random_user(db)
+    url = f"{settings.API_V1_STR}/users/{user.id}"
+    etag = client.get(url, headers=superuser_token_headers).headers["etag"]
+    assert etag == '"1"'
+    headers = {**superuser_token_headers, "If-Match": etag}
+    r = client.patch(url, headers=headers, json={"full_name": "First"})
+    assert r.status_code == 200
+    assert r.json()["version"] == 2
+    assert r.headers["etag"] == '"2"'
+    r = client.patch(url, headers=headers, json={"full_name": "Second"})
+    assert r.status_code == 412
+    assert r.json()["detail"] == "User version doesn't match If-Match"
+    assert client.get(url, headers=superuser_token_headers).json()["full_name"] == (
+        "First"
+    )
+
+
+def test_update_user_concurrent_write(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user = create_random_user(db)
+    url = f"{settings.API_V1_STR}/users/{user.id}"
+    # Another request updates the user between its read and its update
+    with patch("app.api.routes.users.crud.update_user", side_effect=StaleDataError):
+        r = client.patch(
+            url,
+            headers={**superuser_token_headers, "If-Match": '"1"'},
+            json={"full_name": "Foo"},
+        )
+        assert r.status_code == 412
+        r = client.patch(
+            url, headers=superuser_token_headers, json={"full_name": "Foo"}
+        )
+        assert r.status_code == 409
+
+
+def test_update_user_inactive_rejected(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    username = random_email()
+    password = random_lower_string()
+    user_in = UserCreate(email=username, password=password)
+    user = crud.create_user(session=db, user_create=user_in)
+    headers = user_authentication_headers(
+        client=client, email=username, password=password
+    )
+    r = client.get(f"{settings.API_V1_STR}/items/", headers=headers)
+    assert r.status_code == 200
+
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/{user.id}",
+        headers=superuser_token_headers,
+        json={"is_active": False},
+    )
+    assert r.status_code == 200
+    r = client.get(f"{settings.API_V1_STR}/items/", headers=headers)
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Inactive user"
+
+
 def test_update_user_not_exists(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
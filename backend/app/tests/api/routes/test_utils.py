@@ -0,0 +1,96 @@
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session, create_engine, select
+
+from app.core.config import settings
+from app.core.context import RequestContext, current_request
+from app.core.leaks import LeakDetector
+from app.core.slow_queries import SlowQueryLog
+from app.models import Item
+
+
+def test_read_db_leaks(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    leak_engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+    detector = LeakDetector(threshold_seconds=60, history_size=10)
+    detector.install(leak_engine)
+    request = RequestContext(method="POST", path="/api/v1/items/")
+    token = current_request.set(request)
+    try:
+        session = Session(leak_engine)
+        session.connection()
+    finally:
+        current_request.reset(token)
+    detector.request_finished(request.id)
+    session.close()
+    leak_engine.dispose()
+    with patch("app.core.db.leak_detector", detector):
+        r = client.get(
+            f"{settings.API_V1_STR}/utils/db-leaks/",
+            headers=superuser_token_headers,
+        )
+    assert r.status_code == 200
+    content = r.json()
+    assert content["count"] == 1
+    assert content["data"][0]["request_path"] == "/api/v1/items/"
+    assert content["data"][0]["leaked"] is True
+    assert content["data"][0]["checked_in"] is True
+
+
+def test_read_db_leaks_disabled(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    with patch("app.core.db.leak_detector", None):
+        r = client.get(
+            f"{settings.API_V1_STR}/utils/db-leaks/",
+            headers=superuser_token_headers,
+        )
+    assert r.status_code == 404
+
+
+def test_read_db_leaks_normal_user(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/db-leaks/",
+        headers=normal_user_token_headers,
+    )
+    assert r.status_code == 403
+
+
+def test_read_slow_queries(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    slow_engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+    slow_query_log = SlowQueryLog(
+        threshold_ms=0, history_size=10, explain_sample_rate=1, explain_per_minute=10
+    )
+    slow_query_log.install(slow_engine)
+    with Session(slow_engine) as session:
+        session.exec(select(Item).offset(10)).all()
+    slow_engine.dispose()
+    with patch("app.core.db.slow_query_log", slow_query_log):
+        r = client.get(
+            f"{settings.API_V1_STR}/utils/slow-queries/",
+            headers=superuser_token_headers,
+        )
+    assert r.status_code == 200
+    content = r.json()
+    assert content["count"] == 1
+    query = content["data"][0]
+    assert query["statement"].startswith("SELECT item.title")
+    assert query["parameters"] == {"param_1": "int"}
+    assert query["plan"][0]["Plan"]["Node Type"] == "Limit"
+
+
+def test_read_slow_queries_disabled(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    with patch("app.core.db.slow_query_log", None):
+        r = client.get(
+            f"{settings.API_V1_STR}/utils/slow-queries/",
+            headers=superuser_token_headers,
+        )
+    assert r.status_code == 404
@@ -0,0 +1,105 @@
+from collections.abc import Generator
+
+import pytest
+from fastapi import APIRouter, FastAPI, Response
+from fastapi.testclient import TestClient
+
+from app.api.conditional import conditional, etag_matches, get_if_match
+from app.api.routing import AppRoute
+from app.core.compression import CompressionMiddleware
+
+LARGE = "x" * 2000
+
+
+@pytest.fixture(scope="module")
+def conditional_client() -> Generator[TestClient, None, None]:
+    router = APIRouter(route_class=AppRoute)
+
+    @router.get("/large")
+    @conditional("private, max-age=60")
+    def large() -> dict[str, str]:
+        return {"data": LARGE}
+
+    @router.get("/versioned")
+    @conditional()
+    def versioned(response: Response) -> dict[str, str]:
+        response.headers["ETag"] = '"v1"'
+        return {"data": "x"}
+
+    app = FastAPI()
+    app.add_middleware(
+        CompressionMiddleware,
+        encodings=["gzip"],
+        levels={"gzip": 6},
+        minimum_size=1000,
+    )
+    app.include_router(router)
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.mark.parametrize(
+    ("if_none_match", "expected"),
+    [
+        ('"a"', True),
+        ('W/"a"', True),
+        ('"b", "a"', True),
+        ("*", True),
+        ('"b"', False),
+        ("", False),
+        (None, False),
+    ],
+)
+def test_etag_matches(if_none_match: str | None, expected: bool) -> None:
+    assert etag_matches(if_none_match, '"a"') == expected
+
+
+@pytest.mark.parametrize(
+    ("if_match", "expected"),
+    [
+        ('"3"', [3]),
+        ('W/"3", "4"', [3, 4]),
+        ('"abc", "5"', [5]),
+        ('"3', []),
+        ("*", None),
+        (None, None),
+    ],
+)
+def test_get_if_match(if_match: str | None, expected: list[int] | None) -> None:
+    assert get_if_match(if_match) == expected
+
+
+def test_not_modified(conditional_client: TestClient) -> None:
+    r = conditional_client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert r.status_code == 200
+    assert r.headers["cache-control"] == "private, max-age=60"
+    etag = r.headers["etag"]
+    assert not etag.startswith("W/")
+
+    r = conditional_client.get(
+        "/large", headers={"Accept-Encoding": "identity", "If-None-Match": etag}
+    )
+    assert r.status_code == 304
+    assert r.content == b""
+    assert r.headers["etag"] == etag
+    assert r.headers["cache-control"] == "private, max-age=60"
+
+
+def test_compressed_etag_is_weak(conditional_client: TestClient) -> None:
+    r = conditional_client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    etag = r.headers["etag"]
+    assert etag.startswith("W/")
+
+    r = conditional_client.get(
+        "/large", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}
+    )
+    assert r.status_code == 304
+
+
+def test_etag_set_by_endpoint(conditional_client: TestClient) -> None:
+    r = conditional_client.get("/versioned")
+    assert r.headers["etag"] == '"v1"'
+    assert r.headers["cache-control"] == "private, no-cache"
+    r = conditional_client.get("/versioned", headers={"If-None-Match": '"v1"'})
+    assert r.status_code == 304
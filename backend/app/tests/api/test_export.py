@@ -0,0 +1,24 @@
+from collections.abc import Generator
+
+import anyio
+
+from app.api.export import iter_in_threadpool
+
+
+def test_iter_in_threadpool_closes_on_disconnect() -> None:
+    closed = []
+
+    def chunks() -> Generator[str, None, None]:
+        try:
+            yield from ["a", "b", "c"]
+        finally:
+            closed.append(True)
+
+    async def read_first_chunk() -> str:
+        stream = iter_in_threadpool(chunks())
+        chunk = await stream.__anext__()
+        await stream.aclose()
+        return chunk
+
+    assert anyio.run(read_first_chunk) == "a"
+    assert closed == [True]
@@ -0,0 +1,84 @@
+from collections.abc import Generator
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI, Response
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app.api.main import create_api_router
+from app.api.responses import FastJSONResponse, RenderedJSON
+from app.api.routing import AppRoute
+from app.core.config import settings
+from app.tests.utils.item import create_random_item
+
+
+@pytest.fixture(scope="module")
+def fast_client() -> Generator[TestClient, None, None]:
+    fast_app = FastAPI(default_response_class=FastJSONResponse)
+    fast_app.include_router(create_api_router("sync"), prefix=settings.API_V1_STR)
+    with TestClient(fast_app) as c:
+        yield c
+
+
+def test_fast_json_matches_default_responses(
+    client: TestClient,
+    fast_client: TestClient,
+    superuser_token_headers: dict[str, str],
+    db: Session,
+) -> None:
+    for _ in range(3):
+        create_random_item(db)
+    for path in ["/items/?limit=100", "/users/me", "/users/?limit=100"]:
+        expected = client.get(
+            f"{settings.API_V1_STR}{path}", headers=superuser_token_headers
+        )
+        r = fast_client.get(
+            f"{settings.API_V1_STR}{path}", headers=superuser_token_headers
+        )
+        assert r.status_code == expected.status_code == 200
+        assert r.headers["content-type"] == "application/json"
+        assert r.json() == expected.json()
+
+
+def test_fast_json_keeps_status_code_and_headers(
+    fast_client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = fast_client.post(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        json={"title": "Foo", "description": "Fighters"},
+    )
+    assert r.status_code == 200
+    assert r.json()["title"] == "Foo"
+
+    with (
+        patch("app.core.config.settings.SMTP_HOST", "smtp.example.com"),
+        patch("app.core.config.settings.EMAILS_FROM_EMAIL", "info@example.com"),
+    ):
+        r = fast_client.post(
+            f"{settings.API_V1_STR}/utils/test-email/",
+            headers=superuser_token_headers,
+            params={"email_to": "test@example.com"},
+        )
+    assert r.status_code == 201
+    assert r.json() == {"message": "Test email sent"}
+
+
+def test_fast_json_route_dumps_response_model_to_bytes() -> None:
+    fast_app = FastAPI(default_response_class=FastJSONResponse)
+    fast_app.router.route_class = AppRoute
+
+    @fast_app.get("/", response_model=dict[str, int], status_code=202)
+    def endpoint(response: Response) -> dict[str, int]:
+        response.headers["X-Test"] = "1"
+        return {"a": 1}
+
+    route = fast_app.routes[-1]
+    assert isinstance(route, AppRoute)
+    with TestClient(fast_app) as c:
+        r = c.get("/")
+    assert r.status_code == 202
+    assert r.headers["X-Test"] == "1"
+    assert r.content == b'{"a":1}'
+    assert FastJSONResponse(RenderedJSON(b"[1]")).body == b"[1]"
@@ -1,13 +1,21 @@
-from collections.abc import Generator
+import time
+from collections.abc import Callable, Generator
+from contextlib import AbstractContextManager, contextmanager
+from typing import Any
+from unittest.mock import patch
 
 import pytest
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
-from sqlmodel import Session, delete
+from sqlalchemy import Engine, event
+from sqlmodel import Session, create_engine, delete
 
+from app.api.main import create_api_router
 from app.core.config import settings
-from app.core.db import engine, init_db
+from app.core.db import async_engine, engine, init_db
+from app.core.queries import QueryLog, record_queries
 from app.main import app
-from app.models import Item, User
+from app.models import Item, OutboxEmail, User
 from app.tests.utils.user import authentication_token_from_email
 from app.tests.utils.utils import get_superuser_token_headers
 
@@ -19,6 +27,8 @@ def db() -> Generator[Session, None, None]:
         yield session
         statement = delete(Item)
         session.execute(statement)
+        statement = delete(OutboxEmail)
+        session.execute(statement)
         statement = delete(User)
         session.execute(statement)
         session.commit()
@@ -30,6 +40,30 @@ def client() -> Generator[TestClient, None, None]:
         yield c
 
 
+@pytest.fixture(scope="module")
+def async_client() -> Generator[TestClient, None, None]:
+    async_app = FastAPI()
+    async_app.include_router(create_api_router("async"), prefix=settings.API_V1_STR)
+    with TestClient(async_app) as c:
+        yield c
+        # Pooled connections are bound to the event loop of this client
+        assert c.portal
+        c.portal.call(async_engine.dispose)
+
+
+@pytest.fixture()
+def replica_engine() -> Generator[Engine, None, None]:
+    """
+    Read replica on POSTGRES_REPLICA_SERVER when it is set, with the primary as
+    a stand-in otherwise.
+    """
+    uri = settings.SQLALCHEMY_REPLICA_DATABASE_URI or settings.SQLALCHEMY_DATABASE_URI
+    replica = create_engine(str(uri))
+    with patch("app.api.deps.replica_engine", replica):
+        yield replica
+    replica.dispose()
+
+
 @pytest.fixture(scope="module")
 def superuser_token_headers(client: TestClient) -> dict[str, str]:
     return get_superuser_token_headers(client)
@@ -40,3 +74,49 @@ def normal_user_token_headers(client: TestClient, db: Session) -> dict[str, str]
     return authentication_token_from_email(
         client=client, email=settings.EMAIL_TEST_USER, db=db
     )
+
+
+@pytest.fixture()
+def assert_num_queries() -> Callable[[int], AbstractContextManager[QueryLog]]:
+    """
+    Assert that the block runs exactly num queries on the primary engines, e.g.
+    `with assert_num_queries(2): client.get(...)`.
+    """
+
+    @contextmanager
+    def assert_num(num: int) -> Generator[QueryLog, None, None]:
+        with record_queries([engine, async_engine.sync_engine]) as query_log:
+            yield query_log
+        statements = "\n".join(query_log.statements)
+        assert query_log.count == num, (
+            f"{query_log.count} queries instead of {num}:\n{statements}"
+        )
+
+    return assert_num
+
+
+@pytest.fixture()
+def checkout_durations() -> Generator[list[float], None, None]:
+    """
+    Seconds each connection of the primary engines was checked out of the pool
+    for, filled in as they are returned.
+    """
+    durations: list[float] = []
+    checked_out: dict[int, float] = {}
+
+    def on_checkout(_dbapi_connection: Any, record: Any, _proxy: Any) -> None:
+        checked_out[id(record)] = time.monotonic()
+
+    def on_checkin(_dbapi_connection: Any, record: Any) -> None:
+        started = checked_out.pop(id(record), None)
+        if started is not None:
+            durations.append(time.monotonic() - started)
+
+    engines = [engine, async_engine.sync_engine]
+    for pool_engine in engines:
+        event.listen(pool_engine, "checkout", on_checkout)
+        event.listen(pool_engine, "checkin", on_checkin)
+    yield durations
+    for pool_engine in engines:
+        event.remove(pool_engine, "checkout", on_checkout)
+        event.remove(pool_engine, "checkin", on_checkin)
@@ -0,0 +1,128 @@
+import threading
+import time
+
+from sqlalchemy import make_url
+from sqlmodel import Session
+
+from app import crud
+from app.core.cache import (
+    CoherentCache,
+    LocalInvalidationChannel,
+    PostgresInvalidationChannel,
+    TTLCache,
+)
+from app.core.config import settings
+from app.core.db import engine
+from app.models import UserAuth, UserUpdate
+from app.tests.utils.user import create_random_user
+
+
+def test_get_set() -> None:
+    cache: TTLCache[str, int] = TTLCache(ttl=60, maxsize=10)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    cache.delete("a")
+    assert cache.get("a") is None
+
+
+def test_entries_expire() -> None:
+    cache: TTLCache[str, int] = TTLCache(ttl=0.01, maxsize=10)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+
+
+def test_least_recently_used_evicted() -> None:
+    cache: TTLCache[str, int] = TTLCache(ttl=60, maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_zero_ttl_disables_cache() -> None:
+    cache: TTLCache[str, int] = TTLCache(ttl=0, maxsize=10)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+
+def test_coherent_cache_invalidates_other_caches() -> None:
+    channel = LocalInvalidationChannel()
+    cache: CoherentCache[int] = CoherentCache(ttl=60, maxsize=10, channel=channel)
+    other: CoherentCache[int] = CoherentCache(ttl=60, maxsize=10, channel=channel)
+    cache.set("a", 1)
+    other.set("a", 1)
+    with Session(engine) as session:
+        cache.invalidate(session, "a")
+        # Evicted once the write is committed
+        assert cache.get("a") == 1
+        session.commit()
+    assert cache.get("a") is None
+    assert other.get("a") is None
+
+
+def test_coherent_cache_keeps_keys_of_rolled_back_writes() -> None:
+    channel = LocalInvalidationChannel()
+    cache: CoherentCache[int] = CoherentCache(ttl=60, maxsize=10, channel=channel)
+    cache.set("a", 1)
+    with Session(engine) as session:
+        cache.invalidate(session, "a")
+        session.rollback()
+    assert cache.get("a") == 1
+
+
+def conninfo() -> str:
+    url = make_url(str(settings.SQLALCHEMY_DATABASE_URI))
+    return url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+def test_postgres_invalidation_channel() -> None:
+    channel = PostgresInvalidationChannel(conninfo(), "test_invalidation")
+    received: list[str | None] = []
+    connected = threading.Event()
+    invalidated = threading.Event()
+
+    def subscriber(key: str | None) -> None:
+        received.append(key)
+        (connected if key is None else invalidated).set()
+
+    channel.subscribe(subscriber)
+    assert connected.wait(timeout=5)
+    with Session(engine) as session:
+        channel.publish(session, "a")
+        session.connection()
+        # NOTIFY is only delivered on commit
+        assert not invalidated.wait(timeout=0.2)
+        session.commit()
+    assert invalidated.wait(timeout=5)
+    assert received == [None, "a"]
+
+
+def test_deactivated_user_evicted_from_every_worker(db: Session) -> None:
+    # A cache per worker, each listening on its own connection
+    channels = [PostgresInvalidationChannel(conninfo(), "user_auth") for _ in range(2)]
+    caches: list[CoherentCache[UserAuth]] = []
+    for channel in channels:
+        connected = threading.Event()
+
+        def on_connect(key: str | None, connected: threading.Event = connected) -> None:
+            if key is None:
+                connected.set()
+
+        channel.subscribe(on_connect)
+        caches.append(CoherentCache(ttl=60, maxsize=10, channel=channel))
+        assert connected.wait(timeout=5)
+    user = create_random_user(db)
+    for cache in caches:
+        cache.set(str(user.id), UserAuth.model_validate(user))
+
+    crud.update_user(session=db, db_user=user, user_in=UserUpdate(is_active=False))
+
+    deadline = time.monotonic() + 5
+    while any(cache.get(str(user.id)) for cache in caches):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
@@ -0,0 +1,128 @@
+import zlib
+from collections.abc import Generator
+
+import anyio
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+from starlette.types import Message, Receive, Scope, Send
+
+from app.core.compression import (
+    CompressionMiddleware,
+    disable_compression,
+    negotiate_encoding,
+)
+
+LARGE = "x" * 2000
+
+
+@pytest.fixture(scope="module")
+def compression_client() -> Generator[TestClient, None, None]:
+    app = FastAPI()
+    app.add_middleware(
+        CompressionMiddleware,
+        encodings=["zstd", "br", "gzip"],
+        levels={"gzip": 6, "br": 4, "zstd": 3},
+        minimum_size=1000,
+    )
+
+    @app.get("/large")
+    def large() -> dict[str, str]:
+        return {"data": LARGE}
+
+    @app.get("/small")
+    def small() -> dict[str, str]:
+        return {"data": "x"}
+
+    @app.get("/binary")
+    def binary() -> Response:
+        return Response(LARGE.encode(), media_type="application/octet-stream")
+
+    @app.get("/uncompressed", dependencies=[Depends(disable_compression)])
+    def uncompressed() -> PlainTextResponse:
+        return PlainTextResponse(LARGE)
+
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.mark.parametrize(
+    ("accept_encoding", "expected"),
+    [
+        ("gzip, deflate", "gzip"),
+        ("br;q=0.5, zstd", "zstd"),
+        ("*", "zstd"),
+        ("gzip;q=0, *;q=0.1", "zstd"),
+        ("zstd;q=0, gzip", "gzip"),
+        ("identity", None),
+        ("", None),
+    ],
+)
+def test_negotiate_encoding(accept_encoding: str, expected: str | None) -> None:
+    assert negotiate_encoding(accept_encoding, ["zstd", "br", "gzip"]) == expected
+
+
+def test_compresses_large_responses(compression_client: TestClient) -> None:
+    r = compression_client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in r.headers["vary"]
+    assert int(r.headers["content-length"]) < len(LARGE)
+    assert r.json() == {"data": LARGE}
+
+
+def test_skips_small_or_not_accepted_responses(
+    compression_client: TestClient,
+) -> None:
+    r = compression_client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in r.headers
+    assert r.json() == {"data": "x"}
+
+    r = compression_client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in r.headers
+    assert "Accept-Encoding" in r.headers["vary"]
+
+
+def test_skips_binary_and_opted_out_routes(compression_client: TestClient) -> None:
+    for path in ["/binary", "/uncompressed"]:
+        r = compression_client.get(path, headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in r.headers
+        assert r.content == LARGE.encode()
+
+
+def test_compresses_streaming_responses_incrementally() -> None:
+    async def stream(scope: Scope, receive: Receive, send: Send) -> None:
+        response = StreamingResponse(
+            (f"{i}\n" for i in range(3)), media_type="application/x-ndjson"
+        )
+        await response(scope, receive, send)
+
+    middleware = CompressionMiddleware(
+        stream, encodings=["gzip"], levels={"gzip": 6}, minimum_size=1000
+    )
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"accept-encoding", b"gzip")],
+    }
+    messages: list[Message] = []
+
+    async def receive() -> Message:
+        # The client stays connected
+        await anyio.sleep_forever()
+        raise AssertionError
+
+    async def send(message: Message) -> None:
+        messages.append(message)
+
+    anyio.run(middleware, scope, receive, send)
+
+    start, *bodies = messages
+    assert (b"content-encoding", b"gzip") in start["headers"]
+    assert b"content-length" not in dict(start["headers"])
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    # Each chunk decodes on its own, without waiting for the end of the stream
+    chunks = [decompressor.decompress(body["body"]) for body in bodies]
+    assert chunks == [b"0\n", b"1\n", b"2\n", b""]
+    assert decompressor.eof
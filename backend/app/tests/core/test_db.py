@@ -0,0 +1,69 @@
+from unittest.mock import patch
+
+import pytest
+
+from app.core.db import compute_pool_size, get_pool_options, split_pool_options
+
+
+def test_compute_pool_size() -> None:
+    pool_size = compute_pool_size(
+        max_connections=100, reserved_connections=10, workers=4, instances=2
+    )
+    assert pool_size == 11
+
+
+def test_compute_pool_size_budget_too_small() -> None:
+    with pytest.raises(ValueError):
+        compute_pool_size(
+            max_connections=20, reserved_connections=10, workers=4, instances=3
+        )
+
+
+def test_get_pool_options_configured() -> None:
+    with (
+        patch("app.core.config.settings.POSTGRES_POOL_SIZE", 20),
+        patch("app.core.config.settings.POSTGRES_POOL_USE_LIFO", True),
+    ):
+        options = get_pool_options()
+    assert options["pool_size"] == 20
+    assert options["max_overflow"] == 10
+    assert options["pool_use_lifo"] is True
+
+
+def test_get_pool_options_auto_size() -> None:
+    with (
+        patch("app.core.config.settings.POSTGRES_POOL_AUTO_SIZE", True),
+        patch("app.core.config.settings.POSTGRES_MAX_CONNECTIONS", 100),
+        patch("app.core.config.settings.POSTGRES_RESERVED_CONNECTIONS", 20),
+        patch("app.core.config.settings.WEB_CONCURRENCY", 4),
+        patch("app.core.config.settings.POSTGRES_POOL_INSTANCES", 1),
+    ):
+        options = get_pool_options()
+    assert options["pool_size"] == 20
+    assert options["max_overflow"] == 0
+
+
+def test_get_pool_options_auto_size_from_server() -> None:
+    with (
+        patch("app.core.config.settings.POSTGRES_POOL_AUTO_SIZE", True),
+        patch("app.core.config.settings.POSTGRES_MAX_CONNECTIONS", None),
+        patch("app.core.db.get_server_max_connections", return_value=410),
+    ):
+        options = get_pool_options()
+    assert options["pool_size"] == 100
+    assert options["max_overflow"] == 0
+
+
+def test_split_pool_options() -> None:
+    options = {"pool_size": 20, "max_overflow": 0, "pool_timeout": 30.0}
+    assert split_pool_options(options, database_stack="sync") == (options, options)
+
+    sync_options, async_options = split_pool_options(options, database_stack="async")
+    assert sync_options == {"pool_size": 5, "max_overflow": 0, "pool_timeout": 30.0}
+    assert async_options == options | {"pool_size": 15}
+
+    sync_options, async_options = split_pool_options(
+        {"pool_size": 2, "max_overflow": 10}, database_stack="async"
+    )
+    assert sync_options == {"pool_size": 1, "max_overflow": 0}
+    assert async_options == {"pool_size": 1, "max_overflow": 10}
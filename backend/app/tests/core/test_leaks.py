@@ -0,0 +1,66 @@
+from collections.abc import Generator
+
+import pytest
+from sqlalchemy import Engine
+from sqlmodel import create_engine
+
+from app.core.config import settings
+from app.core.context import RequestContext, current_request
+from app.core.leaks import LeakDetector
+
+
+@pytest.fixture()
+def leak_engine() -> Generator[Engine, None, None]:
+    engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+    yield engine
+    engine.dispose()
+
+
+def test_connection_held_after_response(leak_engine: Engine) -> None:
+    detector = LeakDetector(threshold_seconds=60, history_size=10)
+    detector.install(leak_engine)
+    request = RequestContext(method="GET", path="/api/v1/items/")
+    token = current_request.set(request)
+    try:
+        connection = leak_engine.connect()
+    finally:
+        current_request.reset(token)
+
+    detector.request_finished(request.id)
+    offenders = detector.offenders()
+    assert len(offenders) == 1
+    assert offenders[0].leaked
+    assert offenders[0].request_path == "/api/v1/items/"
+    assert any(__file__ in line for line in offenders[0].stack)
+
+    connection.close()
+    assert offenders[0].checked_in is not None
+    assert len(detector.offenders()) == 1
+
+
+def test_connection_held_longer_than_threshold(leak_engine: Engine) -> None:
+    detector = LeakDetector(threshold_seconds=0, history_size=10)
+    detector.install(leak_engine)
+    with leak_engine.connect():
+        held = detector.offenders()
+        assert len(held) == 1
+        assert held[0].checked_in is None
+        assert held[0].request_path is None
+    offenders = detector.offenders()
+    assert len(offenders) == 1
+    assert offenders[0].checked_in is not None
+    assert not offenders[0].leaked
+
+
+def test_connection_returned_in_time(leak_engine: Engine) -> None:
+    detector = LeakDetector(threshold_seconds=60, history_size=10)
+    detector.install(leak_engine)
+    request = RequestContext(method="GET", path="/api/v1/items/")
+    token = current_request.set(request)
+    try:
+        with leak_engine.connect():
+            pass
+    finally:
+        current_request.reset(token)
+    detector.request_finished(request.id)
+    assert detector.offenders() == []
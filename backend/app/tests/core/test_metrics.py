@@ -0,0 +1,102 @@
+from collections.abc import Generator
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlalchemy import Engine, text
+from sqlmodel import create_engine
+
+from app.api.main import create_api_router
+from app.core import metrics
+from app.core.config import settings
+from app.core.metrics import MetricsMiddleware
+
+
+@pytest.fixture(scope="module")
+def metrics_client() -> Generator[TestClient, None, None]:
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+    app.add_route("/metrics", metrics.metrics, include_in_schema=False)
+    app.include_router(create_api_router("sync"), prefix=settings.API_V1_STR)
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture()
+def metrics_engine() -> Generator[Engine, None, None]:
+    engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI), pool_size=1)
+    metrics.install(engine, "test")
+    yield engine
+    engine.dispose()
+
+
+def sample(name: str, **labels: str) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_metrics_endpoint(metrics_client: TestClient) -> None:
+    route = f"{settings.API_V1_STR}/items/{{id}}"
+    before = sample(
+        "http_request_duration_seconds_count",
+        method="GET",
+        route=route,
+        status_code="401",
+    )
+    r = metrics_client.get(f"{settings.API_V1_STR}/items/1")
+    assert r.status_code == 401
+
+    r = metrics_client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    assert "http_request_duration_seconds_bucket" in r.text
+    assert 'threadpool_threads{state="total"}' in r.text
+    assert (
+        sample(
+            "http_request_duration_seconds_count",
+            method="GET",
+            route=route,
+            status_code="401",
+        )
+        == before + 1
+    )
+    # The scrape itself
+    assert 'http_requests_in_progress{method="GET"} 1.0' in r.text
+
+
+def test_password_hash_metrics(
+    metrics_client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    before = sample("password_hash_seconds_count", operation="verify")
+    r = metrics_client.post(
+        f"{settings.API_V1_STR}/login/access-token", data=login_data
+    )
+    assert r.status_code == 200
+    # Not recorded with the metrics disabled
+    assert sample("password_hash_seconds_count", operation="verify") == before
+
+    monkeypatch.setattr(settings, "METRICS_ENABLED", True)
+    r = metrics_client.post(
+        f"{settings.API_V1_STR}/login/access-token", data=login_data
+    )
+    assert r.status_code == 200
+    assert sample("password_hash_seconds_count", operation="verify") == before + 1
+
+
+def test_pool_metrics(metrics_engine: Engine) -> None:
+    with metrics_engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        assert sample("db_pool_checked_out_connections", engine="test") == 1
+    assert sample("db_pool_checked_out_connections", engine="test") == 0
+    assert sample("db_pool_waiters", engine="test") == 0
+    assert sample("db_pool_checkout_wait_seconds_count", engine="test") == 1
+
+    # The pool is replaced on dispose, and instrumented again
+    metrics_engine.dispose()
+    with metrics_engine.connect():
+        pass
+    assert sample("db_pool_checkout_wait_seconds_count", engine="test") == 2
@@ -0,0 +1,111 @@
+import uuid
+from collections.abc import Generator
+
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from app.api.routing import AppRoute
+from app.core import queries
+from app.core.config import settings
+from app.core.db import engine
+from app.core.queries import (
+    QueryBudgetExceeded,
+    QueryLog,
+    check_query_log,
+    query_budget,
+)
+from app.models import User
+
+
+@pytest.fixture(scope="module")
+def counted_engine() -> Generator[None, None, None]:
+    queries.install(engine)
+    yield
+    event.remove(engine, "after_cursor_execute", queries._after_cursor_execute)
+
+
+def create_app() -> FastAPI:
+    router = APIRouter(route_class=AppRoute)
+
+    @router.get("/users")
+    @query_budget(2)
+    def read_users_one_by_one() -> int:
+        # N+1: one query by user instead of one for all of them
+        with Session(engine) as session:
+            for _ in range(3):
+                session.exec(select(User).where(User.id == uuid.uuid4())).all()
+        return 3
+
+    @router.get("/user")
+    def read_user() -> int:
+        with Session(engine) as session:
+            session.exec(select(User).where(User.id == uuid.uuid4())).all()
+        return 1
+
+    app = FastAPI()
+    app.include_router(router)
+    return app
+
+
+def test_check_query_log(caplog: pytest.LogCaptureFixture) -> None:
+    query_log = QueryLog()
+    for i in range(3):
+        query_log.record("SELECT * FROM item WHERE owner_id = %(id)s", {"id": i})
+    query_log.record("SELECT count(*) FROM item", {})
+    assert query_log.count == 4
+    assert query_log.repeated(3) == ["SELECT * FROM item WHERE owner_id = %(id)s"]
+
+    check_query_log(
+        query_log, route="GET /items", budget=4, repeat_threshold=4, raise_errors=True
+    )
+    with pytest.raises(QueryBudgetExceeded, match="ran 4 queries, its budget is 3"):
+        check_query_log(
+            query_log,
+            route="GET /items",
+            budget=3,
+            repeat_threshold=4,
+            raise_errors=True,
+        )
+    with caplog.at_level("WARNING", logger="app.core.queries"):
+        check_query_log(
+            query_log,
+            route="GET /items",
+            budget=4,
+            repeat_threshold=3,
+            raise_errors=False,
+        )
+    [message] = [r.getMessage() for r in caplog.records if r.name == "app.core.queries"]
+    assert "same statement with 3 different parameters" in message
+
+
+@pytest.mark.usefixtures("counted_engine")
+def test_route_over_budget_raises(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "QUERY_BUDGET_MODE", "raise")
+    monkeypatch.setattr(settings, "QUERY_BUDGET_DEFAULT", 1)
+    with TestClient(create_app()) as client:
+        assert client.get("/user").status_code == 200
+        with pytest.raises(QueryBudgetExceeded, match="GET /users ran 3 queries"):
+            client.get("/users")
+
+
+@pytest.mark.usefixtures("counted_engine")
+def test_route_over_budget_logs(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    monkeypatch.setattr(settings, "QUERY_BUDGET_MODE", "log")
+    with TestClient(create_app()) as client:
+        with caplog.at_level("WARNING", logger="app.core.queries"):
+            assert client.get("/users").status_code == 200
+    [message] = [r.getMessage() for r in caplog.records if r.name == "app.core.queries"]
+    assert message.startswith("GET /users ran 3 queries, its budget is 2")
+    assert "same statement with 3 different parameters" in message
+
+
+@pytest.mark.usefixtures("counted_engine")
+def test_route_budget_off(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "QUERY_BUDGET_MODE", "off")
+    with TestClient(create_app()) as client:
+        assert client.get("/users").status_code == 200
@@ -0,0 +1,67 @@
+import os
+import signal
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core import security
+from app.core.config import settings
+from app.core.security import (
+    PasswordHasher,
+    PasswordHashingBusy,
+    get_password_hash,
+    verify_password,
+)
+
+
+def test_password_hash_in_pool() -> None:
+    hasher = PasswordHasher(workers=1, max_pending=2)
+    try:
+        hashed = hasher.submit(security._get_password_hash, "secret").result()
+        assert hasher.submit(security._verify_password, "secret", hashed).result()
+        assert not hasher.submit(security._verify_password, "other", hashed).result()
+    finally:
+        hasher.shutdown()
+
+
+def test_password_hash_pool_replaced_when_broken() -> None:
+    hasher = PasswordHasher(workers=1, max_pending=2)
+    try:
+        hashed = hasher.run(security._get_password_hash, "secret")
+        executor = hasher._executor
+        assert executor is not None
+        for pid in list(executor._processes):
+            os.kill(pid, signal.SIGKILL)
+        assert hasher.run(security._verify_password, "secret", hashed)
+        assert hasher.run(security._verify_password, "secret", hashed)
+        assert hasher._executor is not executor
+    finally:
+        hasher.shutdown()
+
+
+def test_password_hash_inline() -> None:
+    hasher = PasswordHasher(workers=0, max_pending=1)
+    hashed = hasher.submit(security._get_password_hash, "secret").result()
+    assert verify_password("secret", hashed)
+    assert verify_password("secret", get_password_hash("secret"))
+
+
+def test_password_hasher_busy() -> None:
+    hasher = PasswordHasher(workers=0, max_pending=0)
+    with pytest.raises(PasswordHashingBusy):
+        hasher.submit(security._get_password_hash, "secret")
+
+
+def test_login_password_hasher_busy(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(
+        security, "password_hasher", PasswordHasher(workers=0, max_pending=0)
+    )
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    assert r.status_code == 503
+    assert r.headers["retry-after"] == "1"
@@ -0,0 +1,82 @@
+from collections.abc import Generator
+
+import pytest
+from sqlalchemy import Engine, text
+from sqlmodel import Session, create_engine, select
+
+from app.core.config import settings
+from app.core.context import RequestContext, current_request
+from app.core.slow_queries import SlowQueryLog, normalize_statement
+from app.models import Item
+
+
+@pytest.fixture()
+def slow_engine() -> Generator[Engine, None, None]:
+    engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+    yield engine
+    engine.dispose()
+
+
+def test_normalize_statement() -> None:
+    statement = """
+        SELECT item.id, 'it''s' FROM item
+        WHERE item.title = %(title_1)s LIMIT 10 OFFSET 2.5
+    """
+    assert normalize_statement(statement) == (
+        "SELECT item.id, ? FROM item WHERE item.title = %(title_1)s LIMIT ? OFFSET ?"
+    )
+
+
+def test_slow_query_logged_and_explained(slow_engine: Engine) -> None:
+    slow_query_log = SlowQueryLog(
+        threshold_ms=0,
+        history_size=10,
+        explain_sample_rate=1.0,
+        explain_per_minute=1,
+    )
+    slow_query_log.install(slow_engine)
+    request = RequestContext(method="GET", path="/api/v1/items/")
+    token = current_request.set(request)
+    try:
+        with Session(slow_engine) as session:
+            session.exec(select(Item).where(Item.title == "secret")).all()
+            session.exec(select(Item).where(Item.title == "secret")).all()
+    finally:
+        current_request.reset(token)
+
+    latest, first = slow_query_log.queries()
+    assert first.statement.startswith("SELECT item.title")
+    assert first.parameters == {"title_1": "str"}
+    assert "secret" not in repr(first)
+    assert first.request_path == "/api/v1/items/"
+    assert first.caller
+    assert first.caller.startswith("app/tests/core/test_slow_queries.py:")
+    assert first.plan[0]["Plan"]["Relation Name"] == "item"
+    # Rate limited
+    assert latest.plan is None
+
+
+def test_slow_query_explain_failure_keeps_transaction(slow_engine: Engine) -> None:
+    slow_query_log = SlowQueryLog(
+        threshold_ms=0,
+        history_size=10,
+        explain_sample_rate=1.0,
+        explain_per_minute=10,
+    )
+    with slow_engine.begin() as connection:
+        connection.execute(text("SELECT 1"))
+        assert slow_query_log._explain(connection, "SELECT * FROM nope", {}) is None
+        assert connection.execute(text("SELECT 2")).scalar_one() == 2
+
+
+def test_fast_query_not_logged(slow_engine: Engine) -> None:
+    slow_query_log = SlowQueryLog(
+        threshold_ms=60_000,
+        history_size=10,
+        explain_sample_rate=1.0,
+        explain_per_minute=10,
+    )
+    slow_query_log.install(slow_engine)
+    with slow_engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    assert slow_query_log.queries() == []
@@ -0,0 +1,82 @@
+import json
+from collections.abc import Generator
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.api.main import create_api_router
+from app.core import timing
+from app.core.config import settings
+from app.core.db import engine
+from app.core.timing import TimingMiddleware
+
+
+def create_app(sample_rate: float) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(TimingMiddleware, sample_rate=sample_rate)
+    app.include_router(create_api_router("sync"), prefix=settings.API_V1_STR)
+    return app
+
+
+@pytest.fixture(scope="module")
+def timed_engine() -> Generator[None, None, None]:
+    timing.install(engine)
+    yield
+    event.remove(engine, "before_cursor_execute", timing._before_cursor_execute)
+    event.remove(engine, "after_cursor_execute", timing._after_cursor_execute)
+    event.remove(engine, "engine_disposed", timing._time_pool)
+    del engine.pool.connect
+
+
+def parse_server_timing(value: str) -> dict[str, str]:
+    metrics = {}
+    for metric in value.split(", "):
+        name, *params = metric.split(";")
+        metrics[name] = ";".join(params)
+    return metrics
+
+
+@pytest.mark.usefixtures("timed_engine")
+def test_server_timing(
+    superuser_token_headers: dict[str, str], caplog: pytest.LogCaptureFixture
+) -> None:
+    with TestClient(create_app(sample_rate=1.0)) as client:
+        with caplog.at_level("INFO", logger="app.core.timing"):
+            r = client.get(
+                f"{settings.API_V1_STR}/users/me", headers=superuser_token_headers
+            )
+    assert r.status_code == 200
+    metrics = parse_server_timing(r.headers["server-timing"])
+    assert {"pool", "db", "auth", "handler", "serialize", "total"} <= set(metrics)
+    assert "queries" in metrics["db"]
+
+    [message] = [r.getMessage() for r in caplog.records if r.name == "app.core.timing"]
+    record = json.loads(message)
+    assert record["event"] == "request_timings"
+    assert record["path"] == f"{settings.API_V1_STR}/users/me"
+    assert record["status_code"] == 200
+    assert record["queries"] >= 1
+    assert record["phases_ms"]["db"] >= 0
+
+
+@pytest.mark.usefixtures("timed_engine")
+def test_server_timing_times_password_hashing() -> None:
+    with TestClient(create_app(sample_rate=1.0)) as client:
+        r = client.post(
+            f"{settings.API_V1_STR}/login/access-token",
+            data={
+                "username": settings.FIRST_SUPERUSER,
+                "password": settings.FIRST_SUPERUSER_PASSWORD,
+            },
+        )
+    assert r.status_code == 200
+    assert "bcrypt" in parse_server_timing(r.headers["server-timing"])
+
+
+def test_server_timing_not_sampled() -> None:
+    with TestClient(create_app(sample_rate=0.0)) as client:
+        r = client.get(f"{settings.API_V1_STR}/utils/health-check/")
+    assert r.status_code == 200
+    assert "server-timing" not in r.headers
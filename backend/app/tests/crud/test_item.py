@@ -0,0 +1,88 @@
+from sqlalchemy import insert, text
+from sqlmodel import Session, func, select
+
+from app import crud
+from app.core.db import engine
+from app.models import Item, ItemCreate, ItemUpdate
+from app.tests.utils.user import create_random_user
+
+
+def test_count_items_invalidated_by_writes(db: Session) -> None:
+    user = create_random_user(db)
+    assert crud.count(session=db, model=Item, owner_id=user.id) == 0
+    item = crud.create_item(
+        session=db, item_in=ItemCreate(title="Foo"), owner_id=user.id
+    )
+    assert crud.count(session=db, model=Item, owner_id=user.id) == 1
+    assert crud.delete_item(session=db, id=item.id, owner_id=user.id)
+    assert crud.count(session=db, model=Item, owner_id=user.id) == 0
+
+
+def test_count_items_none(db: Session) -> None:
+    assert crud.count(session=db, model=Item, count_mode="none") is None
+
+
+def test_count_items_estimated(db: Session) -> None:
+    count = crud.count(session=db, model=Item, count_mode="estimated")
+    assert count is not None
+    assert count >= 0
+
+
+def test_items_version_bumped_by_writes(db: Session) -> None:
+    user = create_random_user(db)
+    other = create_random_user(db)
+    assert crud.get_items_version(session=db, owner_id=user.id) == 0
+    item = crud.create_item(
+        session=db, item_in=ItemCreate(title="Foo"), owner_id=user.id
+    )
+    crud.create_items(
+        session=db,
+        items_in=[ItemCreate(title="Bar"), ItemCreate(title="Baz")],
+        owner_id=user.id,
+    )
+    # Superuser writes bump the owner of the item
+    crud.update_item(
+        session=db, id=item.id, owner_id=None, item_in=ItemUpdate(title="Qux")
+    )
+    assert crud.get_items_version(session=db, owner_id=user.id) == 3
+    # Writes that match no item don't
+    assert not crud.delete_item(session=db, id=item.id, owner_id=other.id)
+    assert crud.delete_item(session=db, id=item.id, owner_id=user.id)
+    assert crud.get_items_version(session=db, owner_id=user.id) == 4
+    assert crud.get_items_version(session=db, owner_id=other.id) == 0
+
+
+def test_concurrent_item_writes_of_an_owner_dont_wait(db: Session) -> None:
+    user = create_random_user(db)
+    sessions: list[Session] = []
+    slots: set[int] = set()
+    try:
+        # Two connections bumping different counters
+        while len(slots) < 2:
+            session = Session(engine)
+            sessions.append(session)
+            pid = session.exec(select(func.pg_backend_pid())).one()
+            if pid % crud.ITEM_CHANGE_SLOTS not in slots:
+                slots.add(pid % crud.ITEM_CHANGE_SLOTS)
+            else:
+                session.close()
+                sessions.pop()
+        first, second = sessions
+        for session in sessions:
+            db_item = Item.model_validate(
+                ItemCreate(title="Foo"), update={"owner_id": user.id}
+            )
+            if session is second:
+                # Fails instead of waiting for the first transaction to commit
+                session.exec(text("SET LOCAL lock_timeout = '1s'"))  # type: ignore
+            session.exec(
+                insert(crud.item_table)  # type: ignore
+                .values(db_item.model_dump())
+                .add_cte(crud.touch_items(user.id).cte("touched"))
+            )
+        first.commit()
+        second.commit()
+    finally:
+        for session in sessions:
+            session.close()
+    assert crud.get_items_version(session=db, owner_id=user.id) == 2
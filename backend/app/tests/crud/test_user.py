@@ -1,7 +1,10 @@
+import pytest
 from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm.exc import StaleDataError
 from sqlmodel import Session
 
 from app import crud
+from app.core.db import engine
 from app.core.security import verify_password
 from app.models import User, UserCreate, UserUpdate
 from app.tests.utils.utils import random_email, random_lower_string
@@ -89,3 +92,45 @@ def test_update_user(db: Session) -> None:
     assert user_2
     assert user.email == user_2.email
     assert verify_password(new_password, user_2.hashed_password)
+
+
+def test_release_connection(db: Session) -> None:
+    user = crud.create_user(
+        session=db,
+        user_create=UserCreate(email=random_email(), password=random_lower_string()),
+    )
+    with Session(engine, expire_on_commit=False) as session:
+        db_user = session.get(User, user.id)
+        assert db_user
+        assert session.in_transaction()
+        crud.release_connection(session)
+        assert not session.in_transaction()
+        # Still loaded, reading it doesn't check out a connection
+        assert db_user.email == user.email
+        assert not session.in_transaction()
+
+        # Pending changes are left to the caller's commit
+        db_user.full_name = "Changed"
+        crud.release_connection(session)
+        assert db_user in session.dirty
+
+    with Session(engine) as session:
+        session.get(User, user.id)
+        crud.release_connection(session)
+        assert session.in_transaction()
+
+
+def test_update_user_concurrent_write(db: Session) -> None:
+    user = crud.create_user(
+        session=db,
+        user_create=UserCreate(email=random_email(), password=random_lower_string()),
+    )
+    with Session(engine) as session:
+        stale_user = session.get(User, user.id)
+        assert stale_user
+        crud.update_user(session=db, db_user=user, user_in=UserUpdate(full_name="A"))
+        assert user.version == 2
+        with pytest.raises(StaleDataError):
+            crud.update_user(
+                session=session, db_user=stale_user, user_in=UserUpdate(full_name="B")
+            )
@@ -0,0 +1,226 @@
+import socket
+import threading
+from collections.abc import Generator
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+import pytest
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import SMTP, Envelope
+from aiosmtpd.smtp import Session as SMTPSession
+from prometheus_client import REGISTRY
+from sqlmodel import Session, col, delete, select
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.email_worker import SMTPSender, send_batch
+from app.models import OutboxEmail
+
+
+class RecordingHandler:
+    def __init__(self, failures: int = 0) -> None:
+        self.failures = failures
+        self.messages: list[Envelope] = []
+        self.sessions: set[int] = set()
+
+    async def handle_DATA(
+        self, server: SMTP, session: SMTPSession, envelope: Envelope
+    ) -> str:
+        if self.failures:
+            self.failures -= 1
+            return "451 Try again later"
+        self.sessions.add(id(session))
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+@pytest.fixture()
+def smtp_server(monkeypatch: pytest.MonkeyPatch) -> Generator[Controller, None, None]:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    controller = Controller(RecordingHandler(), hostname="127.0.0.1", port=port)
+    controller.start()
+    monkeypatch.setattr(settings, "SMTP_HOST", controller.hostname)
+    monkeypatch.setattr(settings, "SMTP_PORT", controller.port)
+    monkeypatch.setattr(settings, "SMTP_TLS", False)
+    monkeypatch.setattr(settings, "SMTP_USER", None)
+    monkeypatch.setattr(settings, "SMTP_PASSWORD", None)
+    monkeypatch.setattr(settings, "EMAILS_FROM_EMAIL", "info@example.com")
+    monkeypatch.setattr(settings, "EMAILS_OUTBOX_MAX_ATTEMPTS", 3)
+    yield controller
+    controller.stop()
+
+
+@pytest.fixture()
+def outbox(db: Session) -> Generator[None, None, None]:
+    db.execute(delete(OutboxEmail))
+    db.commit()
+    yield
+    db.execute(delete(OutboxEmail))
+    db.commit()
+
+
+def add_emails(db: Session, count: int) -> list[OutboxEmail]:
+    emails = [
+        crud.add_email(
+            session=db,
+            email_to=f"user{i}@example.com",
+            template_name="test_email",
+        )
+        for i in range(count)
+    ]
+    db.commit()
+    return emails
+
+
+def make_due(db: Session) -> None:
+    for email in db.exec(select(OutboxEmail)):
+        email.next_attempt_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+        db.add(email)
+    db.commit()
+
+
+@pytest.mark.usefixtures("outbox")
+def test_send_batch_over_one_connection(
+    smtp_server: Controller, db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "METRICS_ENABLED", True)
+    handler = smtp_server.handler
+    sent = REGISTRY.get_sample_value("emails_sent_total", {"outcome": "sent"}) or 0
+    add_emails(db, 3)
+    sender = SMTPSender()
+    with Session(engine) as session:
+        assert send_batch(session, sender) == 3
+    sender.close()
+
+    assert sorted(m.rcpt_tos[0] for m in handler.messages) == [
+        "user0@example.com",
+        "user1@example.com",
+        "user2@example.com",
+    ]
+    assert len(handler.sessions) == 1
+    # Rendered when sent
+    assert b"user0@example.com" in handler.messages[0].original_content
+    assert REGISTRY.get_sample_value("emails_sent_total", {"outcome": "sent"}) == (
+        sent + 3
+    )
+    db.expire_all()
+    assert db.exec(select(OutboxEmail)).all() == []
+
+
+@pytest.mark.usefixtures("outbox")
+def test_send_batch_retries_with_backoff(smtp_server: Controller, db: Session) -> None:
+    handler = smtp_server.handler
+    handler.failures = 1
+    add_emails(db, 1)
+    sender = SMTPSender()
+    with Session(engine) as session:
+        assert send_batch(session, sender) == 1
+        # Not due again before the backoff
+        assert send_batch(session, sender) == 0
+
+    db.expire_all()
+    email = db.exec(select(OutboxEmail)).one()
+    assert email.attempts == 1
+    assert email.last_error
+    assert email.next_attempt_at
+    assert email.next_attempt_at > datetime.now(timezone.utc)
+
+    make_due(db)
+    with Session(engine) as session:
+        assert send_batch(session, sender) == 1
+    sender.close()
+    assert [m.rcpt_tos for m in handler.messages] == [["user0@example.com"]]
+    db.expire_all()
+    assert db.exec(select(OutboxEmail)).all() == []
+
+
+@pytest.mark.usefixtures("outbox")
+def test_send_batch_gives_up_after_max_attempts(
+    smtp_server: Controller, db: Session
+) -> None:
+    handler = smtp_server.handler
+    handler.failures = 10
+    add_emails(db, 1)
+    sender = SMTPSender()
+    for _ in range(settings.EMAILS_OUTBOX_MAX_ATTEMPTS):
+        make_due(db)
+        with Session(engine) as session:
+            send_batch(session, sender)
+    sender.close()
+
+    db.expire_all()
+    email = db.exec(select(OutboxEmail)).one()
+    assert email.attempts == settings.EMAILS_OUTBOX_MAX_ATTEMPTS
+    assert email.next_attempt_at is None
+    with Session(engine) as session:
+        assert send_batch(session, SMTPSender()) == 0
+    assert handler.messages == []
+
+
+@pytest.mark.usefixtures("outbox")
+def test_send_batch_skips_emails_locked_by_another_worker(
+    smtp_server: Controller, db: Session
+) -> None:
+    handler = smtp_server.handler
+    emails = add_emails(db, 2)
+    locked = threading.Event()
+    release = threading.Event()
+
+    def lock_first() -> None:
+        with Session(engine) as session:
+            session.exec(
+                select(OutboxEmail)
+                .where(col(OutboxEmail.id) == emails[0].id)
+                .with_for_update()
+            ).one()
+            locked.set()
+            release.wait(10)
+
+    thread = threading.Thread(target=lock_first)
+    thread.start()
+    try:
+        assert locked.wait(10)
+        sender = SMTPSender()
+        with Session(engine) as session:
+            assert send_batch(session, sender) == 1
+        sender.close()
+    finally:
+        release.set()
+        thread.join()
+
+    assert [m.rcpt_tos for m in handler.messages] == [["user1@example.com"]]
+
+
+class CrashingSender(SMTPSender):
+    def __init__(self, crash_after: int) -> None:
+        super().__init__()
+        self.crash_after = crash_after
+
+    def send(self, email: OutboxEmail) -> Any:
+        if not self.crash_after:
+            raise SystemExit()
+        self.crash_after -= 1
+        return super().send(email)
+
+
+@pytest.mark.usefixtures("outbox")
+def test_send_batch_commits_each_email(smtp_server: Controller, db: Session) -> None:
+    handler = smtp_server.handler
+    add_emails(db, 2)
+    sender = CrashingSender(crash_after=1)
+    with Session(engine) as session, pytest.raises(SystemExit):
+        send_batch(session, sender)
+    sender.close()
+    assert len(handler.messages) == 1
+
+    # The sent email is deleted, the other one leased until it is due again
+    db.expire_all()
+    email = db.exec(select(OutboxEmail)).one()
+    assert email.email_to != handler.messages[0].rcpt_tos[0]
+    assert email.next_attempt_at
+    assert email.next_attempt_at > datetime.now(timezone.utc) + timedelta(seconds=60)
+    with Session(engine) as session:
+        assert send_batch(session, SMTPSender()) == 0
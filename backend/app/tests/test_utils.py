@@ -0,0 +1,45 @@
+from pathlib import Path
+
+from jinja2 import Template
+
+from app.utils import (
+    email_templates,
+    generate_new_account_email,
+    render_outbox_email,
+    verify_password_reset_token,
+)
+
+
+def test_email_templates_compiled_once() -> None:
+    template = email_templates.get_template("new_account.html")
+    assert email_templates.get_template("new_account.html") is template
+
+
+def test_render_email_template_matches_template_file() -> None:
+    context = {
+        "project_name": "Project",
+        "username": "user@example.com",
+        "email": "user@example.com",
+        "link": "http://localhost:5173",
+    }
+    template_str = (
+        Path(__file__).parents[1] / "email-templates" / "build" / "new_account.html"
+    ).read_text()
+    expected = Template(template_str).render(context)
+
+    email_data = generate_new_account_email(
+        email_to="user@example.com", username="user@example.com"
+    )
+
+    assert "user@example.com" in email_data.html_content
+    assert email_templates.get_template("new_account.html").render(context) == expected
+
+
+def test_render_outbox_email_creates_reset_token() -> None:
+    email_data = render_outbox_email(
+        template_name="reset_password",
+        email_to="user@example.com",
+        context={"email": "user@example.com"},
+    )
+    token = email_data.html_content.split("reset-password?token=")[1].split('"')[0]
+    assert verify_password_reset_token(token) == "user@example.com"
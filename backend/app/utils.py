@@ -1,4 +1,5 @@
 import logging
+from collections.abc import Callable
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
@@ -6,7 +7,7 @@ from typing import Any
 
 import emails  # type: ignore
 import jwt
-from jinja2 import Template
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 from jwt.exceptions import InvalidTokenError
 
 from app.core import security
@@ -22,37 +23,57 @@ class EmailData:
     subject: str
 
 
+# Templates are compiled on first use and kept by the environment, their
+# bytecode is also cached on disk for the next processes. Outside of local
+# they are not checked for changes.
+email_templates = Environment(
+    loader=FileSystemLoader(Path(__file__).parent / "email-templates" / "build"),
+    bytecode_cache=FileSystemBytecodeCache(),
+    auto_reload=settings.ENVIRONMENT == "local",
+)
+
+
 def render_email_template(*, template_name: str, context: dict[str, Any]) -> str:
-    template_str = (
-        Path(__file__).parent / "email-templates" / "build" / template_name
-    ).read_text()
-    html_content = Template(template_str).render(context)
+    html_content = email_templates.get_template(template_name).render(context)
     return html_content
 
 
+def get_smtp_options() -> dict[str, Any]:
+    smtp_options: dict[str, Any] = {
+        "host": settings.SMTP_HOST,
+        "port": settings.SMTP_PORT,
+    }
+    if settings.SMTP_TLS:
+        smtp_options["tls"] = True
+    elif settings.SMTP_SSL:
+        smtp_options["ssl"] = True
+    if settings.SMTP_USER:
+        smtp_options["user"] = settings.SMTP_USER
+    if settings.SMTP_PASSWORD:
+        smtp_options["password"] = settings.SMTP_PASSWORD
+    return smtp_options
+
+
 def send_email(
     *,
     email_to: str,
     subject: str = "",
     html_content: str = "",
-) -> None:
+    smtp: Any = None,
+) -> Any:
+    """
+    Send an email, over the given emails SMTPBackend to reuse its connection,
+    or over a new connection.
+    """
     assert settings.emails_enabled, "no provided configuration for email variables"
     message = emails.Message(
         subject=subject,
         html=html_content,
         mail_from=(settings.EMAILS_FROM_NAME, settings.EMAILS_FROM_EMAIL),
     )
-    smtp_options = {"host": settings.SMTP_HOST, "port": settings.SMTP_PORT}
-    if settings.SMTP_TLS:
-        smtp_options["tls"] = True
-    elif settings.SMTP_SSL:
-        smtp_options["ssl"] = True
-    if settings.SMTP_USER:
-        smtp_options["user"] = settings.SMTP_USER
-    if settings.SMTP_PASSWORD:
-        smtp_options["password"] = settings.SMTP_PASSWORD
-    response = message.send(to=email_to, smtp=smtp_options)
+    response = message.send(to=email_to, smtp=smtp or get_smtp_options())
     logger.info(f"send email result: {response}")
+    return response
 
 
 def generate_test_email(email_to: str) -> EmailData:
@@ -65,7 +86,11 @@ def generate_test_email(email_to: str) -> EmailData:
     return EmailData(html_content=html_content, subject=subject)
 
 
-def generate_reset_password_email(email_to: str, email: str, token: str) -> EmailData:
+def generate_reset_password_email(
+    email_to: str, email: str, token: str | None = None
+) -> EmailData:
+    if token is None:
+        token = generate_password_reset_token(email=email)
     project_name = settings.PROJECT_NAME
     subject = f"{project_name} - Password recovery for user {email}"
     link = f"{settings.FRONTEND_HOST}/reset-password?token={token}"
@@ -82,9 +107,7 @@ def generate_reset_password_email(email_to: str, email: str, token: str) -> Emai
     return EmailData(html_content=html_content, subject=subject)
 
 
-def generate_new_account_email(
-    email_to: str, username: str, password: str
-) -> EmailData:
+def generate_new_account_email(email_to: str, username: str) -> EmailData:
     project_name = settings.PROJECT_NAME
     subject = f"{project_name} - New account for user {username}"
     html_content = render_email_template(
@@ -92,7 +115,6 @@ def generate_new_account_email(
         context={
             "project_name": settings.PROJECT_NAME,
             "username": username,
-            "password": password,
             "email": email_to,
             "link": settings.FRONTEND_HOST,
         },
@@ -100,6 +122,21 @@ def generate_new_account_email(
     return EmailData(html_content=html_content, subject=subject)
 
 
+# The emails of the outbox, rendered when they are sent from the context stored
+# with them. It holds no password, and the reset tokens are created at sending.
+OUTBOX_EMAILS: dict[str, Callable[..., EmailData]] = {
+    "test_email": generate_test_email,
+    "new_account": generate_new_account_email,
+    "reset_password": generate_reset_password_email,
+}
+
+
+def render_outbox_email(
+    *, template_name: str, email_to: str, context: dict[str, Any]
+) -> EmailData:
+    return OUTBOX_EMAILS[template_name](email_to=email_to, **context)
+
+
 def generate_password_reset_token(email: str) -> str:
     delta = timedelta(hours=settings.EMAIL_RESET_TOKEN_EXPIRE_HOURS)
     now = datetime.now(timezone.utc)
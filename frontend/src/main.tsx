@@ -16,6 +16,20 @@ OpenAPI.TOKEN = async () => {
   return localStorage.getItem("access_token") || ""
 }
 
+// Send back the time of the last write, so that the next reads aren't served
+// by a replica that doesn't have it yet. The cookie isn't sent cross-origin.
+let lastWrite: string | undefined
+OpenAPI.interceptors.response.use((response) => {
+  lastWrite = response.headers["x-last-write"] ?? lastWrite
+  return response
+})
+OpenAPI.interceptors.request.use((config) => {
+  if (lastWrite) {
+    config.headers = { ...config.headers, "X-Last-Write": lastWrite }
+  }
+  return config
+})
+
 const handleApiError = (error: Error) => {
   if (error instanceof ApiError && [401, 403].includes(error.status)) {
     localStorage.removeItem("access_token")